@@ -1,16 +1,35 @@
 import streamlit as st
 import pandas as pd
 import os
+import atexit
 import ftplib
 import paramiko
 import socket
 import threading
 import time
-import schedule
 from io import StringIO
 import requests
 from datetime import datetime
 import json
+from catalog import (
+    get_catalog, publish_catalog, publish_catalog_file, read_catalog_csv, read_catalog_file,
+    spool_to_file, update_stock, REQUIRED_COLUMNS
+)
+from ingest import (
+    ingest_sources, ingest_stock_feed, read_stock_feed, stock_feed_source, poll_sftp,
+    DEFAULT_STOCK_FEED_MINUTES
+)
+from delta import read_changes
+import sftp_pool
+from job_scheduler import scheduler as job_scheduler, IntervalTrigger, PollingTrigger, parse_trigger, POLLING_DEFAULTS
+from leader import lease as leader_lease
+from job_store import store as job_history, run_result
+from webhook import server as webhook_server
+from results_view import stock_levels, search_panel
+from search import (
+    parse_code_list, lookup_codes, query_cache, count_stock_levels,
+    STOCK_LEVEL_LOW, STOCK_LEVEL_MEDIUM, STOCK_LEVEL_HIGH, STOCK_LEVEL_UNKNOWN
+)
 
 # Configuración de la página
 st.set_page_config(
@@ -160,6 +179,14 @@ if not os.path.exists(CSV_FILE_PATH):
 CONFIG_FILE_PATH = "data/config.json"
 
 
+@st.cache_resource
+def load_logo():
+    """Logo corporativo leído una sola vez por proceso (None si no existe)"""
+    if not os.path.exists("assets/logo.gif"):
+        return None
+    with open("assets/logo.gif", "rb") as f:
+        return f.read()
+
 def check_password():
     """Función para verificar la contraseña de acceso"""
     if "password_correct" not in st.session_state:
@@ -169,8 +196,8 @@ def check_password():
         # Logo y título de acceso
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            if os.path.exists("assets/logo.gif"):
-                st.image("assets/logo.gif", width=300)
+            if load_logo() is not None:
+                st.image(load_logo(), width=300)
             st.markdown('<div class="main-header"><h1>🔐 Acceso al Sistema</h1><div class="subtitle">Sistema de Consulta de Stock</div></div>', unsafe_allow_html=True)
         
         password = st.text_input(
@@ -200,30 +227,35 @@ def check_password():
     return True
 
 def load_data():
-    """Cargar datos desde el archivo CSV"""
+    """Cargar datos desde la instantánea compartida del catálogo"""
     try:
-        if os.path.exists(CSV_FILE_PATH):
-            df = pd.read_csv(CSV_FILE_PATH)
-            required_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock']
-            if all(col in df.columns for col in required_columns):
+        snapshot = get_catalog(CSV_FILE_PATH)
+        if snapshot is not None:
+            df = snapshot.df
+            if all(col in df.columns for col in REQUIRED_COLUMNS):
                 return df
             else:
-                st.error(f"❌ El archivo CSV debe contener las columnas: {', '.join(required_columns)}")
-                return pd.DataFrame(columns=required_columns)
+                st.error(f"❌ El archivo CSV debe contener las columnas: {', '.join(REQUIRED_COLUMNS)}")
+                return pd.DataFrame(columns=REQUIRED_COLUMNS)
         else:
-            os.makedirs("data", exist_ok=True)
-            df = pd.DataFrame(columns=['Codigo', 'Descripcion', 'Familia', 'Stock'])
-            df.to_csv(CSV_FILE_PATH, index=False)
-            return df
+            return publish_catalog(pd.DataFrame(columns=REQUIRED_COLUMNS), CSV_FILE_PATH).df
     except Exception as e:
         st.error(f"❌ Error al cargar los datos: {str(e)}")
-        return pd.DataFrame(columns=['Codigo', 'Descripcion', 'Familia', 'Stock'])
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
 
 def save_data(df):
-    """Guardar datos en el archivo CSV"""
+    """Guardar datos en el archivo CSV y publicar la nueva instantánea"""
     try:
-        os.makedirs("data", exist_ok=True)
-        df.to_csv(CSV_FILE_PATH, index=False)
+        publish_catalog(df, CSV_FILE_PATH)
+        return True
+    except Exception as e:
+        st.error(f"❌ Error al guardar los datos: {str(e)}")
+        return False
+
+def save_data_file(source_path, df, encoding, digest=None):
+    """Publicar un CSV ya validado moviendo el archivo, sin volver a serializarlo"""
+    try:
+        publish_catalog_file(source_path, df, encoding, digest, CSV_FILE_PATH)
         return True
     except Exception as e:
         st.error(f"❌ Error al guardar los datos: {str(e)}")
@@ -242,6 +274,7 @@ def load_config():
             'password': '@Q&jb@kpcU(OhpQv95bN0%eI',
             'file_path': '/stock/stock.csv'
         },
+        'update_schedule': '02:00',
         'last_update': None
     }
     
@@ -270,6 +303,9 @@ def save_config(config):
         os.makedirs("data", exist_ok=True)
         with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as f:
             json.dump(config, f, indent=2, ensure_ascii=False)
+        # Un cambio de horarios despierta al scheduler sin esperar a la próxima tarea
+        if job_scheduler.running:
+            configure_scheduler(config)
         return True
     except Exception as e:
         print(f"Error saving config: {str(e)}")
@@ -288,110 +324,148 @@ def initialize_session_config():
         if config['last_update']:
             st.session_state.last_update = config['last_update']
 
-def get_stock_color(stock):
-    """Obtener color para el indicador de stock"""
-    try:
-        stock_num = float(stock)
-        high_threshold = st.session_state.get('stock_high_threshold', 20)
-        low_threshold = st.session_state.get('stock_low_threshold', 5)
-        
-        if stock_num <= low_threshold:
-            return "🔴"
-        elif stock_num <= high_threshold:
-            return "🟡"
-        else:
-            return "🟢"
-    except:
-        return "⚪"
-
-def filter_dataframe(df, search_term):
-    """Filtrar DataFrame por término de búsqueda"""
-    if not search_term:
-        return df
-    
-    search_term = search_term.lower()
-    mask = (
-        df['Codigo'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Descripcion'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Familia'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Stock'].astype(str).str.contains(search_term, na=False)
-    )
-    return df[mask]
+def validate_catalog(df):
+    """Comprobar columnas obligatorias y que el catálogo no esté vacío"""
+    required_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock']
+    if not all(col in df.columns for col in required_columns):
+        return False, f"El archivo debe contener las columnas: {', '.join(required_columns)}"
+    
+    if len(df) == 0:
+        return False, "El archivo está vacío"
+    
+    return True, df
 
 def validate_csv_content(content):
     """Validar el contenido del archivo CSV"""
     try:
-        df = pd.read_csv(StringIO(content))
-        required_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock']
-        if not all(col in df.columns for col in required_columns):
-            return False, f"El archivo debe contener las columnas: {', '.join(required_columns)}"
-        
-        if len(df) == 0:
-            return False, "El archivo está vacío"
-        
-        return True, df
-        
+        return validate_catalog(read_catalog_csv(StringIO(content)))
     except Exception as e:
         return False, f"Error al procesar el archivo: {str(e)}"
 
+def validate_csv_file(source):
+    """Validar un CSV leído directamente de disco o de un archivo binario; devuelve (válido, df o mensaje, codificación)"""
+    try:
+        df, encoding = read_catalog_file(source)
+    except Exception as e:
+        return False, f"Error al procesar el archivo: {str(e)}", None
+    is_valid, result = validate_catalog(df)
+    return is_valid, result, encoding
+
+def sftp_error_message(error, sftp_file_path, timeout):
+    """Mensaje para el usuario de un error de descarga SFTP"""
+    if isinstance(error, paramiko.AuthenticationException):
+        return "Error de autenticación SFTP - Verifique usuario y contraseña"
+    if isinstance(error, paramiko.SSHException):
+        return f"Error de conexión SSH: {str(error)}"
+    if isinstance(error, FileNotFoundError):
+        return f"Archivo no encontrado en el servidor: {sftp_file_path}"
+    if isinstance(error, socket.timeout):
+        return f"Timeout de conexión ({timeout}s) - Servidor no responde"
+    return f"Error SFTP: {str(error)}"
+
 def download_from_sftp(sftp_host, sftp_user, sftp_password, sftp_file_path, sftp_port=22, timeout=30):
-    """Descargar archivo CSV desde servidor SFTP"""
+    """Descargar archivo CSV desde servidor SFTP (sesión reutilizable del pool)"""
     try:
-        # Configurar el cliente SSH
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        # Conectar al servidor SFTP
-        ssh.connect(
-            hostname=sftp_host,
-            port=sftp_port,
-            username=sftp_user,
-            password=sftp_password,
-            timeout=timeout
-        )
-        
-        # Abrir SFTP
-        sftp = ssh.open_sftp()
-        
-        # Leer el archivo remoto
-        with sftp.open(sftp_file_path, 'r') as remote_file:
-            content = remote_file.read().decode('utf-8')
-        
-        # Cerrar conexiones
-        sftp.close()
-        ssh.close()
-        
+        content = sftp_pool.download_file(
+            sftp_host, sftp_port, sftp_user, sftp_password, sftp_file_path, timeout=timeout
+        ).decode('utf-8')
         return True, content, "Archivo descargado exitosamente via SFTP"
-        
-    except paramiko.AuthenticationException:
-        return False, None, "Error de autenticación SFTP - Verifique usuario y contraseña"
-    except paramiko.SSHException as e:
-        return False, None, f"Error de conexión SSH: {str(e)}"
-    except FileNotFoundError:
-        return False, None, f"Archivo no encontrado en el servidor: {sftp_file_path}"
-    except socket.timeout:
-        return False, None, f"Timeout de conexión ({timeout}s) - Servidor no responde"
     except Exception as e:
-        return False, None, f"Error SFTP: {str(e)}"
+        return False, None, sftp_error_message(e, sftp_file_path, timeout)
 
-def test_sftp_connection(sftp_host, sftp_user, sftp_password, sftp_port=22, timeout=10):
-    """Probar la conectividad SFTP"""
+def update_from_sftp(sftp_host, sftp_user, sftp_password, sftp_file_path, sftp_port=22, timeout=30):
+    """Actualizar el stock desde SFTP solo si el archivo remoto cambió desde la última descarga
+
+    Devuelve (éxito, productos publicados o None si no hubo cambios, mensaje)
+    """
+    config = load_config()
+    # Sin CSV local no hay nada que conservar: se descarga siempre
+    last_fetch = config.get('last_fetch') if os.path.exists(CSV_FILE_PATH) else None
     try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        ssh.connect(
-            hostname=sftp_host,
-            port=sftp_port,
-            username=sftp_user,
-            password=sftp_password,
-            timeout=timeout
+        tmp_path, fetch = sftp_pool.download_if_changed(
+            sftp_host, sftp_port, sftp_user, sftp_password, sftp_file_path, last_fetch,
+            local_path=CSV_FILE_PATH, timeout=timeout
         )
-        
-        sftp = ssh.open_sftp()
-        sftp.close()
-        ssh.close()
-        
+    except Exception as e:
+        return False, None, sftp_error_message(e, sftp_file_path, timeout)
+    
+    if tmp_path is None:
+        # Se guarda igualmente: si solo cambió la fecha, la próxima comprobación no descarga
+        config['last_fetch'] = fetch
+        save_config(config)
+        return True, None, "El archivo remoto no ha cambiado desde la última descarga"
+    
+    # El CSV descargado se parsea desde disco y, si es válido, pasa a ser el catálogo
+    is_valid, result, encoding = validate_csv_file(tmp_path)
+    if not is_valid:
+        os.remove(tmp_path)
+        return False, None, f"Archivo CSV inválido: {result}"
+    if not save_data_file(tmp_path, result, encoding, fetch['sha256']):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False, None, "Error al guardar los datos"
+    
+    config['last_fetch'] = fetch
+    config['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    save_config(config)
+    return True, result, "Datos actualizados desde SFTP"
+
+def update_from_sources():
+    """Actualizar el stock desde todas las fuentes de config['sources'] en paralelo
+
+    Devuelve (éxito, productos publicados o None si no hubo cambios, mensaje, resultados por fuente)
+    """
+    config = load_config()
+    try:
+        results, merged = ingest_sources(config, CSV_FILE_PATH)
+    except Exception as e:
+        return False, None, f"Error en la ingesta de fuentes: {str(e)}", []
+    
+    if merged is not None:
+        config['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    save_config(config)
+    
+    failed = [result.name for result in results if result.status in ('stale', 'failed')]
+    if merged is None and not any(result.df is not None for result in results):
+        return False, None, "Ninguna fuente tiene datos válidos", results
+    message = "Datos actualizados desde las fuentes" if merged is not None else "Ninguna fuente ha cambiado"
+    if failed:
+        message += f" (con problemas: {', '.join(failed)})"
+    return True, merged, message, results
+
+def stock_feed_message(delta, unknown):
+    """Resumen de un feed de stock aplicado"""
+    if delta is None or delta.is_empty:
+        message = "El feed de stock no cambia ningún producto"
+    else:
+        message = f"Stock actualizado en {len(delta.stock_rows)} productos"
+    if unknown:
+        message += f" ({unknown} códigos no están en el catálogo)"
+    return message
+
+def update_from_stock_feed():
+    """Aplicar el feed parcial Codigo,Stock de config['stock_feed'] sobre el catálogo
+
+    Devuelve (éxito, delta aplicado o None si el archivo no cambió, mensaje)
+    """
+    config = load_config()
+    try:
+        delta, unknown = ingest_stock_feed(config, CSV_FILE_PATH)
+    except Exception as e:
+        return False, None, f"Error en el feed de stock: {str(e)}"
+    
+    if delta is not None and not delta.is_empty:
+        config['last_stock_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    save_config(config)
+    
+    if delta is None:
+        return True, None, "El feed de stock no ha cambiado"
+    return True, delta, stock_feed_message(delta, unknown)
+
+def test_sftp_connection(sftp_host, sftp_user, sftp_password, sftp_port=22, timeout=10):
+    """Probar la conectividad SFTP; la sesión queda abierta para la siguiente descarga"""
+    try:
+        sftp_pool.check_connection(sftp_host, sftp_port, sftp_user, sftp_password, timeout=timeout)
         return True, "Conexión SFTP exitosa"
         
     except Exception as e:
@@ -411,19 +485,35 @@ def log_message(message):
         print(f"Error writing log: {e}")
 
 def auto_update_from_sftp():
-    """Función para actualización automática desde SFTP"""
+    """Función para actualización automática desde SFTP; devuelve el resultado para el historial"""
     try:
         log_message("🔄 Iniciando actualización automática SFTP...")
         
         config = load_config()
         if not config['sftp_config'].get('enabled', False):
             log_message("⚠️ Actualizaciones automáticas deshabilitadas")
-            return
+            return run_result('ok', "Actualizaciones automáticas deshabilitadas")
+        
+        if config.get('sources'):
+            log_message(f"📡 Descargando {len(config['sources'])} fuentes en paralelo...")
+            success, result, message, results = update_from_sources()
+            for source_result in results:
+                log_message(f"   · {source_result.name}: {source_result.status} ({source_result.seconds:.1f}s) {source_result.message}")
+            size = sum((source_result.fetch or {}).get('size') or 0 for source_result in results if source_result.status == 'updated')
+            if not success:
+                log_message(f"❌ {message}")
+                return run_result('failed', message, size)
+            elif result is None:
+                log_message(f"⏭️ {message}")
+                return run_result('unchanged', message, size)
+            else:
+                log_message(f"🎉 {message}: {len(result)} productos")
+                return run_result('updated', message, size, len(result))
         
         sftp_config = config['sftp_config']
         log_message(f"📡 Conectando a {sftp_config['host']}...")
         
-        success, content, message = download_from_sftp(
+        success, result, message = update_from_sftp(
             sftp_config['host'],
             sftp_config['user'],
             sftp_config['password'],
@@ -431,162 +521,130 @@ def auto_update_from_sftp():
             sftp_config.get('port', 22)
         )
         
-        if success:
-            log_message("✅ Archivo descargado exitosamente")
-            is_valid, result = validate_csv_content(content)
-            if is_valid:
-                save_data(result)
-                # Actualizar y guardar la fecha de última actualización
-                config['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                save_config(config)
-                log_message(f"🎉 Actualización automática exitosa: {config['last_update']}")
-                log_message(f"📊 Productos actualizados: {len(result)}")
-            else:
-                log_message(f"❌ Error en validación CSV: {result}")
+        if not success:
+            log_message(f"❌ Error en actualización SFTP: {message}")
+            return run_result('failed', message)
+        elif result is None:
+            log_message(f"⏭️ {message}")
+            return run_result('unchanged', message, 0)
         else:
-            log_message(f"❌ Error en descarga SFTP: {message}")
+            config = load_config()
+            log_message(f"🎉 Actualización automática exitosa: {config['last_update']}")
+            log_message(f"📊 Productos actualizados: {len(result)}")
+            return run_result('updated', message, (config.get('last_fetch') or {}).get('size'), len(result))
             
     except Exception as e:
         log_message(f"💥 Error crítico en actualización automática: {str(e)}")
+        return run_result('failed', str(e))
 
-def schedule_worker():
-    """Worker que ejecuta las tareas programadas"""
-    log_message("🚀 Scheduler worker iniciado - próxima ejecución: 02:00 AM")
-    
-    # Crear archivo de estado para tracking
-    status_file = "data/scheduler_status.json"
-    
-    while True:
-        try:
-            current_time = datetime.now()
-            
-            # Actualizar archivo de estado cada minuto
-            status_data = {
-                "last_check": current_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "worker_active": True,
-                "next_run": schedule.next_run().strftime("%Y-%m-%d %H:%M:%S") if schedule.next_run() is not None else None
-            }
-            
-            try:
-                with open(status_file, "w", encoding="utf-8") as f:
-                    json.dump(status_data, f, indent=2)
-            except:
-                pass  # No fallar si no se puede escribir el estado
-            
-            # Ejecutar tareas pendientes
-            schedule.run_pending()
-            
-            # Log del estado cada 6 horas para verificar que está funcionando
-            if current_time.hour in [0, 6, 12, 18] and current_time.minute == 0:
-                log_message(f"⏰ Scheduler activo a las {current_time.strftime('%H:%M')} - próxima ejecución: {schedule.next_run()}")
-            
-            # Si estamos cerca de las 2:00 AM, hacer log más frecuente
-            if current_time.hour == 1 and current_time.minute >= 55:
-                log_message(f"🕐 Preparándose para actualización automática en {60 - current_time.minute} minutos")
-            
-            time.sleep(60)  # Revisar cada minuto
-            
-        except Exception as e:
-            log_message(f"💥 Error en scheduler worker: {str(e)}")
-            time.sleep(300)  # Esperar 5 minutos antes de reintentar
+def auto_update_stock_feed():
+    """Función para la consulta periódica del feed de stock; devuelve el resultado para el historial"""
+    try:
+        success, delta, message = update_from_stock_feed()
+        if not success:
+            log_message(f"❌ {message}")
+            return run_result('failed', message)
+        elif delta is None or delta.is_empty:
+            # Archivo sin cambios, o descargado pero sin ningún stock distinto
+            return run_result('unchanged', message, 0)
+        log_message(f"📦 {message}")
+        size = (load_config().get('stock_feed_fetch') or {}).get('size')
+        return run_result('updated', message, size, len(delta.stock_rows))
+    except Exception as e:
+        log_message(f"💥 Error crítico en el feed de stock: {str(e)}")
+        return run_result('failed', str(e))
 
-def check_missed_updates():
-    """Verificar si se perdieron actualizaciones y ejecutarlas si es necesario"""
+def poll_sftp_changes():
+    """Sondeo del archivo remoto: un stat y, solo si cambió, la actualización completa"""
+    config = load_config()
+    if not config['sftp_config'].get('enabled', False):
+        return run_result('unchanged', "Actualizaciones automáticas deshabilitadas")
     try:
-        config = load_config()
-        last_update_str = config.get('last_update', '')
-        now = datetime.now()
-        
-        if last_update_str:
-            last_update = datetime.strptime(last_update_str, "%Y-%m-%d %H:%M:%S")
-            
-            # Si la última actualización fue hace más de 20 horas, probablemente se perdió una
-            hours_since_last = (now - last_update).total_seconds() / 3600
-            
-            if hours_since_last > 20:  # Más de 20 horas
-                log_message(f"🔍 Última actualización hace {hours_since_last:.1f} horas. Ejecutando actualización de recuperación...")
-                auto_update_from_sftp()
-                return True
-        else:
-            # Si no hay registro de última actualización, ejecutar una
-            log_message("🔍 No hay registro de actualizaciones previas. Ejecutando primera actualización...")
-            auto_update_from_sftp()
-            return True
-                        
-        return False
+        changed, stat = poll_sftp(config)
     except Exception as e:
-        log_message(f"💥 Error verificando actualizaciones perdidas: {str(e)}")
-        return False
+        log_message(f"❌ Error en el sondeo SFTP: {str(e)}")
+        return run_result('failed', f"Error en el sondeo SFTP: {str(e)}")
+    if not changed:
+        return run_result('unchanged', "El archivo remoto no ha cambiado", 0)
+    
+    log_message("🔔 Cambio detectado en el archivo remoto")
+    result = auto_update_from_sftp()
+    if result['outcome'] != 'failed':
+        config = load_config()
+        config['poll_stat'] = stat
+        save_config(config)
+    return result
+
+def configure_scheduler(config):
+    """Programar las tareas según la configuración; si no cambian, se conservan sus próximas ejecuciones"""
+    # Solo el nodo líder descarga; los demás leen el catálogo que publica
+    # Si el proceso estaba parado a su hora, se recupera una sola ejecución al arrancar
+    job_scheduler.add_job("sftp_update", auto_update_from_sftp, parse_trigger(config.get('update_schedule') or "02:00"),
+                          leader_only=True, catch_up=True)
+    
+    # El feed parcial de stock se consulta con su propio intervalo
+    stock_feed = stock_feed_source(config)
+    if stock_feed:
+        interval = stock_feed.get('interval_minutes', DEFAULT_STOCK_FEED_MINUTES)
+        job_scheduler.add_job("stock_feed", auto_update_stock_feed, IntervalTrigger(interval * 60), leader_only=True)
+    else:
+        job_scheduler.remove_job("stock_feed")
+    
+    # Sondeo del archivo remoto; los sondeos sin cambios no dejan rastro en el historial
+    polling = {**POLLING_DEFAULTS, **(config.get('polling') or {})}
+    if polling['enabled']:
+        job_scheduler.add_job("sftp_poll", poll_sftp_changes, PollingTrigger.from_config(polling),
+                              leader_only=True, quiet=True)
+    else:
+        job_scheduler.remove_job("sftp_poll")
 
 def initialize_auto_scheduler():
     """Inicializar el programador automático al cargar la aplicación"""
-    # Usar un enfoque más robusto sin depender de session_state
+    # El programador es único por proceso y sobrevive a las recargas del script
     try:
-        # Primero verificar si hay actualizaciones perdidas
-        check_missed_updates()
-        
-        # Limpiar trabajos anteriores
-        schedule.clear()
-        
-        # Configurar actualización a las 2:00 AM
-        schedule.every().day.at("02:00").do(auto_update_from_sftp)
+        leader_lease.log = log_message
+        # Las recuperaciones saltadas como seguidor se hacen al pasar a ser líder
+        leader_lease.on_elected(job_scheduler.leadership_gained)
+        if leader_lease.start():
+            # Liberar el lease al salir para que el siguiente proceso no espere a que caduque
+            atexit.register(leader_lease.stop)
         
-        # Log para confirmar configuración
-        log_message("⚙️ Scheduler configurado para actualizaciones a las 02:00 AM")
+        # Las ejecuciones perdidas se detectan con el historial y se recuperan en el hilo del scheduler
+        job_scheduler.log = log_message
+        job_scheduler.lease = leader_lease
+        job_scheduler.store = job_history
+        configure_scheduler(load_config())
         
-        # Verificar si ya hay un worker ejecutándose
-        active_threads = [t for t in threading.enumerate() if t.name.startswith('scheduler_worker')]
-        
-        if not active_threads:
-            # Iniciar worker en hilo separado con nombre específico
-            worker_thread = threading.Thread(
-                target=schedule_worker, 
-                daemon=True,
-                name='scheduler_worker_main'
-            )
-            worker_thread.start()
-            log_message("✅ Worker de scheduler iniciado correctamente")
-        else:
-            log_message("ℹ️ Worker de scheduler ya está ejecutándose")
+        if job_scheduler.start('scheduler_worker_main'):
+            next_run = job_scheduler.next_run()
+            log_message(f"✅ Scheduler iniciado - próxima ejecución: {next_run.strftime('%Y-%m-%d %H:%M:%S') if next_run else 'ninguna'}")
+            # Avisos de "archivo listo" del ERP (solo si hay WEBHOOK_SECRET)
+            webhook_server.start(auto_update_from_sftp, log=log_message)
             
     except Exception as e:
         log_message(f"💥 Error inicializando scheduler: {str(e)}")
 
 def get_scheduler_status():
-    """Obtener estado del scheduler y próxima ejecución"""
+    """Obtener estado del scheduler y próxima ejecución (en memoria, sin leer archivos)"""
     try:
+        status = job_scheduler.status()
         status_info = []
         
-        # Información básica del scheduler
-        next_run = schedule.next_run()
-        if next_run:
-            status_info.append(f"Próxima ejecución: {next_run.strftime('%Y-%m-%d %H:%M:%S')}")
+        if status['next_run']:
+            status_info.append(f"Próxima ejecución: {status['next_run']}")
         else:
             status_info.append("Sin tareas programadas")
         
-        # Verificar archivo de estado del worker
-        status_file = "data/scheduler_status.json"
-        if os.path.exists(status_file):
-            try:
-                with open(status_file, "r", encoding="utf-8") as f:
-                    worker_status = json.load(f)
-                
-                last_check = datetime.strptime(worker_status["last_check"], "%Y-%m-%d %H:%M:%S")
-                minutes_ago = (datetime.now() - last_check).total_seconds() / 60
-                
-                if minutes_ago < 5:
-                    status_info.append(f"Worker activo (último check hace {int(minutes_ago)} min)")
-                else:
-                    status_info.append(f"⚠️ Worker inactivo (último check hace {int(minutes_ago)} min)")
-                    
-            except:
-                status_info.append("Estado del worker desconocido")
+        if status['worker_active']:
+            status_info.append(f"Worker activo desde {status['started_at']}")
         else:
-            status_info.append("Archivo de estado no encontrado")
+            status_info.append("⚠️ Worker inactivo")
+        status_info.append(leader_lease.describe())
         
-        # Verificar threads activos
-        active_threads = [t for t in threading.enumerate() if 'scheduler_worker' in t.name]
-        status_info.append(f"Threads del scheduler: {len(active_threads)}")
+        running = [job['name'] for job in status['jobs'] if job['running']]
+        if running:
+            status_info.append(f"Ejecutando: {', '.join(running)}")
+        status_info.append(f"Tareas: {len(status['jobs'])}")
         
         return " | ".join(status_info)
         
@@ -605,6 +663,406 @@ def get_recent_logs():
     except Exception as e:
         return f"Error leyendo logs: {str(e)}"
 
+@st.fragment
+def admin_panels():
+    """Paneles de administración; sus controles solo vuelven a ejecutar este fragmento"""
+    with st.expander("🎯 Configurar Rangos de Stock"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            low_threshold = st.number_input(
+                "Stock Bajo (≤):",
+                min_value=0,
+                max_value=100,
+                value=st.session_state.stock_low_threshold,
+                help="Stock igual o menor se marca en rojo"
+            )
+        
+        with col2:
+            high_threshold = st.number_input(
+                "Stock Alto (>):",
+                min_value=low_threshold + 1,
+                max_value=200,
+                value=st.session_state.stock_high_threshold,
+                help="Stock mayor se marca en verde"
+            )
+        
+        if st.button("💾 Guardar Configuración", key="save_stock_config"):
+            st.session_state.stock_low_threshold = low_threshold
+            st.session_state.stock_high_threshold = high_threshold
+            
+            # Guardar en archivo persistente
+            config = load_config()
+            config['stock_low_threshold'] = low_threshold
+            config['stock_high_threshold'] = high_threshold
+            save_config(config)
+            
+            st.success(f"✅ Configuración guardada permanentemente")
+            st.rerun()
+        
+        st.info(f"📊 Actual: 🔴≤{st.session_state.stock_low_threshold} | 🟡{st.session_state.stock_low_threshold+1}-{st.session_state.stock_high_threshold} | 🟢>{st.session_state.stock_high_threshold}")
+    
+    with st.expander("🌐 Configuración SFTP"):
+        st.markdown("**Configurar servidor SFTP para actualizaciones automáticas**")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            sftp_host = st.text_input("🖥️ Servidor SFTP:", value=st.session_state.sftp_config['host'])
+            sftp_user = st.text_input("👤 Usuario:", value=st.session_state.sftp_config['user'])
+            sftp_port = st.number_input("🔌 Puerto:", min_value=1, max_value=65535, value=st.session_state.sftp_config['port'])
+        
+        with col2:
+            sftp_password = st.text_input("🔑 Contraseña:", value=st.session_state.sftp_config['password'], type="password")
+            sftp_file_path = st.text_input("📁 Ruta del archivo:", value=st.session_state.sftp_config['file_path'])
+            sftp_enabled = st.checkbox("✅ Habilitar actualizaciones automáticas", value=st.session_state.sftp_config['enabled'])
+        
+        col_test, col_save = st.columns(2)
+        
+        with col_test:
+            if st.button("🔍 Probar Conexión", key="test_sftp"):
+                with st.spinner("Probando conexión SFTP..."):
+                    success, message = test_sftp_connection(sftp_host, sftp_user, sftp_password, sftp_port)
+                    if success:
+                        st.success(f"✅ {message}")
+                    else:
+                        st.error(f"❌ {message}")
+        
+        with col_save:
+            if st.button("💾 Guardar Config. SFTP", key="save_sftp_config"):
+                new_sftp_config = {
+                    'enabled': sftp_enabled,
+                    'host': sftp_host,
+                    'port': sftp_port,
+                    'user': sftp_user,
+                    'password': sftp_password,
+                    'file_path': sftp_file_path
+                }
+                st.session_state.sftp_config = new_sftp_config
+                
+                # Guardar en archivo persistente
+                config = load_config()
+                config['sftp_config'] = new_sftp_config
+                save_config(config)
+                
+                st.success("✅ Configuración SFTP guardada permanentemente")
+                st.rerun()
+        
+        if st.button("🔄 Actualizar Ahora desde SFTP", key="manual_sftp_update"):
+            with st.spinner("Descargando archivo desde SFTP..."):
+                success, result, message = update_from_sftp(sftp_host, sftp_user, sftp_password, sftp_file_path, sftp_port)
+                
+                if not success:
+                    st.error(f"❌ {message}")
+                elif result is None:
+                    st.info(f"⏭️ {message}")
+                else:
+                    st.session_state.last_update = load_config()['last_update']
+                    st.success(f"🎉 ¡Datos actualizados desde SFTP exitosamente!")
+                    st.rerun()
+        
+        # Tiempos de la última operación SFTP (botones o scheduler)
+        if sftp_pool.pool.last_timings:
+            st.caption(f"⏱️ Última operación SFTP: {sftp_pool.format_timings(sftp_pool.pool.last_timings)}")
+        
+        # Estado de las actualizaciones automáticas
+        if st.session_state.sftp_config['enabled']:
+            update_schedule = load_config().get('update_schedule') or "02:00"
+            schedule_label = "2:00 AM diario" if update_schedule == "02:00" else update_schedule
+            st.success(f"🤖 Actualizaciones automáticas: HABILITADAS ({schedule_label})")
+            if 'last_update' in st.session_state:
+                st.info(f"📅 Última actualización: {st.session_state.last_update}")
+            
+            # Información del scheduler
+            scheduler_status = get_scheduler_status()
+            st.info(f"⏰ {scheduler_status}")
+            
+            # Botones de control
+            col_logs, col_test, col_restart = st.columns(3)
+            
+            with col_logs:
+                if st.button("📋 Ver Logs", key="view_logs"):
+                    with st.expander("📝 Logs Recientes del Sistema", expanded=True):
+                        logs = get_recent_logs()
+                        st.text_area("Logs:", value=logs, height=200, disabled=True)
+            
+            with col_test:
+                if st.button("🧪 Probar Ahora", key="test_auto_update"):
+                    with st.spinner("Ejecutando prueba..."):
+                        auto_update_from_sftp()
+                        st.success("Prueba completada")
+                        st.rerun()
+            
+            with col_restart:
+                if st.button("🔄 Reiniciar Scheduler", key="restart_scheduler"):
+                    with st.spinner("Reiniciando scheduler..."):
+                        initialize_auto_scheduler()
+                        st.success("Scheduler reiniciado")
+                        st.rerun()
+            
+            # Advertencia si el worker parece inactivo
+            if "Worker inactivo" in scheduler_status:
+                st.warning("⚠️ El scheduler parece estar inactivo. Considera reiniciarlo.")
+        else:
+            st.warning("⚠️ Actualizaciones automáticas: DESHABILITADAS")
+    
+    with st.expander("📡 Sondeo de Cambios"):
+        st.caption("Comprueba el archivo remoto con un stat y solo descarga cuando cambia")
+        polling = {**POLLING_DEFAULTS, **(load_config().get('polling') or {})}
+        polling_enabled = st.checkbox("✅ Sondear el archivo remoto", value=polling['enabled'], key="polling_enabled")
+        col1, col2 = st.columns(2)
+        with col1:
+            interval_minutes = st.number_input("Cada (min):", min_value=1, max_value=60,
+                                               value=int(polling['interval_minutes']), key="polling_interval")
+        with col2:
+            night_max_minutes = st.number_input("De noche, hasta (min):", min_value=0, max_value=240,
+                                                value=int(polling['night_max_minutes'] or 0), key="polling_night_max",
+                                                help=f"Entre {polling['night_start']} y {polling['night_end']} el intervalo crece mientras no haya cambios (0 = no crece)")
+        if st.button("💾 Guardar Sondeo", key="save_polling"):
+            config = load_config()
+            config['polling'] = {**polling, 'enabled': polling_enabled,
+                                 'interval_minutes': interval_minutes, 'night_max_minutes': night_max_minutes}
+            # Al guardar, el scheduler se reprograma sin esperar a su próxima tarea
+            if save_config(config):
+                st.success("✅ Sondeo guardado")
+        poll_job = next((job for job in job_scheduler.jobs() if job.name == "sftp_poll"), None)
+        if poll_job:
+            st.caption(f"⏰ {poll_job.trigger} · próximo sondeo: {poll_job.next_run.strftime('%H:%M:%S')}")
+    
+    sources = load_config().get('sources') or []
+    if sources:
+        with st.expander("🏭 Fuentes de Stock"):
+            st.caption("Proveedores y almacenes declarados en `sources` de data/config.json; se descargan en paralelo")
+            st.dataframe(
+                pd.DataFrame([{
+                    'Fuente': source['name'],
+                    'Tipo': source.get('type', 'sftp').upper(),
+                    'Proveedor': source.get('proveedor', source['name']),
+                    'Almacén': source.get('almacen', source['name']),
+                    'Activa': source.get('enabled', True),
+                } for source in sources]),
+                use_container_width=True,
+                hide_index=True
+            )
+            if st.button("🔄 Actualizar Todas las Fuentes", key="update_sources"):
+                with st.spinner("Descargando fuentes..."):
+                    success, result, message, results = update_from_sources()
+                st.session_state.source_results = [source_result.summary() for source_result in results]
+                if not success:
+                    st.error(f"❌ {message}")
+                elif result is None:
+                    st.info(f"⏭️ {message}")
+                else:
+                    st.session_state.last_update = load_config()['last_update']
+                    st.success(f"🎉 {message}")
+                    st.rerun()
+            if st.session_state.get('source_results'):
+                st.dataframe(pd.DataFrame(st.session_state.source_results), use_container_width=True, hide_index=True)
+    
+    stock_feed = stock_feed_source(load_config())
+    if stock_feed:
+        with st.expander("📦 Feed de Stock"):
+            interval = stock_feed.get('interval_minutes', DEFAULT_STOCK_FEED_MINUTES)
+            st.caption(f"Archivo Codigo,Stock consultado cada {interval} minutos; solo actualiza el stock del catálogo")
+            last_stock_update = load_config().get('last_stock_update')
+            if last_stock_update:
+                st.info(f"📅 Último cambio de stock: {last_stock_update}")
+            if st.button("📦 Aplicar Feed Ahora", key="update_stock_feed"):
+                with st.spinner("Consultando feed de stock..."):
+                    success, delta, message = update_from_stock_feed()
+                if not success:
+                    st.error(f"❌ {message}")
+                elif delta is None:
+                    st.info(f"⏭️ {message}")
+                else:
+                    st.success(f"🎉 {message}")
+                    st.rerun()
+    
+    with st.expander("📂 Actualizar Datos Manualmente"):
+        uploaded_file = st.file_uploader(
+            "Cargar archivo CSV:",
+            type=['csv'],
+            help="El archivo debe contener las columnas: Codigo, Descripcion, Familia, Stock (o solo Codigo, Stock para actualizar el stock)"
+        )
+        
+        if uploaded_file is not None:
+            # Se parsea desde el buffer binario, sin decodificarlo a texto
+            is_valid, result, encoding = validate_csv_file(uploaded_file)
+            
+            if is_valid:
+                st.success("✅ Archivo válido")
+                if st.button("💾 Actualizar Base de Datos", type="primary"):
+                    uploaded_file.seek(0)
+                    tmp_path, digest = spool_to_file(uploaded_file, CSV_FILE_PATH)
+                    if save_data_file(tmp_path, result, encoding, digest):
+                        st.success("🎉 ¡Datos actualizados exitosamente!")
+                        st.rerun()
+                    elif os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            else:
+                # Un archivo parcial Codigo,Stock solo actualiza el stock del catálogo
+                try:
+                    feed = read_stock_feed(uploaded_file)
+                except Exception:
+                    feed = None
+                if feed is not None and get_catalog() is not None:
+                    st.success(f"✅ Archivo parcial de stock: {len(feed)} códigos")
+                    if st.button("📦 Actualizar Stock", type="primary"):
+                        try:
+                            _, delta, unknown = update_stock(feed, CSV_FILE_PATH)
+                        except Exception as e:
+                            st.error(f"❌ Error al aplicar el stock: {str(e)}")
+                        else:
+                            st.success(f"🎉 {stock_feed_message(delta, unknown)}")
+                            st.rerun()
+                else:
+                    st.error(f"❌ {result}")
+
+    with st.expander("📜 Historial de Ejecuciones"):
+        try:
+            runs = job_history.recent_runs(limit=20)
+        except Exception as e:
+            runs = []
+            st.error(f"Error leyendo el historial: {str(e)}")
+        if runs:
+            st.dataframe(
+                pd.DataFrame([{
+                    'Tarea': run['job'],
+                    'Programada': run['scheduled_at'],
+                    'Inicio': run['started_at'],
+                    'Resultado': run['outcome'] + (" (recuperación)" if run['recovery'] else ""),
+                    'Bytes': run['bytes'],
+                    'Filas': run['rows'],
+                    'Segundos': round(run['duration'], 2) if run['duration'] is not None else None,
+                    'Mensaje': run['message'],
+                } for run in runs]),
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            st.info("Sin ejecuciones registradas")
+    
+    with st.expander("🧾 Cambios del Catálogo"):
+        changes = read_changes(CSV_FILE_PATH, limit=10)
+        if changes:
+            st.dataframe(
+                pd.DataFrame([{
+                    'Fecha': change['at'],
+                    'Altas': len(change['added']),
+                    'Bajas': len(change['removed']),
+                    'Stock': len(change['stock']),
+                    'Texto': len(change['text']),
+                } for change in changes]),
+                use_container_width=True,
+                hide_index=True
+            )
+            st.caption("Detalle completo en data/changes.jsonl")
+        else:
+            st.caption("Sin cambios registrados todavía")
+    
+    with st.expander("⚡ Caché de Búsquedas"):
+        cache_stats = query_cache.stats()
+        total_queries = cache_stats['hits'] + cache_stats['misses']
+        col_hits, col_misses = st.columns(2)
+        with col_hits:
+            st.metric("✅ Aciertos", cache_stats['hits'])
+        with col_misses:
+            st.metric("🔄 Fallos", cache_stats['misses'])
+        if total_queries:
+            st.caption(f"Tasa de acierto: {cache_stats['hits'] / total_queries:.0%} · {cache_stats['entries']} consultas en caché")
+
+@st.fragment
+def inventory_summary():
+    """Resumen de inventario del sidebar"""
+    st.markdown("### 📊 Resumen de Inventario")
+    df = load_data()
+    
+    # Métricas con estilo corporativo
+    st.markdown(f"""
+    <div class="metric-container">
+        <h4 style="color: var(--lucero-blue); margin: 0;">📦 Total de Productos</h4>
+        <h2 style="color: var(--lucero-blue); margin: 0.5rem 0;">{len(df)}</h2>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    if not df.empty:
+        low_threshold = st.session_state.get('stock_low_threshold', 5)
+        high_threshold = st.session_state.get('stock_high_threshold', 20)
+        
+        # Calcular stocks por categorías
+        # Un solo recuento sobre los niveles cacheados; sin dato cuenta como bajo
+        counts = count_stock_levels(stock_levels(df))
+        stock_bajo = counts[STOCK_LEVEL_LOW] + counts[STOCK_LEVEL_UNKNOWN]
+        stock_medio = counts[STOCK_LEVEL_MEDIUM]
+        stock_alto = counts[STOCK_LEVEL_HIGH]
+        
+        st.markdown(f"""
+        <div style="margin-top: 1rem;">
+            <div style="background-color: rgba(227, 30, 36, 0.1); padding: 0.8rem; border-radius: 5px; border-left: 4px solid var(--lucero-red); margin-bottom: 0.5rem;">
+                <strong style="color: var(--lucero-red);">🔴 Stock Bajo (≤{low_threshold}): {stock_bajo}</strong>
+            </div>
+            <div style="background-color: rgba(255, 193, 7, 0.1); padding: 0.8rem; border-radius: 5px; border-left: 4px solid #ffc107; margin-bottom: 0.5rem;">
+                <strong style="color: #d39e00;">🟡 Stock Medio ({low_threshold+1}-{high_threshold}): {stock_medio}</strong>
+            </div>
+            <div style="background-color: rgba(124, 181, 24, 0.1); padding: 0.8rem; border-radius: 5px; border-left: 4px solid var(--lucero-green);">
+                <strong style="color: var(--lucero-green);">🟢 Stock Alto (>{high_threshold}): {stock_alto}</strong>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+
+@st.fragment
+def bulk_code_lookup():
+    """Consulta masiva por códigos; pegar o cargar códigos solo ejecuta este fragmento"""
+    df = load_data()
+    
+    # Consulta masiva: lista de códigos pegada, escaneada o cargada desde archivo
+    with st.expander("📋 Consulta Masiva por Códigos"):
+        codes_text = st.text_area(
+            "Pegue o escanee los códigos (uno por línea):",
+            height=150,
+            key="bulk_codes_text"
+        )
+        codes_file = st.file_uploader(
+            "O cargue un archivo con los códigos:",
+            type=['csv', 'txt'],
+            key="bulk_codes_file",
+            help="Un código por línea; en archivos CSV se usa la primera columna"
+        )
+        
+        codes = parse_code_list(codes_text)
+        if codes_file is not None:
+            codes += parse_code_list(codes_file.read().decode('utf-8', errors='replace'))
+        
+        if codes:
+            bulk_df = lookup_codes(df, codes)
+            found = int(bulk_df['Codigo'].notna().sum())
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("✅ Códigos Encontrados", found)
+            with col2:
+                st.metric("❌ No Encontrados", len(codes) - found)
+            
+            st.dataframe(
+                bulk_df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Solicitado": st.column_config.TextColumn("Código Solicitado", width="medium"),
+                    "Codigo": st.column_config.TextColumn("Código", width="medium"),
+                    "Descripcion": st.column_config.TextColumn("Descripción", width="large"),
+                    "Familia": st.column_config.TextColumn("Familia", width="medium"),
+                    "Stock": st.column_config.NumberColumn("Stock", width="small", format="%d"),
+                    "Proveedor": st.column_config.TextColumn("Proveedor", width="medium"),
+                    "Almacen": st.column_config.TextColumn("Almacén", width="medium")
+                }
+            )
+
+@st.fragment
+def search_results():
+    """Buscador y resultados; cada pulsación solo ejecuta este fragmento"""
+    search_panel(load_data())
+
+
 def main():
     """Función principal de la aplicación"""
     if not check_password():
@@ -616,8 +1074,8 @@ def main():
     # Header principal con logo corporativo
     col1, col2 = st.columns([1, 4])
     with col1:
-        if os.path.exists("assets/logo.gif"):
-            st.image("assets/logo.gif", width=180)
+        if load_logo() is not None:
+            st.image(load_logo(), width=180)
     with col2:
         st.markdown("""
         <div class="main-header">
@@ -629,8 +1087,8 @@ def main():
     # Sidebar
     with st.sidebar:
         # Logo en sidebar
-        if os.path.exists("assets/logo.gif"):
-            st.image("assets/logo.gif", width=200)
+        if load_logo() is not None:
+            st.image(load_logo(), width=200)
         
         user_type = st.session_state.get("user_type", "admin")
         if user_type == "admin":
@@ -648,170 +1106,7 @@ def main():
         
         # Configuración para administradores
         if user_type == "admin":
-            
-            with st.expander("🎯 Configurar Rangos de Stock"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    low_threshold = st.number_input(
-                        "Stock Bajo (≤):",
-                        min_value=0,
-                        max_value=100,
-                        value=st.session_state.stock_low_threshold,
-                        help="Stock igual o menor se marca en rojo"
-                    )
-                
-                with col2:
-                    high_threshold = st.number_input(
-                        "Stock Alto (>):",
-                        min_value=low_threshold + 1,
-                        max_value=200,
-                        value=st.session_state.stock_high_threshold,
-                        help="Stock mayor se marca en verde"
-                    )
-                
-                if st.button("💾 Guardar Configuración", key="save_stock_config"):
-                    st.session_state.stock_low_threshold = low_threshold
-                    st.session_state.stock_high_threshold = high_threshold
-                    
-                    # Guardar en archivo persistente
-                    config = load_config()
-                    config['stock_low_threshold'] = low_threshold
-                    config['stock_high_threshold'] = high_threshold
-                    save_config(config)
-                    
-                    st.success(f"✅ Configuración guardada permanentemente")
-                    st.rerun()
-                
-                st.info(f"📊 Actual: 🔴≤{st.session_state.stock_low_threshold} | 🟡{st.session_state.stock_low_threshold+1}-{st.session_state.stock_high_threshold} | 🟢>{st.session_state.stock_high_threshold}")
-            
-            with st.expander("🌐 Configuración SFTP"):
-                st.markdown("**Configurar servidor SFTP para actualizaciones automáticas**")
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    sftp_host = st.text_input("🖥️ Servidor SFTP:", value=st.session_state.sftp_config['host'])
-                    sftp_user = st.text_input("👤 Usuario:", value=st.session_state.sftp_config['user'])
-                    sftp_port = st.number_input("🔌 Puerto:", min_value=1, max_value=65535, value=st.session_state.sftp_config['port'])
-                
-                with col2:
-                    sftp_password = st.text_input("🔑 Contraseña:", value=st.session_state.sftp_config['password'], type="password")
-                    sftp_file_path = st.text_input("📁 Ruta del archivo:", value=st.session_state.sftp_config['file_path'])
-                    sftp_enabled = st.checkbox("✅ Habilitar actualizaciones automáticas", value=st.session_state.sftp_config['enabled'])
-                
-                col_test, col_save = st.columns(2)
-                
-                with col_test:
-                    if st.button("🔍 Probar Conexión", key="test_sftp"):
-                        with st.spinner("Probando conexión SFTP..."):
-                            success, message = test_sftp_connection(sftp_host, sftp_user, sftp_password, sftp_port)
-                            if success:
-                                st.success(f"✅ {message}")
-                            else:
-                                st.error(f"❌ {message}")
-                
-                with col_save:
-                    if st.button("💾 Guardar Config. SFTP", key="save_sftp_config"):
-                        new_sftp_config = {
-                            'enabled': sftp_enabled,
-                            'host': sftp_host,
-                            'port': sftp_port,
-                            'user': sftp_user,
-                            'password': sftp_password,
-                            'file_path': sftp_file_path
-                        }
-                        st.session_state.sftp_config = new_sftp_config
-                        
-                        # Guardar en archivo persistente
-                        config = load_config()
-                        config['sftp_config'] = new_sftp_config
-                        save_config(config)
-                        
-                        st.success("✅ Configuración SFTP guardada permanentemente")
-                        st.rerun()
-                
-                if st.button("🔄 Actualizar Ahora desde SFTP", key="manual_sftp_update"):
-                    with st.spinner("Descargando archivo desde SFTP..."):
-                        success, content, message = download_from_sftp(sftp_host, sftp_user, sftp_password, sftp_file_path, sftp_port)
-                        
-                        if success:
-                            is_valid, result = validate_csv_content(content)
-                            if is_valid:
-                                if save_data(result):
-                                    # Guardar fecha de actualización persistente
-                                    config = load_config()
-                                    config['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                    save_config(config)
-                                    st.session_state.last_update = config['last_update']
-                                    
-                                    st.success(f"🎉 ¡Datos actualizados desde SFTP exitosamente!")
-                                    st.rerun()
-                                else:
-                                    st.error("❌ Error al guardar los datos")
-                            else:
-                                st.error(f"❌ Archivo CSV inválido: {result}")
-                        else:
-                            st.error(f"❌ {message}")
-                
-                # Estado de las actualizaciones automáticas
-                if st.session_state.sftp_config['enabled']:
-                    st.success("🤖 Actualizaciones automáticas: HABILITADAS (2:00 AM diario)")
-                    if 'last_update' in st.session_state:
-                        st.info(f"📅 Última actualización: {st.session_state.last_update}")
-                    
-                    # Información del scheduler
-                    scheduler_status = get_scheduler_status()
-                    st.info(f"⏰ {scheduler_status}")
-                    
-                    # Botones de control
-                    col_logs, col_test, col_restart = st.columns(3)
-                    
-                    with col_logs:
-                        if st.button("📋 Ver Logs", key="view_logs"):
-                            with st.expander("📝 Logs Recientes del Sistema", expanded=True):
-                                logs = get_recent_logs()
-                                st.text_area("Logs:", value=logs, height=200, disabled=True)
-                    
-                    with col_test:
-                        if st.button("🧪 Probar Ahora", key="test_auto_update"):
-                            with st.spinner("Ejecutando prueba..."):
-                                auto_update_from_sftp()
-                                st.success("Prueba completada")
-                                st.rerun()
-                    
-                    with col_restart:
-                        if st.button("🔄 Reiniciar Scheduler", key="restart_scheduler"):
-                            with st.spinner("Reiniciando scheduler..."):
-                                initialize_auto_scheduler()
-                                st.success("Scheduler reiniciado")
-                                st.rerun()
-                    
-                    # Advertencia si el worker parece inactivo
-                    if "Worker inactivo" in scheduler_status:
-                        st.warning("⚠️ El scheduler parece estar inactivo. Considera reiniciarlo.")
-                else:
-                    st.warning("⚠️ Actualizaciones automáticas: DESHABILITADAS")
-            
-            with st.expander("📂 Actualizar Datos Manualmente"):
-                uploaded_file = st.file_uploader(
-                    "Cargar archivo CSV:",
-                    type=['csv'],
-                    help="El archivo debe contener las columnas: Codigo, Descripcion, Familia, Stock"
-                )
-                
-                if uploaded_file is not None:
-                    content = uploaded_file.read().decode('utf-8')
-                    is_valid, result = validate_csv_content(content)
-                    
-                    if is_valid:
-                        st.success("✅ Archivo válido")
-                        if st.button("💾 Actualizar Base de Datos", type="primary"):
-                            if save_data(result):
-                                st.success("🎉 ¡Datos actualizados exitosamente!")
-                                st.rerun()
-                    else:
-                        st.error(f"❌ {result}")
-        
+            admin_panels()
         else:
             # Para usuarios viewer
             st.subheader("ℹ️ Información")
@@ -826,123 +1121,15 @@ def main():
             st.markdown(f"🟢 Stock Alto: >{high_val} unidades")
         
         st.markdown("---")
-        st.markdown("### 📊 Resumen de Inventario")
-        df = load_data()
-        
-        # Métricas con estilo corporativo
-        st.markdown(f"""
-        <div class="metric-container">
-            <h4 style="color: var(--lucero-blue); margin: 0;">📦 Total de Productos</h4>
-            <h2 style="color: var(--lucero-blue); margin: 0.5rem 0;">{len(df)}</h2>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        if not df.empty:
-            low_threshold = st.session_state.get('stock_low_threshold', 5)
-            high_threshold = st.session_state.get('stock_high_threshold', 20)
-            
-            # Calcular stocks por categorías
-            stock_numbers = pd.to_numeric(df['Stock'], errors='coerce').fillna(0)
-            stock_bajo = len(df[stock_numbers <= low_threshold])
-            stock_medio = len(df[(stock_numbers > low_threshold) & (stock_numbers <= high_threshold)])
-            stock_alto = len(df[stock_numbers > high_threshold])
-            
-            st.markdown(f"""
-            <div style="margin-top: 1rem;">
-                <div style="background-color: rgba(227, 30, 36, 0.1); padding: 0.8rem; border-radius: 5px; border-left: 4px solid var(--lucero-red); margin-bottom: 0.5rem;">
-                    <strong style="color: var(--lucero-red);">🔴 Stock Bajo (≤{low_threshold}): {stock_bajo}</strong>
-                </div>
-                <div style="background-color: rgba(255, 193, 7, 0.1); padding: 0.8rem; border-radius: 5px; border-left: 4px solid #ffc107; margin-bottom: 0.5rem;">
-                    <strong style="color: #d39e00;">🟡 Stock Medio ({low_threshold+1}-{high_threshold}): {stock_medio}</strong>
-                </div>
-                <div style="background-color: rgba(124, 181, 24, 0.1); padding: 0.8rem; border-radius: 5px; border-left: 4px solid var(--lucero-green);">
-                    <strong style="color: var(--lucero-green);">🟢 Stock Alto (>{high_threshold}): {stock_alto}</strong>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        inventory_summary()
     
     # Contenido principal
-    df = load_data()
-    
-    if df.empty:
+    if load_data().empty:
         st.warning("⚠️ No hay datos disponibles. Cargue un archivo CSV para comenzar.")
         return
     
-    # Barra de búsqueda
-    col1, col2 = st.columns([3, 1])
-    
-    with col1:
-        search_term = st.text_input(
-            "🔍 Buscar productos:",
-            placeholder="Buscar por código, descripción, familia o stock...",
-            help="La búsqueda es en tiempo real y busca en todos los campos"
-        )
-    
-    with col2:
-        st.markdown("<br>", unsafe_allow_html=True)
-        clear_search = st.button("🗑️ Limpiar", help="Limpiar búsqueda")
-        if clear_search:
-            st.rerun()
-    
-    # Filtrar datos
-    filtered_df = filter_dataframe(df, search_term)
-    
-    # Mostrar resultados
-    if filtered_df.empty:
-        st.warning("🔍 No se encontraron productos que coincidan con la búsqueda.")
-    else:
-        # Información de resultados
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("📊 Productos Encontrados", len(filtered_df))
-        with col2:
-            if search_term:
-                st.metric("📋 Total en Base", len(df))
-        with col3:
-            csv_export = filtered_df.to_csv(index=False)
-            st.download_button(
-                label="📥 Exportar Resultados",
-                data=csv_export,
-                file_name=f"stock_productos_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-                help="Descargar resultados en formato CSV"
-            )
-        
-        st.markdown("---")
-        
-        # Preparar datos para mostrar
-        display_df = filtered_df.copy()
-        display_df['Indicador'] = filtered_df['Stock'].apply(get_stock_color)
-        display_df = display_df[['Indicador', 'Codigo', 'Descripcion', 'Familia', 'Stock']]
-        
-        # Mostrar tabla
-        st.dataframe(
-            display_df,
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Indicador": st.column_config.TextColumn(
-                    "Estado",
-                    help="🟢 Stock Alto | 🟡 Stock Medio | 🔴 Stock Bajo",
-                    width="small"
-                ),
-                "Codigo": st.column_config.TextColumn("Código", width="medium"),
-                "Descripcion": st.column_config.TextColumn("Descripción", width="large"),
-                "Familia": st.column_config.TextColumn("Familia", width="medium"),
-                "Stock": st.column_config.NumberColumn("Stock", width="small", format="%d")
-            }
-        )
-        
-        # Leyenda de colores
-        st.markdown("---")
-        low_val = st.session_state.get('stock_low_threshold', 5)
-        high_val = st.session_state.get('stock_high_threshold', 20)
-        st.markdown(f"""
-        **Leyenda de Stock:**
-        - 🟢 **Stock Alto:** Más de {high_val} unidades
-        - 🟡 **Stock Medio:** Entre {low_val + 1} y {high_val} unidades  
-        - 🔴 **Stock Bajo:** {low_val} unidades o menos
-        """)
+    bulk_code_lookup()
+    search_results()
 
 if __name__ == "__main__":
     # Inicializar el scheduler automático
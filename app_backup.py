@@ -13,6 +13,8 @@ import schedule
 import time
 import threading
 from datetime import datetime
+from catalog import get_catalog, publish_catalog, REQUIRED_COLUMNS
+from search import search_rows
 
 # Configuración de la página
 st.set_page_config(
@@ -62,32 +64,28 @@ def check_password():
     return True
 
 def load_data():
-    """Cargar datos desde el archivo CSV"""
+    """Cargar datos desde la instantánea compartida del catálogo"""
     try:
-        if os.path.exists(CSV_FILE_PATH):
-            df = pd.read_csv(CSV_FILE_PATH)
+        snapshot = get_catalog(CSV_FILE_PATH)
+        if snapshot is not None:
+            df = snapshot.df
             # Validar que tenga las columnas requeridas
-            required_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock']
-            if all(col in df.columns for col in required_columns):
+            if all(col in df.columns for col in REQUIRED_COLUMNS):
                 return df
             else:
-                st.error(f"❌ El archivo CSV debe contener las columnas: {', '.join(required_columns)}")
-                return pd.DataFrame(columns=required_columns)
+                st.error(f"❌ El archivo CSV debe contener las columnas: {', '.join(REQUIRED_COLUMNS)}")
+                return pd.DataFrame(columns=REQUIRED_COLUMNS)
         else:
             # Crear archivo CSV vacío con estructura correcta
-            os.makedirs("data", exist_ok=True)
-            df = pd.DataFrame(columns=['Codigo', 'Descripcion', 'Familia', 'Stock'])
-            df.to_csv(CSV_FILE_PATH, index=False)
-            return df
+            return publish_catalog(pd.DataFrame(columns=REQUIRED_COLUMNS), CSV_FILE_PATH).df
     except Exception as e:
         st.error(f"❌ Error al cargar los datos: {str(e)}")
-        return pd.DataFrame(columns=['Codigo', 'Descripcion', 'Familia', 'Stock'])
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
 
 def save_data(df):
-    """Guardar datos en el archivo CSV"""
+    """Guardar datos en el archivo CSV y publicar la nueva instantánea"""
     try:
-        os.makedirs("data", exist_ok=True)
-        df.to_csv(CSV_FILE_PATH, index=False)
+        publish_catalog(df, CSV_FILE_PATH)
         return True
     except Exception as e:
         st.error(f"❌ Error al guardar los datos: {str(e)}")
@@ -499,18 +497,8 @@ def filter_dataframe(df, search_term):
     if not search_term:
         return df
     
-    # Convertir todo a string para búsqueda
-    search_term = str(search_term).lower()
-    
-    # Buscar en todas las columnas
-    mask = (
-        df['Codigo'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Descripcion'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Familia'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Stock'].astype(str).str.lower().str.contains(search_term, na=False)
-    )
-    
-    return df[mask]
+    # Buscar en todas las columnas con el texto normalizado precalculado
+    return df.iloc[search_rows(df, str(search_term))]
 
 def main():
     """Función principal de la aplicación"""
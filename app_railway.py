@@ -11,10 +11,19 @@ from io import StringIO
 import requests
 from datetime import datetime
 import json
+from catalog import get_catalog, publish_catalog, REQUIRED_COLUMNS
+import sftp_pool
+from job_store import store as job_history
+from results_view import stock_levels, search_panel
+from search import (
+    query_cache, count_stock_levels,
+    STOCK_LEVEL_LOW, STOCK_LEVEL_MEDIUM, STOCK_LEVEL_HIGH, STOCK_LEVEL_UNKNOWN
+)
 
 # Importar scheduler para Railway
 try:
     from scheduler_railway import start_railway_scheduler
+    from leader import lease as leader_lease
     SCHEDULER_AVAILABLE = True
 except ImportError:
     SCHEDULER_AVAILABLE = False
@@ -133,67 +142,106 @@ def check_password():
     return True
 
 def load_data():
-    """Cargar datos desde el archivo CSV"""
+    """Cargar datos desde la instantánea compartida del catálogo"""
     try:
-        if os.path.exists(CSV_FILE_PATH):
-            df = pd.read_csv(CSV_FILE_PATH)
-            required_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock']
-            if all(col in df.columns for col in required_columns):
+        snapshot = get_catalog(CSV_FILE_PATH)
+        if snapshot is not None:
+            df = snapshot.df
+            if all(col in df.columns for col in REQUIRED_COLUMNS):
                 return df
             else:
-                st.error(f"❌ El archivo CSV debe contener las columnas: {', '.join(required_columns)}")
-                return pd.DataFrame(columns=required_columns)
+                st.error(f"❌ El archivo CSV debe contener las columnas: {', '.join(REQUIRED_COLUMNS)}")
+                return pd.DataFrame(columns=REQUIRED_COLUMNS)
         else:
-            os.makedirs("data", exist_ok=True)
-            df = pd.DataFrame(columns=['Codigo', 'Descripcion', 'Familia', 'Stock'])
-            df.to_csv(CSV_FILE_PATH, index=False)
-            return df
+            return publish_catalog(pd.DataFrame(columns=REQUIRED_COLUMNS), CSV_FILE_PATH).df
     except Exception as e:
         st.error(f"❌ Error al cargar los datos: {str(e)}")
-        return pd.DataFrame(columns=['Codigo', 'Descripcion', 'Familia', 'Stock'])
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
 
 def save_data(df):
-    """Guardar datos en el archivo CSV"""
+    """Guardar datos en el archivo CSV y publicar la nueva instantánea"""
     try:
-        os.makedirs("data", exist_ok=True)
-        df.to_csv(CSV_FILE_PATH, index=False)
+        publish_catalog(df, CSV_FILE_PATH)
         return True
     except Exception as e:
         st.error(f"❌ Error al guardar los datos: {str(e)}")
         return False
 
-def get_stock_color(stock):
-    """Determinar el color del indicador de stock"""
-    try:
-        stock_val = pd.to_numeric(stock, errors='coerce')
-        if pd.isna(stock_val):
-            return "⚪"
-        
+@st.fragment
+def admin_panels():
+    """Controles de administración; sus botones solo vuelven a ejecutar este fragmento"""
+    st.markdown("### 🔄 Control Manual")
+    if st.button("⚡ Forzar Actualización", key="force_update", help="Ejecutar actualización SFTP inmediatamente"):
+        with st.spinner("Ejecutando actualización..."):
+            try:
+                # Importar y ejecutar actualización manual
+                from scheduler_railway import run_scheduled_update
+                run_scheduled_update()
+                st.success("✅ Actualización ejecutada!")
+                st.rerun()
+            except Exception as e:
+                st.error(f"❌ Error: {str(e)}")
+                st.info("Verifica que SFTP esté configurado correctamente")
+    
+    # Tiempos de la última operación SFTP (este botón o el scheduler)
+    if sftp_pool.pool.last_timings:
+        st.caption(f"⏱️ Última operación SFTP: {sftp_pool.format_timings(sftp_pool.pool.last_timings)}")
+    
+    # Historial de ejecuciones programadas (data/scheduler.db), compartido por todas las réplicas
+    with st.expander("📜 Historial de Ejecuciones"):
+        try:
+            runs = job_history.recent_runs(limit=10)
+        except Exception as e:
+            runs = []
+            st.error(f"Error leyendo el historial: {str(e)}")
+        if runs:
+            st.dataframe(
+                pd.DataFrame([{
+                    'Tarea': run['job'],
+                    'Programada': run['scheduled_at'],
+                    'Resultado': run['outcome'] + (" (recuperación)" if run['recovery'] else ""),
+                    'Filas': run['rows'],
+                    'Segundos': round(run['duration'], 2) if run['duration'] is not None else None,
+                } for run in runs]),
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            st.info("Sin ejecuciones registradas")
+    
+    cache_stats = query_cache.stats()
+    st.caption(f"⚡ Caché de búsquedas: {cache_stats['hits']} aciertos · {cache_stats['misses']} fallos")
+
+@st.fragment
+def inventory_summary():
+    """Resumen de inventario del sidebar"""
+    st.markdown("### 📊 Resumen de Inventario")
+    df = load_data()
+    
+    if not df.empty:
         low_threshold = st.session_state.get('stock_low_threshold', 5)
         high_threshold = st.session_state.get('stock_high_threshold', 20)
         
-        if stock_val <= low_threshold:
-            return "🔴"
-        elif stock_val <= high_threshold:
-            return "🟡"
-        else:
-            return "🟢"
-    except:
-        return "⚪"
+        # Calcular stocks por categorías de forma segura
+        try:
+            # Un solo recuento sobre los niveles cacheados; sin dato cuenta como bajo
+            counts = count_stock_levels(stock_levels(df))
+            stock_bajo = counts[STOCK_LEVEL_LOW] + counts[STOCK_LEVEL_UNKNOWN]
+            stock_medio = counts[STOCK_LEVEL_MEDIUM]
+            stock_alto = counts[STOCK_LEVEL_HIGH]
+            
+            st.metric("📦 Total", len(df))
+            st.metric("🔴 Stock Bajo", stock_bajo)
+            st.metric("🟡 Stock Medio", stock_medio) 
+            st.metric("🟢 Stock Alto", stock_alto)
+        except Exception as e:
+            st.error(f"Error calculando métricas: {str(e)}")
+
+@st.fragment
+def search_results():
+    """Buscador y resultados; cada pulsación solo ejecuta este fragmento"""
+    search_panel(load_data())
 
-def filter_dataframe(df, search_term):
-    """Filtrar DataFrame basado en el término de búsqueda"""
-    if not search_term:
-        return df
-    
-    search_term = search_term.lower()
-    mask = (
-        df['Codigo'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Descripcion'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Familia'].astype(str).str.lower().str.contains(search_term, na=False) |
-        df['Stock'].astype(str).str.lower().str.contains(search_term, na=False)
-    )
-    return df[mask]
 
 def main():
     """Función principal de la aplicación"""
@@ -216,18 +264,7 @@ def main():
         
         # Botón para forzar actualización (solo admin)
         if user_type == "admin":
-            st.markdown("### 🔄 Control Manual")
-            if st.button("⚡ Forzar Actualización", key="force_update", help="Ejecutar actualización SFTP inmediatamente"):
-                with st.spinner("Ejecutando actualización..."):
-                    try:
-                        # Importar y ejecutar actualización manual
-                        from scheduler_railway import run_scheduled_update
-                        run_scheduled_update()
-                        st.success("✅ Actualización ejecutada!")
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
-                        st.info("Verifica que SFTP esté configurado correctamente")
+            admin_panels()
         
         if IS_RAILWAY:
             st.info(f"🚀 Railway - Puerto {PORT}")
@@ -239,6 +276,8 @@ def main():
                 st.success("Scheduler: Activo")
                 schedule_time = os.environ.get("UPDATE_SCHEDULE_TIME", "02:00")
                 st.text(f"Próxima: {schedule_time}")
+                if SCHEDULER_AVAILABLE:
+                    st.caption(f"👑 {leader_lease.describe()}")
             else:
                 st.warning("Scheduler: Deshabilitado")
             
@@ -271,31 +310,10 @@ def main():
             st.rerun()
         
         st.markdown("---")
-        st.markdown("### 📊 Resumen de Inventario")
-        df = load_data()
-        
-        if not df.empty:
-            low_threshold = st.session_state.get('stock_low_threshold', 5)
-            high_threshold = st.session_state.get('stock_high_threshold', 20)
-            
-            # Calcular stocks por categorías de forma segura
-            try:
-                stock_numbers = pd.to_numeric(df['Stock'], errors='coerce').fillna(0)
-                stock_bajo = len(df[stock_numbers <= low_threshold])
-                stock_medio = len(df[(stock_numbers > low_threshold) & (stock_numbers <= high_threshold)])
-                stock_alto = len(df[stock_numbers > high_threshold])
-                
-                st.metric("📦 Total", len(df))
-                st.metric("🔴 Stock Bajo", stock_bajo)
-                st.metric("🟡 Stock Medio", stock_medio) 
-                st.metric("🟢 Stock Alto", stock_alto)
-            except Exception as e:
-                st.error(f"Error calculando métricas: {str(e)}")
+        inventory_summary()
     
     # Contenido principal
-    df = load_data()
-    
-    if df.empty:
+    if load_data().empty:
         st.warning("⚠️ No hay datos disponibles. Cargue un archivo CSV para comenzar.")
         
         # Mostrar datos de ejemplo para Railway
@@ -303,85 +321,7 @@ def main():
             st.info("🚀 Para Railway: Puede crear datos de prueba usando la función de administrador")
         return
     
-    # Barra de búsqueda
-    col1, col2 = st.columns([3, 1])
-    
-    with col1:
-        search_term = st.text_input(
-            "🔍 Buscar productos:",
-            placeholder="Buscar por código, descripción, familia o stock...",
-            help="La búsqueda es en tiempo real y busca en todos los campos"
-        )
-    
-    with col2:
-        st.markdown("<br>", unsafe_allow_html=True)
-        clear_search = st.button("🗑️ Limpiar", help="Limpiar búsqueda")
-        if clear_search:
-            st.rerun()
-    
-    # Filtrar datos
-    filtered_df = filter_dataframe(df, search_term)
-    
-    # Mostrar resultados
-    if filtered_df.empty:
-        st.warning("🔍 No se encontraron productos que coincidan con la búsqueda.")
-    else:
-        # Información de resultados
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("📊 Productos Encontrados", len(filtered_df))
-        with col2:
-            if search_term:
-                st.metric("📋 Total en Base", len(df))
-        with col3:
-            csv_export = filtered_df.to_csv(index=False)
-            st.download_button(
-                label="📥 Exportar Resultados",
-                data=csv_export,
-                file_name=f"stock_productos_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-                help="Descargar resultados en formato CSV"
-            )
-        
-        st.markdown("---")
-        
-        # Preparar datos para mostrar de forma segura
-        try:
-            display_df = filtered_df.copy()
-            display_df['Indicador'] = filtered_df['Stock'].apply(get_stock_color)
-            display_df = display_df[['Indicador', 'Codigo', 'Descripcion', 'Familia', 'Stock']]
-            
-            # Mostrar tabla
-            st.dataframe(
-                display_df,
-                use_container_width=True,
-                hide_index=True,
-                column_config={
-                    "Indicador": st.column_config.TextColumn(
-                        "Estado",
-                        help="🟢 Stock Alto | 🟡 Stock Medio | 🔴 Stock Bajo",
-                        width="small"
-                    ),
-                    "Codigo": st.column_config.TextColumn("Código", width="medium"),
-                    "Descripcion": st.column_config.TextColumn("Descripción", width="large"),
-                    "Familia": st.column_config.TextColumn("Familia", width="medium"),
-                    "Stock": st.column_config.NumberColumn("Stock", width="small", format="%d")
-                }
-            )
-        except Exception as e:
-            st.error(f"Error mostrando datos: {str(e)}")
-            st.dataframe(filtered_df, use_container_width=True)
-        
-        # Leyenda de colores
-        st.markdown("---")
-        low_val = st.session_state.get('stock_low_threshold', 5)
-        high_val = st.session_state.get('stock_high_threshold', 20)
-        st.markdown(f"""
-        **Leyenda de Stock:**
-        - 🟢 **Stock Alto:** Más de {high_val} unidades
-        - 🟡 **Stock Medio:** Entre {low_val + 1} y {high_val} unidades  
-        - 🔴 **Stock Bajo:** {low_val} unidades o menos
-        """)
+    search_results()
 
 if __name__ == "__main__":
     # Inicializar scheduler si está habilitado
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la interfaz: latencia de una pulsación en el buscador
+Compara volver a ejecutar el script completo (CSS, logo, configuración,
+sidebar de administración) con ejecutar solo el fragmento de búsqueda
+Usa el catálogo de data/productos.csv y streamlit.testing
+
+Uso:
+    python bench_app.py                # app.py
+    python bench_app.py app_railway    # otra app con search_results()
+"""
+
+import sys
+import time
+import statistics
+
+from streamlit.testing.v1 import AppTest
+
+TYPING = ["p", "pa", "pav", "pavo", "pavo b", "nob", "nobb", "nobby", "zen", "zen c"]
+REPEAT = 2
+
+
+def fragment_script():
+    """Script que ejecuta solo el fragmento del buscador (lo que hace Streamlit al teclear)"""
+    import importlib
+    import streamlit as st
+    app = importlib.import_module(st.session_state['bench_module'])
+    if hasattr(app, 'initialize_session_config'):
+        app.initialize_session_config()
+    app.search_results()
+
+
+def rerun_times(at):
+    """Tiempo de cada ejecución al teclear TYPING en el buscador"""
+    at.session_state['password_correct'] = True
+    at.session_state['user_type'] = 'admin'
+    at.run()
+    times = []
+    for query in TYPING * REPEAT:
+        search_box = [widget for widget in at.text_input if 'Buscar' in widget.label][0]
+        search_box.set_value(query)
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    return times
+
+
+def main():
+    """Función principal"""
+    module_name = sys.argv[1] if len(sys.argv) > 1 else "app"
+
+    full = rerun_times(AppTest.from_file(f"{module_name}.py", default_timeout=60))
+    fragment_test = AppTest.from_function(fragment_script, default_timeout=60)
+    fragment_test.session_state['bench_module'] = module_name
+    fragment = rerun_times(fragment_test)
+
+    print(f"⌨️ Latencia por pulsación ({module_name}.py, mediana de {len(full)})")
+    print(f"{'script completo':>18} | {statistics.median(full) * 1e3:>8.1f} ms")
+    print(f"{'solo fragmento':>18} | {statistics.median(fragment) * 1e3:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
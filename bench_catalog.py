@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga del catálogo: CSV frente a instantánea binaria (Feather)
+y memoria residente con tipos inferidos frente al esquema declarado
+Genera catálogos sintéticos con el mismo formato que data/productos.csv
+
+Uso:
+    python bench_catalog.py                 # 5k, 500k y 5M filas
+    python bench_catalog.py 5000 100000     # tamaños personalizados
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import catalog
+
+DEFAULT_SIZES = [5_000, 500_000, 5_000_000]
+
+WORDS = [
+    "PIENSO", "PAVO", "BASIC", "CALEYA", "HENO", "PRADERA", "ZEN", "CAT", "SALMON",
+    "POTATO", "EXPOSITOR", "JUGUETE", "ANILLO", "MORDEDOR", "CORTAUÑAS", "JAULA",
+    "PAJARO", "SNACK", "COLLAR", "NYLON", "ROJO", "AZUL", "GRANDE", "PEQUEÑO",
+]
+
+
+def make_catalog(rows, seed=42):
+    """Crear un catálogo sintético de `rows` filas"""
+    rng = np.random.default_rng(seed)
+    words = np.array(WORDS)
+    descriptions = [
+        " ".join(parts) + f" {size} KG."
+        for parts, size in zip(
+            words[rng.integers(0, len(words), size=(rows, 3))],
+            rng.integers(1, 30, size=rows)
+        )
+    ]
+    families = np.array([f"FAMILIA {i:03d}" for i in range(300)])
+    return pd.DataFrame({
+        'Codigo': [f"{i:07d}" for i in rng.permutation(rows)],
+        'Descripcion': descriptions,
+        'Familia': families[rng.integers(0, len(families), size=rows)],
+        'Stock': rng.integers(-20, 1000, size=rows),
+    })
+
+
+def timed(func, repeat=3):
+    """Mejor tiempo de `repeat` ejecuciones, en segundos"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(rows):
+    """Medir la carga en frío desde CSV y desde la instantánea binaria"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "productos.csv")
+        catalog.publish_catalog(make_catalog(rows), path)
+
+        def load_csv():
+            pd.read_csv(path)
+
+        inferred_memory = pd.read_csv(path).memory_usage(deep=True).sum()
+        typed_memory = catalog.get_catalog(path).df.memory_usage(deep=True).sum()
+
+        def load_snapshot():
+            catalog.invalidate_catalog(path)
+            catalog.get_catalog(path)
+
+        csv_time = timed(load_csv)
+        snapshot_time = timed(load_snapshot) if catalog.ARROW_AVAILABLE else None
+        csv_size = os.path.getsize(path)
+        snapshot_size = os.path.getsize(catalog.snapshot_path(path)) if catalog.ARROW_AVAILABLE else 0
+        catalog.invalidate_catalog(path)
+
+    return csv_time, snapshot_time, csv_size, snapshot_size, inferred_memory, typed_memory
+
+
+def main():
+    """Función principal"""
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    if not catalog.ARROW_AVAILABLE:
+        print("⚠️ pyarrow no está instalado: solo se mide la carga CSV")
+
+    results = [(rows, bench(rows)) for rows in sizes]
+
+    print("📦 Carga en frío")
+    print(f"{'filas':>10} | {'CSV (s)':>9} | {'Feather (s)':>11} | {'speedup':>7} | {'CSV MB':>7} | {'Feather MB':>10}")
+    print("-" * 70)
+    for rows, (csv_time, snapshot_time, csv_size, snapshot_size, _, _) in results:
+        if snapshot_time is None:
+            print(f"{rows:>10} | {csv_time:>9.4f} | {'-':>11} | {'-':>7} | {csv_size / 1e6:>7.1f} | {'-':>10}")
+        else:
+            print(f"{rows:>10} | {csv_time:>9.4f} | {snapshot_time:>11.4f} | "
+                  f"{csv_time / snapshot_time:>6.1f}x | {csv_size / 1e6:>7.1f} | {snapshot_size / 1e6:>10.1f}")
+
+    print()
+    print(f"🧮 Memoria del DataFrame (pandas {pd.__version__})")
+    print(f"{'filas':>10} | {'inferido MB':>11} | {'tipado MB':>9} | {'reducción':>9}")
+    print("-" * 50)
+    for rows, (_, _, _, _, inferred_memory, typed_memory) in results:
+        print(f"{rows:>10} | {inferred_memory / 1e6:>11.1f} | {typed_memory / 1e6:>9.1f} | "
+              f"{1 - typed_memory / inferred_memory:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
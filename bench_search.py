@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark de búsqueda sobre el catálogo
+Mide la construcción del índice por instantánea, el tiempo medio por consulta
+(recorrido completo frente a índice de trigramas) y la latencia al teclear
+(búsqueda completa frente a refinar el resultado anterior) y la búsqueda
+tolerante a errores sobre data/productos.csv y sobre catálogos sintéticos
+más grandes
+
+Uso:
+    python bench_search.py                  # catálogo actual, 100k y 1M filas
+    python bench_search.py 50000 200000     # tamaños sintéticos personalizados
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import catalog
+import fuzzy
+import search
+from bench_catalog import make_catalog, timed
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+QUERIES = ["pavo", "pavo basic", "0708", "nobby", "63", "pequeño", "zen cat"]
+# Consultas con errores de escritura para el modo tolerante (fuzzy.py)
+FUZZY_QUERIES = ["pienzo", "pinso pabo", "colar", "jugete roj", "pavo"]
+PICK_LIST_SIZE = 10_000
+# Consulta tecleada letra a letra, como llega desde el buscador
+TYPING = ["pie", "pien", "pienso", "pienso p", "pienso pa", "pienso pav", "pienso pavo"]
+
+
+def uncached_search(df, query):
+    """search_rows() sin la caché de resultados, para medir la consulta en sí"""
+    search.query_cache.clear()
+    return search.search_rows(df, query)
+
+
+def typing_time(df, narrow):
+    """Latencia media por pulsación tecleando TYPING, sin caché; narrow = refinar el resultado anterior"""
+    def run():
+        previous = None
+        for query in TYPING:
+            search.query_cache.clear()
+            rows = search.search_rows(df, query, previous if narrow else None)
+            previous = search.search_state(df, query, rows)
+    return timed(run, repeat=3) / len(TYPING)
+
+
+def bench(snapshot, label):
+    """Medir construcción del índice y latencia media por consulta (recorrido vs trigramas)"""
+    build_time = timed(lambda: search.SearchIndex(snapshot.df), repeat=1)
+    index = search.get_search_index(snapshot.df)
+
+    scan_times = []
+    index_times = []
+    for query in QUERIES:
+        term = search.normalize_text(query)
+        scan_times.append(timed(lambda: index.scan(term), repeat=20))
+        index_times.append(timed(lambda: uncached_search(snapshot.df, query), repeat=20))
+
+    # Código exacto y lista de pedido de 10k códigos
+    codes = snapshot.df['Codigo'].sample(PICK_LIST_SIZE, replace=True, random_state=1).tolist()
+    search.get_code_index(snapshot.df)
+    exact_time = timed(lambda: uncached_search(snapshot.df, codes[0]), repeat=20)
+    bulk_time = timed(lambda: search.lookup_codes(snapshot.df, codes), repeat=5)
+    full_typing = typing_time(snapshot.df, narrow=False)
+    narrow_typing = typing_time(snapshot.df, narrow=True)
+    fuzzy.get_fuzzy_index(snapshot.df)
+    fuzzy_times = [timed(lambda: fuzzy.fuzzy_rows(snapshot.df, query), repeat=5) for query in FUZZY_QUERIES]
+
+    print(f"{label:>14} | {len(snapshot.df):>9} | {build_time:>9.3f} | "
+          f"{sum(scan_times) / len(scan_times) * 1e3:>11.3f} | "
+          f"{sum(index_times) / len(index_times) * 1e3:>12.3f} | {max(index_times) * 1e3:>10.3f} | "
+          f"{exact_time * 1e3:>11.3f} | {bulk_time * 1e3:>12.1f} | "
+          f"{full_typing * 1e3:>10.2f} | {narrow_typing * 1e3:>10.2f} | "
+          f"{sum(fuzzy_times) / len(fuzzy_times) * 1e3:>11.2f}")
+
+
+def main():
+    """Función principal"""
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(f"{'catálogo':>14} | {'filas':>9} | {'índice (s)':>9} | {'scan (ms)':>11} | "
+          f"{'índice (ms)':>12} | {'peor (ms)':>10} | {'código (ms)':>11} | {'10k cód (ms)':>12} | "
+          f"{'tecleo (ms)':>10} | {'refino (ms)':>10} | {'difuso (ms)':>11}")
+    print("-" * 154)
+
+    if os.path.exists(catalog.CSV_FILE_PATH):
+        bench(catalog.get_catalog(catalog.CSV_FILE_PATH), "productos.csv")
+
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "productos.csv")
+            bench(catalog.publish_catalog(make_catalog(rows), path), "sintético")
+            catalog.invalidate_catalog(path)
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    main()
+    print(f"\nTiempo total: {time.perf_counter() - start:.1f}s")
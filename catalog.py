@@ -0,0 +1,508 @@
+"""
+Catálogo de productos compartido por todas las sesiones del proceso
+Mantiene una única instantánea de solo lectura de data/productos.csv y solo
+vuelve a leer el disco cuando cambia la versión del archivo.
+
+Junto al CSV se guarda una instantánea columnar (Feather / Arrow IPC sin
+comprimir) que se abre con memory-map; el CSV queda como copia de intercambio.
+"""
+import os
+import json
+import hashlib
+import threading
+from io import BytesIO
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import delta as catalog_delta
+
+# pyarrow es opcional: sin él se sigue trabajando solo con el CSV
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+CSV_FILE_PATH = "data/productos.csv"
+REQUIRED_COLUMNS = ['Codigo', 'Descripcion', 'Familia', 'Stock']
+
+# Esquema declarado del catálogo: Codigo siempre texto (conserva ceros a la
+# izquierda), Familia categórica (pocos valores distintos) y Stock entero compacto
+STRING_DTYPE = "string[pyarrow]" if ARROW_AVAILABLE else "string"
+ARROW_STRING_TYPES = {
+    pa.string(): pd.StringDtype("pyarrow"), pa.large_string(): pd.StringDtype("pyarrow")
+} if ARROW_AVAILABLE else {}
+CATALOG_DTYPES = {
+    'Codigo': STRING_DTYPE,
+    'Descripcion': STRING_DTYPE,
+    'Familia': 'category',
+    'Stock': 'Int32',
+    # Solo en catálogos unidos desde varias fuentes (ingest.py)
+    'Proveedor': 'category',
+    'Almacen': 'category',
+}
+
+# Codificaciones probadas al leer un CSV externo, en orden (utf-8-sig acepta
+# también UTF-8 sin BOM; latin-1 nunca falla y queda como último recurso)
+CSV_ENCODINGS = ['utf-8-sig', 'cp1252', 'latin-1']
+COPY_CHUNK_BYTES = 1 << 20
+
+# Claves de metadatos guardadas en la instantánea binaria
+META_DIGEST = b'catalog_sha256'
+META_CSV_STAT = b'catalog_csv_stat'
+
+# Instantáneas vigentes por ruta de archivo, compartidas entre sesiones
+_snapshots = {}
+_lock = threading.Lock()
+
+# Funciones llamadas con cada instantánea recién publicada (p.ej. construir índices)
+_publish_hooks = []
+
+# Funciones que reutilizan o actualizan una estructura derivada cuando la nueva
+# instantánea conserva las filas de la anterior (ver register_derived_updater)
+_derived_updaters = []
+
+
+class CatalogSnapshot:
+    """Instantánea de solo lectura del catálogo junto con su versión"""
+
+    def __init__(self, df, path, stat_key, digest, derived=None, delta=None):
+        self.df = df
+        self.path = path
+        self.stat_key = stat_key
+        self.digest = digest
+        # Cambios respecto a la instantánea anterior (None si se publicó completa)
+        self.delta = delta
+        self.loaded_at = datetime.now()
+        # Estructuras derivadas del DataFrame (índices de búsqueda, etc.)
+        self._derived = derived if derived is not None else {}
+        self._derived_lock = threading.Lock()
+
+    @property
+    def version(self):
+        """Versión del archivo: (mtime_ns, tamaño, sha256) del CSV"""
+        csv_key = self.stat_key[0] or (None, None)
+        return (csv_key[0], csv_key[1], self.digest)
+
+    def has_derived(self, key):
+        """True si la estructura ya está construida (o se heredó de la instantánea anterior)"""
+        return key in self._derived
+
+    def derived(self, key, builder):
+        """Obtener una estructura derivada, construyéndola una sola vez por instantánea"""
+        value = self._derived.get(key)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = builder(self)
+                    self._derived[key] = value
+        return value
+
+
+def snapshot_path(path=CSV_FILE_PATH):
+    """Ruta de la instantánea binaria asociada a un CSV"""
+    return os.path.splitext(path)[0] + ".feather"
+
+
+def _stat_key(path):
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+
+def _current_stat_key(path):
+    """Clave de versión barata: solo stat() del CSV y de la instantánea"""
+    return (_stat_key(path), _stat_key(snapshot_path(path)) if ARROW_AVAILABLE else None)
+
+
+def atomic_write(path, write):
+    """Escribir en archivo temporal + rename para que ningún lector vea un archivo a medias"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _has_dtype(series, dtype):
+    if dtype == 'category':
+        return isinstance(series.dtype, pd.CategoricalDtype)
+    return series.dtype == pd.api.types.pandas_dtype(dtype)
+
+
+def _stock_column(df):
+    """Stock como entero Int32: los decimales se redondean y lo que no cabe queda vacío, con aviso
+
+    Un stock como "2.5" no invalida el catálogo entero; se informa del código
+    (o la línea del CSV) de las primeras filas afectadas.
+    """
+    stock = pd.to_numeric(df['Stock'], errors='coerce')
+    if pd.api.types.is_float_dtype(stock):
+        out_of_range = (stock < np.iinfo(np.int32).min) | (stock > np.iinfo(np.int32).max)
+        fractional = ~out_of_range & stock.notna() & (stock != stock.round())
+        for mask, action in ((fractional, "redondeado"), (out_of_range, "fuera de rango, se deja vacío")):
+            if mask.any():
+                rows = np.flatnonzero(mask.to_numpy())
+                labels = df['Codigo'].iloc[rows[:5]].tolist() if 'Codigo' in df.columns else [f"línea {row + 2}" for row in rows[:5]]
+                print(f"⚠️ Stock {action} en {len(rows)} filas: {', '.join(map(str, labels))}{'...' if len(rows) > 5 else ''}")
+        # Al entero más próximo, con las mitades hacia fuera (2.5 -> 3, -2.5 -> -3)
+        stock = np.trunc(stock + 0.5 * np.sign(stock)).mask(out_of_range)
+    return stock.astype(CATALOG_DTYPES['Stock'])
+
+
+def apply_catalog_schema(df):
+    """Convertir las columnas del catálogo a los tipos declarados en CATALOG_DTYPES"""
+    pending = [
+        column for column, dtype in CATALOG_DTYPES.items()
+        if column in df.columns and not _has_dtype(df[column], dtype)
+    ]
+    if not pending:
+        return df
+
+    df = df.copy(deep=False)
+    for column in pending:
+        dtype = CATALOG_DTYPES[column]
+        if column == 'Stock':
+            df[column] = _stock_column(df)
+        else:
+            df[column] = df[column].astype(STRING_DTYPE).astype(dtype)
+    return df
+
+
+def read_catalog_csv(source, encoding='utf-8-sig'):
+    """Leer un CSV del catálogo aplicando el esquema declarado"""
+    # Las columnas de texto se leen ya tipadas para que pandas no infiera enteros
+    text_dtypes = {column: dtype for column, dtype in CATALOG_DTYPES.items() if column != 'Stock'}
+    df = pd.read_csv(source, dtype=text_dtypes, encoding=encoding)
+    if 'Stock' in df.columns:
+        df['Stock'] = _stock_column(df)
+    return df
+
+
+def read_catalog_file(source):
+    """Leer un CSV externo (ruta o archivo binario) probando CSV_ENCODINGS; devuelve (df, codificación)"""
+    for encoding in CSV_ENCODINGS[:-1]:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        try:
+            return read_catalog_csv(source, encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return read_catalog_csv(source, CSV_ENCODINGS[-1]), CSV_ENCODINGS[-1]
+
+
+def spool_to_file(source, path=CSV_FILE_PATH):
+    """Copiar un archivo binario por bloques a un temporal junto a `path`
+
+    Calcula el sha256 mientras copia; devuelve (ruta temporal, sha256).
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: source.read(COPY_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                f.write(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+
+def parse_catalog(data):
+    """Convertir el contenido binario del CSV en DataFrame tipado"""
+    return read_catalog_csv(BytesIO(data))
+
+
+def _read_snapshot_metadata(snap_path):
+    """Leer solo el esquema de la instantánea para validar que corresponde al CSV"""
+    with pa.memory_map(snap_path) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    csv_stat = metadata.get(META_CSV_STAT)
+    return (
+        tuple(json.loads(csv_stat)) if csv_stat else None,
+        metadata.get(META_DIGEST, b'').decode() or None
+    )
+
+
+def _read_snapshot(snap_path):
+    """Abrir la instantánea Arrow con memory-map (sin copiar los buffers)"""
+    table = feather.read_table(snap_path, memory_map=True)
+    # pandas 2.x convierte el texto a cadenas Python salvo que se pida string[pyarrow]
+    df = table.to_pandas(types_mapper=ARROW_STRING_TYPES.get)
+    # Instantáneas escritas con un esquema anterior se convierten al cargarlas
+    return apply_catalog_schema(df)
+
+
+def _write_snapshot(df, path, csv_key, digest):
+    """Guardar la instantánea Arrow IPC sin comprimir para poder mapearla en memoria"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[META_DIGEST] = digest.encode()
+    metadata[META_CSV_STAT] = json.dumps(list(csv_key)).encode()
+    table = table.replace_schema_metadata(metadata)
+    atomic_write(
+        snapshot_path(path),
+        lambda tmp: feather.write_feather(table, tmp, compression='uncompressed')
+    )
+
+
+def _load(path, previous):
+    """Cargar el catálogo desde la instantánea binaria si es válida, o desde el CSV"""
+    csv_key = _stat_key(path)
+    if csv_key is None:
+        return None
+
+    if ARROW_AVAILABLE and os.path.exists(snapshot_path(path)):
+        try:
+            snap_csv_key, digest = _read_snapshot_metadata(snapshot_path(path))
+            if snap_csv_key == csv_key and digest:
+                if previous is not None and previous.digest == digest:
+                    return CatalogSnapshot(previous.df, path, _current_stat_key(path), digest, previous._derived)
+                df = _read_snapshot(snapshot_path(path))
+                return CatalogSnapshot(df, path, _current_stat_key(path), digest)
+        except Exception as e:
+            print(f"Error leyendo instantánea binaria, se usa el CSV: {str(e)}")
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+
+    derived = None
+    if previous is not None and previous.digest == digest:
+        # Archivo reescrito con el mismo contenido: se reutiliza el DataFrame y sus índices
+        df, derived = previous.df, previous._derived
+    else:
+        df = parse_catalog(data)
+
+    if ARROW_AVAILABLE:
+        # Regenerar la instantánea para que el próximo arranque no parsee texto
+        try:
+            _write_snapshot(df, path, csv_key, digest)
+        except Exception as e:
+            print(f"Error guardando instantánea binaria: {str(e)}")
+
+    return CatalogSnapshot(df, path, _current_stat_key(path), digest, derived)
+
+
+def get_catalog(path=CSV_FILE_PATH):
+    """Obtener la instantánea vigente; solo lee el archivo si su versión cambió"""
+    stat_key = _current_stat_key(path)
+    if stat_key[0] is None:
+        return None
+
+    snapshot = _snapshots.get(path)
+    if snapshot is not None and snapshot.stat_key == stat_key:
+        return snapshot
+
+    with _lock:
+        # Otra sesión pudo haber recargado mientras esperábamos el lock
+        snapshot = _snapshots.get(path)
+        if snapshot is not None and snapshot.stat_key == _current_stat_key(path):
+            return snapshot
+
+        snapshot = _load(path, snapshot)
+        if snapshot is not None:
+            _snapshots[path] = snapshot
+        return snapshot
+
+
+def _diff(previous, df):
+    """Diferencias de df (ya tipado) respecto a la instantánea vigente, o None si no se pueden calcular"""
+    if previous is None:
+        return None
+    try:
+        return catalog_delta.diff_catalog(previous.df, df, previous.version)
+    except Exception as e:
+        print(f"Error calculando diferencias del catálogo, se publica completo: {str(e)}")
+        return None
+
+
+def _updated_derived(previous, delta, df):
+    """Estructuras derivadas de la instantánea anterior que siguen valiendo tras el cambio"""
+    if delta is None or not delta.same_rows:
+        return None
+    derived = {}
+    for key, value in list(previous._derived.items()):
+        for updater in _derived_updaters:
+            try:
+                updated = updater(key, value, delta, df)
+            except Exception as e:
+                print(f"Error actualizando {key}: {str(e)}")
+                updated = None
+            if updated is not None:
+                derived[key] = updated
+                break
+    return derived
+
+
+def _publish(path, df, digest, write_csv, previous, delta):
+    """Escribir CSV e instantánea binaria y registrar la nueva instantánea (llamar con el lock)
+
+    `write_csv` es una función que escribe el CSV o la ruta de un archivo ya escrito.
+    """
+    if callable(write_csv):
+        atomic_write(path, write_csv)
+    else:
+        os.replace(write_csv, path)  # archivo ya escrito junto al catálogo
+    published_df = df
+    if ARROW_AVAILABLE:
+        _write_snapshot(df, path, _stat_key(path), digest)
+        published_df = _read_snapshot(snapshot_path(path))
+
+    snapshot = CatalogSnapshot(
+        published_df, path, _current_stat_key(path), digest,
+        _updated_derived(previous, delta, published_df), delta
+    )
+    _snapshots[path] = snapshot
+    if delta is not None:
+        try:
+            catalog_delta.record_change(delta, previous.df, published_df, path, previous.digest, digest)
+        except Exception as e:
+            print(f"Error guardando registro de cambios: {str(e)}")
+    return snapshot
+
+
+def publish_catalog(df, path=CSV_FILE_PATH):
+    """Escribir el catálogo (CSV + instantánea binaria) y publicarlo como nueva instantánea
+
+    Si ya hay una instantánea publicada se calculan las diferencias por Codigo:
+    sin cambios no se escribe nada, y si las filas se conservan las estructuras
+    derivadas que no dependen de lo cambiado pasan a la nueva instantánea.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    df = apply_catalog_schema(df)
+    with _lock:
+        previous = _snapshots.get(path)
+        delta = _diff(previous, df)
+        if delta is not None:
+            if delta.is_empty:
+                return previous
+            df = delta.apply(df)
+
+        data = df.to_csv(index=False).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+
+        def write_csv(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+
+        # Se construye desde el CSV para que los tipos coincidan con una carga en frío
+        snapshot = _publish(path, parse_catalog(data), digest, write_csv, previous, delta)
+
+    _run_publish_hooks(snapshot)
+    return snapshot
+
+
+def publish_catalog_file(source_path, df, encoding='utf-8-sig', digest=None, path=CSV_FILE_PATH):
+    """Publicar un CSV ya leído con read_catalog_file() moviéndolo a su sitio
+
+    El DataFrame no se vuelve a serializar ni a parsear: el archivo pasa a ser
+    el CSV del catálogo tal cual. Si no está en UTF-8, o si las diferencias con
+    la instantánea vigente obligan a reordenar filas, se publica con
+    publish_catalog() para que una carga en frío lo lea igual.
+    """
+    with _lock:
+        previous = _snapshots.get(path)
+        delta = _diff(previous, df)
+        if delta is not None and delta.is_empty:
+            os.remove(source_path)
+            return previous
+        if encoding == 'utf-8-sig' and (delta is None or delta.in_order):
+            if digest is None:
+                with open(source_path, 'rb') as f:
+                    digest = hashlib.file_digest(f, 'sha256').hexdigest()
+            snapshot = _publish(path, df, digest, source_path, previous, delta)
+        else:
+            snapshot = None
+
+    if snapshot is None:
+        os.remove(source_path)
+        return publish_catalog(df, path)
+    _run_publish_hooks(snapshot)
+    return snapshot
+
+
+def update_stock(feed, path=CSV_FILE_PATH):
+    """Aplicar un feed parcial Codigo,Stock sobre el catálogo publicado
+
+    Solo cambia la columna Stock de las filas afectadas; descripciones y
+    familias no se tocan: los índices de código y familia pasan a la nueva
+    instantánea y el de búsqueda solo recalcula las filas cambiadas.
+    Devuelve (instantánea vigente, delta, nº de códigos del feed que no existen).
+    """
+    if get_catalog(path) is None:
+        raise ValueError("No hay catálogo publicado sobre el que aplicar el feed de stock")
+
+    with _lock:
+        previous = _snapshots[path]
+        delta, df, unknown = catalog_delta.stock_delta(previous.df, feed, previous.version)
+        if delta.is_empty:
+            return previous, delta, unknown
+
+        data = df.to_csv(index=False).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+
+        def write_csv(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+
+        # Las columnas ya tienen los tipos del esquema: no hace falta volver a parsear el CSV
+        snapshot = _publish(path, df, digest, write_csv, previous, delta)
+
+    _run_publish_hooks(snapshot)
+    return snapshot, delta, unknown
+
+
+def _run_publish_hooks(snapshot):
+    # Fuera del lock: los lectores ya ven la nueva instantánea mientras se preparan sus índices
+    for hook in list(_publish_hooks):
+        try:
+            hook(snapshot)
+        except Exception as e:
+            print(f"Error preparando instantánea publicada: {str(e)}")
+
+
+def register_publish_hook(hook):
+    """Registrar una función que se ejecuta tras cada publish_catalog()"""
+    if hook not in _publish_hooks:
+        _publish_hooks.append(hook)
+
+
+def register_derived_updater(updater):
+    """Registrar updater(clave, valor, delta, df) -> valor para la nueva instantánea o None
+
+    Solo se llama cuando la nueva instantánea conserva las filas de la anterior
+    (delta.same_rows): las posiciones siguen valiendo y el updater puede
+    devolver la estructura tal cual o actualizar solo las filas cambiadas.
+    Con None la estructura se vuelve a construir cuando se pida.
+    """
+    if updater not in _derived_updaters:
+        _derived_updaters.append(updater)
+
+
+def invalidate_catalog(path=CSV_FILE_PATH):
+    """Descartar la instantánea en memoria para forzar la recarga"""
+    with _lock:
+        _snapshots.pop(path, None)
+
+
+def snapshot_for(df):
+    """Encontrar la instantánea publicada a la que pertenece un DataFrame"""
+    for snapshot in list(_snapshots.values()):
+        if snapshot.df is df:
+            return snapshot
+    return None
@@ -0,0 +1,216 @@
+"""
+Diferencias entre un catálogo nuevo y la instantánea vigente, por clave Codigo
+El cálculo es vectorizado (un get_indexer sobre la clave y comparaciones por
+columna) y el resultado conserva el orden de filas de la instantánea: las filas
+que siguen existiendo mantienen su posición salvo por las eliminadas y las
+nuevas van al final. Así, si solo cambia el stock, las posiciones no se mueven
+y los índices de la instantánea anterior se actualizan solo en las filas cambiadas.
+"""
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Con catálogos unidos desde varias fuentes la clave incluye proveedor y almacén
+KEY_COLUMNS = ['Codigo', 'Proveedor', 'Almacen']
+CHANGE_LOG_NAME = "changes.jsonl"
+CHANGE_LOG_MAX_BYTES = 5 * 1024 * 1024
+
+
+class CatalogDelta:
+    """Filas añadidas, eliminadas y modificadas de un catálogo respecto al anterior
+
+    Las posiciones de `stock_rows` y `text_rows` se refieren al catálogo
+    resultante (orden de la instantánea anterior + filas nuevas al final).
+    """
+
+    def __init__(self, key_columns, order, kept, added, removed, stock_rows, text_rows, base_version=None):
+        self.key_columns = key_columns
+        self.order = order  # posiciones del catálogo nuevo en el orden resultante
+        self.kept = kept  # posiciones conservadas de la instantánea anterior, en orden
+        self.added = added  # posiciones en el catálogo nuevo
+        self.removed = removed  # posiciones en la instantánea anterior
+        self.stock_rows = stock_rows
+        self.text_rows = text_rows
+        self.base_version = base_version
+
+    @property
+    def is_empty(self):
+        return not (len(self.added) or len(self.removed) or len(self.stock_rows) or len(self.text_rows))
+
+    @property
+    def same_rows(self):
+        """True si no hay altas ni bajas: las posiciones de la instantánea anterior siguen valiendo"""
+        return not (len(self.added) or len(self.removed))
+
+    @property
+    def stock_only(self):
+        return self.same_rows and not len(self.text_rows)
+
+    @property
+    def in_order(self):
+        """True si el orden resultante es el del catálogo nuevo (su CSV se puede publicar tal cual)"""
+        return bool(np.array_equal(self.order, np.arange(len(self.order))))
+
+    def apply(self, new_df):
+        """Catálogo nuevo en el orden estable de la instantánea anterior"""
+        if self.in_order:
+            return new_df
+        return new_df.iloc[self.order].reset_index(drop=True)
+
+    def summary(self):
+        return {
+            'added': int(len(self.added)),
+            'removed': int(len(self.removed)),
+            'stock': int(len(self.stock_rows)),
+            'text': int(len(self.text_rows)),
+        }
+
+
+def _keys(df, key_columns):
+    if len(key_columns) == 1:
+        return pd.Index(df[key_columns[0]])
+    return pd.MultiIndex.from_arrays([df[column] for column in key_columns])
+
+
+def _equal_values(a, b):
+    """Comparación posición a posición donde dos nulos cuentan como iguales"""
+    if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+        # Se comparan códigos: los de b se traducen a las categorías de a (-2 = categoría nueva)
+        a_codes = a.cat.codes.to_numpy()
+        b_codes = b.cat.codes.to_numpy()
+        mapping = np.append(a.cat.categories.get_indexer(b.cat.categories), -1)
+        b_in_a = np.where(mapping == -1, -2, mapping)[b_codes]
+        b_in_a[b_codes == -1] = -1
+        return a_codes == b_in_a
+    equal = pd.array(a.array == b.array, dtype='boolean').fillna(False).to_numpy(dtype=bool)
+    return equal | (a.isna().to_numpy() & b.isna().to_numpy())
+
+
+def diff_catalog(old_df, new_df, base_version=None):
+    """Diferencias de new_df respecto a old_df, o None si no se pueden calcular por clave
+
+    Devuelve None si las columnas no coinciden o la clave está repetida; en ese
+    caso el catálogo se publica completo.
+    """
+    if list(old_df.columns) != list(new_df.columns) or 'Codigo' not in new_df.columns:
+        return None
+    key_columns = [column for column in KEY_COLUMNS if column in new_df.columns]
+    old_keys = _keys(old_df, key_columns)
+    new_keys = _keys(new_df, key_columns)
+    if not (old_keys.is_unique and new_keys.is_unique):
+        return None
+
+    new_in_old = old_keys.get_indexer(new_keys)
+    added = np.flatnonzero(new_in_old < 0)
+    old_to_new = np.full(len(old_df), -1, dtype=np.int64)
+    matched = new_in_old >= 0
+    old_to_new[new_in_old[matched]] = np.flatnonzero(matched)
+    kept = np.flatnonzero(old_to_new >= 0)
+    removed = np.flatnonzero(old_to_new < 0)
+    new_rows = old_to_new[kept]
+    order = np.concatenate([new_rows, added])
+
+    value_columns = [column for column in new_df.columns if column not in key_columns]
+    changed = {}
+    for column in value_columns:
+        changed[column] = ~_equal_values(old_df[column].iloc[kept], new_df[column].iloc[new_rows])
+    stock_changed = changed.pop('Stock', np.zeros(len(kept), dtype=bool))
+    text_changed = np.logical_or.reduce(list(changed.values())) if changed else np.zeros(len(kept), dtype=bool)
+
+    # Las filas conservadas ocupan las primeras posiciones del resultado, en su orden
+    return CatalogDelta(
+        key_columns, order, kept, added, removed,
+        np.flatnonzero(stock_changed), np.flatnonzero(text_changed), base_version
+    )
+
+
+def stock_delta(old_df, feed, base_version=None):
+    """Aplicar un feed parcial (clave + Stock) sobre old_df con un join indexado por clave
+
+    Devuelve (delta, catálogo con el stock actualizado, nº de claves del feed
+    que no existen en el catálogo). Las demás columnas no se tocan ni se comparan.
+    """
+    key_columns = [column for column in KEY_COLUMNS if column in old_df.columns]
+    missing = [column for column in key_columns + ['Stock'] if column not in feed.columns]
+    if missing:
+        raise ValueError(f"El feed de stock debe incluir las columnas: {', '.join(missing)}")
+    old_keys = _keys(old_df, key_columns)
+    if not old_keys.is_unique:
+        raise ValueError(f"Claves repetidas en el catálogo: el feed no se puede aplicar por {', '.join(key_columns)}")
+
+    feed = feed.drop_duplicates(subset=key_columns, keep='last')
+    positions = old_keys.get_indexer(_keys(feed, key_columns))
+    found = positions >= 0
+    positions = positions[found]
+    values = feed['Stock'].iloc[found].astype(old_df['Stock'].dtype)
+    changed = ~_equal_values(old_df['Stock'].iloc[positions], values)
+    rows = positions[changed]
+    order = np.argsort(rows)
+
+    stock = old_df['Stock'].array.copy()
+    stock[rows[order]] = values.array[np.flatnonzero(changed)[order]]
+    new_df = old_df.copy(deep=False)
+    new_df['Stock'] = stock
+
+    all_rows = np.arange(len(old_df))
+    empty = np.array([], dtype=np.int64)
+    delta = CatalogDelta(key_columns, all_rows, all_rows, empty, empty, rows[order], empty, base_version)
+    return delta, new_df, int((~found).sum())
+
+
+def _labels(df, rows, key_columns):
+    """Clave legible de cada fila (Codigo, o Codigo|Proveedor|Almacen)"""
+    if not len(rows):
+        return []
+    values = [df[column].iloc[rows].astype(object).where(lambda s: s.notna(), "").astype(str) for column in key_columns]
+    labels = values[0]
+    for column_values in values[1:]:
+        labels = labels + "|" + column_values.to_numpy()
+    return labels.tolist()
+
+
+def _stock_value(value):
+    return None if pd.isna(value) else int(value)
+
+
+def record_change(delta, old_df, result_df, path, digest_from, digest_to):
+    """Añadir el registro compacto del cambio a changes.jsonl junto al catálogo
+
+    `result_df` es el catálogo ya publicado, en el orden de delta.apply().
+    """
+    stock_rows = delta.stock_rows
+    record = {
+        'at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'from': digest_from,
+        'to': digest_to,
+        'added': _labels(result_df, np.arange(len(delta.kept), len(result_df)), delta.key_columns),
+        'removed': _labels(old_df, delta.removed, delta.key_columns),
+        'stock': [
+            [label, _stock_value(old), _stock_value(new)]
+            for label, old, new in zip(
+                _labels(result_df, stock_rows, delta.key_columns),
+                old_df['Stock'].iloc[delta.kept[stock_rows]],
+                result_df['Stock'].iloc[stock_rows]
+            )
+        ],
+        'text': _labels(result_df, delta.text_rows, delta.key_columns),
+    }
+    log_path = os.path.join(os.path.dirname(path) or ".", CHANGE_LOG_NAME)
+    if os.path.exists(log_path) and os.path.getsize(log_path) > CHANGE_LOG_MAX_BYTES:
+        os.replace(log_path, log_path + ".1")
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record
+
+
+def read_changes(path, limit=20):
+    """Últimos registros de cambios del catálogo, del más reciente al más antiguo"""
+    log_path = os.path.join(os.path.dirname(path) or ".", CHANGE_LOG_NAME)
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()[-limit:]
+    return [json.loads(line) for line in reversed(lines)]
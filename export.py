@@ -0,0 +1,194 @@
+"""
+Exportación de resultados de búsqueda bajo demanda
+El archivo solo se genera cuando el usuario lo pide, en un hilo aparte, y se
+escribe por bloques de filas a un archivo temporal a partir de las posiciones
+del resultado: nunca se copia el DataFrame completo ni se serializa en memoria.
+Los archivos van a EXPORT_DIR y se borran al descartar la exportación, cuando
+la sesión que la pidió desaparece o, si el proceso cayó, al arrancar el siguiente.
+"""
+import os
+import gzip
+import time
+import weakref
+import tempfile
+import threading
+
+import catalog
+from search import sort_rows
+
+# pyarrow y openpyxl son opcionales: sin ellos no se ofrecen Parquet / XLSX
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+try:
+    from openpyxl import Workbook
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+EXPORT_CHUNK_ROWS = 50_000
+XLSX_MAX_ROWS = 1_048_575  # límite de filas de una hoja de Excel, sin la cabecera
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "inventario_exports")
+STALE_EXPORT_SECONDS = 24 * 3600
+
+# Formato -> (extensión, tipo MIME)
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "CSV comprimido (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel (XLSX)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def available_formats():
+    """Formatos que se pueden generar con las dependencias instaladas"""
+    formats = ["CSV", "CSV comprimido (gzip)"]
+    if ARROW_AVAILABLE:
+        formats.append("Parquet")
+    if OPENPYXL_AVAILABLE:
+        formats.append("Excel (XLSX)")
+    return formats
+
+
+def _chunks(df, rows):
+    """Bloques del resultado; solo se materializan EXPORT_CHUNK_ROWS filas a la vez"""
+    for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+        yield df.iloc[rows[start:start + EXPORT_CHUNK_ROWS]]
+
+
+def _write_csv(df, rows, f):
+    f.write(df.iloc[:0].to_csv(index=False).encode('utf-8'))
+    for chunk in _chunks(df, rows):
+        f.write(chunk.to_csv(index=False, header=False).encode('utf-8'))
+
+
+def _write_parquet(df, rows, path):
+    schema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    # Una columna object vacía se infiere como null; sin el esquema del catálogo es texto
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(df, rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _write_xlsx(df, rows, path):
+    if len(rows) > XLSX_MAX_ROWS:
+        raise ValueError(f"Excel admite como máximo {XLSX_MAX_ROWS} filas; use CSV o Parquet")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Stock")
+    sheet.append(list(df.columns))
+    for chunk in _chunks(df, rows):
+        for values in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False):
+            sheet.append(list(values))
+    workbook.save(path)
+
+
+def write_export(df, rows, export_format, path):
+    """Escribir las filas `rows` de `df` en `path` con el formato indicado"""
+    if export_format == "CSV":
+        with open(path, 'wb') as f:
+            _write_csv(df, rows, f)
+    elif export_format == "CSV comprimido (gzip)":
+        with gzip.open(path, 'wb', compresslevel=6) as f:
+            _write_csv(df, rows, f)
+    elif export_format == "Parquet":
+        _write_parquet(df, rows, path)
+    elif export_format == "Excel (XLSX)":
+        _write_xlsx(df, rows, path)
+    else:
+        raise ValueError(f"Formato de exportación no soportado: {export_format}")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def cleanup_exports(max_age=STALE_EXPORT_SECONDS):
+    """Borrar exportaciones abandonadas (procesos caídos) más antiguas que max_age; devuelve cuántas"""
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass  # otro proceso la borró antes
+    return removed
+
+
+class ExportJob:
+    """Exportación que se genera en un hilo en segundo plano hacia un archivo temporal"""
+
+    def __init__(self, df, rows, export_format, search_term, file_prefix="stock_productos", fuzzy=False,
+                 sort=(None, False)):
+        extension, self.mime = EXPORT_FORMATS[export_format]
+        self.df = df
+        self.rows = rows
+        self.export_format = export_format
+        self.search_term = search_term
+        self.fuzzy = fuzzy
+        self.sort = sort  # (columna, descendente) elegidos en la vista; None conserva el orden del catálogo
+        self.file_name = f"{file_prefix}.{extension}"
+        self.error = None
+        self._content = None
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(suffix=f".{extension}", prefix="export_", dir=EXPORT_DIR)
+        os.close(fd)
+        # El archivo se borra cuando la exportación deja de estar referenciada (sesión cerrada)
+        self._finalizer = weakref.finalize(self, _remove, self.path)
+        self._thread = threading.Thread(target=self._run, name="export_worker", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            # Mismo orden que la vista de resultados; se calcula aquí para no frenar la página
+            rows = sort_rows(self.df, self.rows, *self.sort)
+            catalog.atomic_write(self.path, lambda tmp: write_export(self.df, rows, self.export_format, tmp))
+        except Exception as e:
+            self.error = str(e)
+
+    def matches(self, df, export_format, search_term, fuzzy=False, sort=(None, False)):
+        """True si la exportación corresponde al resultado, orden y formato actuales"""
+        return (self.df is df and self.export_format == export_format
+                and self.search_term == search_term and self.fuzzy == fuzzy
+                and tuple(self.sort) == tuple(sort))
+
+    def wait(self, timeout=None):
+        """Esperar a que termine como máximo `timeout` segundos; True si ya terminó"""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    @property
+    def done(self):
+        return not self._thread.is_alive()
+
+    def read(self):
+        """Contenido del archivo generado; se lee del disco una vez y se reutiliza en cada ejecución"""
+        if self._content is None:
+            with open(self.path, 'rb') as f:
+                self._content = f.read()
+        return self._content
+
+    def discard(self):
+        """Borrar el archivo temporal (cuando la espera termina)"""
+        def remove():
+            self._thread.join()
+            self._finalizer()
+        self._content = None
+        threading.Thread(target=remove, daemon=True).start()
+
+
+# Exportaciones que dejó un proceso anterior sin borrar
+cleanup_exports()
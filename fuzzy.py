@@ -0,0 +1,275 @@
+"""
+Búsqueda tolerante a errores de escritura
+Índice de borrado simétrico (estilo SymSpell) sobre las palabras normalizadas
+de Descripcion y Familia: cada palabra del vocabulario se registra bajo todas
+las variantes que resultan de borrarle hasta MAX_EDIT_DISTANCE letras, y una
+consulta solo compara su distancia con las palabras que comparten variante.
+El vocabulario es mucho más pequeño que el catálogo, así que una sugerencia
+cuesta lo mismo con 5.000 que con 1.000.000 de filas.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+import catalog
+import search
+from search import ARROW_AVAILABLE, normalize_text, parse_query, QUERY_TOKEN
+
+if ARROW_AVAILABLE:
+    import pyarrow.compute as pc
+
+# Distancia máxima de edición; las palabras cortas admiten menos errores para
+# que "sal" no se convierta en "sol", "gel" o "pal"
+MAX_EDIT_DISTANCE = 2
+SHORT_WORD_LENGTH = 4
+MIN_WORD_LENGTH = 3
+
+FUZZY_COLUMNS = ['Descripcion', 'Familia']
+WORD_SPLIT_ARROW = r'[^\p{L}\p{N}]+'
+WORD_SPLIT = re.compile(r'[\W_]+')
+HAS_LETTER = re.compile(r'[^\W\d_]')
+
+
+def max_distance_for(word):
+    """Errores admitidos según la longitud de la palabra"""
+    if len(word) < MIN_WORD_LENGTH:
+        return 0
+    return 1 if len(word) <= SHORT_WORD_LENGTH else MAX_EDIT_DISTANCE
+
+
+def edit_distance(a, b, limit=MAX_EDIT_DISTANCE):
+    """Distancia de Damerau-Levenshtein (transposiciones contiguas); limit + 1 si la supera"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous_row, row = previous_row, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return min(row[-1], limit + 1)
+
+
+def _deletes(word, distance):
+    """Todas las variantes de la palabra con hasta `distance` letras borradas"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+def _word_rows(df):
+    """Palabras normalizadas de las columnas de texto y la fila de cada aparición
+
+    Devuelve (vocabulario, ids de palabra, filas): cada aparición de una palabra
+    en una fila es un par (ids[i], filas[i]), con ids referidos al vocabulario.
+    """
+    vocabulary = {}
+    ids = []
+    rows = []
+
+    def word_ids(words):
+        return np.fromiter((vocabulary.setdefault(word, len(vocabulary)) for word in words), np.int64, len(words))
+
+    for column in [column for column in FUZZY_COLUMNS if column in df.columns]:
+        series = df[column]
+        if hasattr(series, 'cat'):
+            # Columna categórica: se tokeniza cada categoría y se asigna a sus filas
+            codes = series.cat.codes.to_numpy()
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(series.cat.categories) + 1))
+            for code, value in enumerate(series.cat.categories):
+                category_rows = order[bounds[code]:bounds[code + 1]]
+                for word_id in word_ids(WORD_SPLIT.split(normalize_text(value))):
+                    ids.append(np.full(len(category_rows), word_id, dtype=np.int64))
+                    rows.append(category_rows)
+        elif ARROW_AVAILABLE:
+            for start in range(0, len(series), search.TrigramIndex.BUILD_CHUNK_ROWS):
+                chunk = series.iloc[start:start + search.TrigramIndex.BUILD_CHUNK_ROWS]
+                lists = pc.split_pattern_regex(search._normalize_column_arrow(chunk), WORD_SPLIT_ARROW)
+                # Cada bloque se codifica con su propio diccionario (pocas palabras distintas)
+                encoded = pc.dictionary_encode(pc.list_flatten(lists))
+                ids.append(word_ids(encoded.dictionary.to_pylist())[encoded.indices.to_numpy(zero_copy_only=False)])
+                rows.append(pc.list_parent_indices(lists).to_numpy(zero_copy_only=False) + start)
+        else:
+            for row, text in enumerate(search._normalize_column(series)):
+                words = WORD_SPLIT.split(text)
+                ids.append(word_ids(words))
+                rows.append(np.full(len(words), row, dtype=np.int64))
+
+    words = list(vocabulary)
+    if not ids:
+        return words, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return words, np.concatenate(ids), np.concatenate(rows).astype(np.int64)
+
+
+class FuzzyIndex:
+    """Vocabulario del catálogo indexado por borrados simétricos
+
+    Guarda además, para cada palabra, la lista ordenada de filas donde aparece:
+    las palabras sugeridas (y las que las contienen) se traducen a filas sin
+    recorrer el texto del catálogo.
+    """
+
+    def __init__(self, df):
+        words, word_ids, word_rows = _word_rows(df)
+        occurrences = np.bincount(word_ids, minlength=len(words))
+        valid = [
+            word_id for word_id, word in enumerate(words)
+            if len(word) >= MIN_WORD_LENGTH and HAS_LETTER.search(word)
+        ]
+        valid.sort(key=words.__getitem__)
+        self.words = [words[word_id] for word_id in valid]
+        self.counts = occurrences[valid].astype(np.int64)
+        self.known = set(self.words)
+        self._vocabulary = search._normalize_codes(pd.Series(self.words, dtype=object))
+
+        # Listas de filas por palabra (CSR): pares (palabra, fila) únicos y ordenados
+        remap = np.full(len(words), -1, dtype=np.int64)
+        remap[valid] = np.arange(len(valid))
+        word_ids = remap[word_ids]
+        keep = word_ids >= 0
+        pairs = search._sorted_unique((word_ids[keep] << 32) | word_rows[keep])
+        self.size = len(df)
+        self.rows = (pairs & 0xFFFFFFFF).astype(np.int32)
+        self.offsets = np.searchsorted(pairs >> 32, np.arange(len(self.words) + 1)).astype(np.int64)
+
+        self._deletes = {}
+        for word_id, word in enumerate(self.words):
+            for variant in _deletes(word, MAX_EDIT_DISTANCE):
+                self._deletes.setdefault(variant, []).append(word_id)
+
+    def containing(self, words):
+        """Ids de las palabras del vocabulario que contienen alguna de `words`"""
+        ids = [search._contains(self._vocabulary, word) for word in words]
+        return np.unique(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int64)
+
+    def mark_rows(self, word_ids, mask):
+        """Marcar en `mask` las filas donde aparece alguna de las palabras"""
+        for word_id in word_ids:
+            mask[self.rows[self.offsets[word_id]:self.offsets[word_id + 1]]] = True
+        return mask
+
+    def suggest(self, term, limit=5):
+        """Palabras del catálogo a distancia <= max_distance_for(term), de más a menos parecida
+
+        Devuelve [(palabra, distancia, frecuencia)], incluida la propia palabra si existe.
+        """
+        max_distance = max_distance_for(term)
+        if max_distance == 0:
+            return []
+        candidates = set()
+        for variant in _deletes(term, max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+
+        suggestions = []
+        for word_id in candidates:
+            word = self.words[word_id]
+            distance = edit_distance(term, word, max_distance)
+            if distance <= max_distance:
+                suggestions.append((word, distance, int(self.counts[word_id])))
+        suggestions.sort(key=lambda item: (item[1], -item[2], item[0]))
+        return suggestions[:limit]
+
+
+def get_fuzzy_index(df):
+    """Índice de palabras de un DataFrame; se reutiliza si es la instantánea publicada"""
+    return search._snapshot_derived(df, 'fuzzy_index', FuzzyIndex)
+
+
+def suggest_queries(df, search_term, limit=3):
+    """Consultas corregidas, de la más probable a la menos
+
+    Solo se corrigen las palabras sueltas que no existen en el catálogo; los
+    filtros (familia:, stock<...) y las frases entre comillas se conservan.
+    """
+    index = get_fuzzy_index(df)
+    parts = []
+    alternatives = []
+    for match in QUERY_TOKEN.finditer(search_term or ""):
+        word = normalize_text(match.group('term') or "")
+        if word and word not in index.known:
+            options = [(suggestion, distance) for suggestion, distance, _ in index.suggest(word, limit)]
+            options = [option for option in options if option[1] > 0]
+            if options:
+                parts.append(len(alternatives))
+                alternatives.append(options)
+                continue
+        parts.append(match.group(0))
+    if not alternatives:
+        return []
+
+    # La mejor corrección de cada palabra, y para la primera palabra corregida
+    # también sus siguientes alternativas
+    queries = []
+    for option_index in range(len(alternatives[0])):
+        choice = [options[0][0] for options in alternatives]
+        choice[0] = alternatives[0][option_index][0]
+        queries.append(" ".join(choice[part] if isinstance(part, int) else part for part in parts))
+    return queries[:limit]
+
+
+def fuzzy_rows(df, search_term):
+    """Posiciones de las filas que coinciden admitiendo errores en cada palabra
+
+    Cada palabra suelta coincide con ella misma (como subcadena) o con cualquier
+    palabra completa del catálogo a distancia admitida; el resto de la consulta
+    se aplica tal cual.
+    """
+    plan = parse_query(search_term)
+    index = search.get_search_index(df)
+    fuzzy_index = get_fuzzy_index(df)
+
+    strict_plan = search.QueryPlan()
+    strict_plan.families, strict_plan.codes = plan.families, plan.codes
+    strict_plan.stock_ranges = plan.stock_ranges
+    row_sets = []
+    for term in plan.terms:
+        if " " in term.strip():
+            strict_plan.terms.append(term)  # frase entre comillas: sin tolerancia
+            continue
+        # El término y las palabras parecidas: filas de las palabras del vocabulario que los contienen
+        words = [term] + [word for word, _, _ in fuzzy_index.suggest(term, limit=20)]
+        mask = fuzzy_index.mark_rows(fuzzy_index.containing(words), np.zeros(index.size, dtype=bool))
+        # El término como subcadena en el resto del texto (código, stock): solo filas aún sin marcar
+        candidates = index.trigrams.candidates(term)
+        if candidates is None:
+            mask[index.scan(term)] = True
+        else:
+            candidates = candidates[~mask[candidates]]
+            if len(candidates):
+                mask[index.scan(term, candidates)] = True
+        row_sets.append(np.flatnonzero(mask))
+
+    if strict_plan.terms or strict_plan.families or strict_plan.codes or strict_plan.stock_ranges or not row_sets:
+        row_sets.append(search.execute_query(df, strict_plan))
+    return search._intersect(row_sets)
+
+
+def search_fuzzy_rows(df, search_term):
+    """fuzzy_rows() a través de la caché de resultados compartida de search"""
+    snapshot = catalog.snapshot_for(df)
+    if snapshot is None:
+        return fuzzy_rows(df, search_term)
+    query = "~" + normalize_text(search_term or "").strip()
+    return search.query_cache.get(snapshot, query, lambda: fuzzy_rows(df, search_term))
+
+
+def _update_derived(key, value, delta, df):
+    """El vocabulario sigue valiendo si no cambió ningún texto"""
+    if key == 'fuzzy_index' and not len(delta.text_rows):
+        return value
+    return None
+
+
+# El vocabulario se prepara al publicar, igual que el índice de búsqueda
+catalog.register_derived_updater(_update_derived)
+catalog.register_publish_hook(lambda snapshot: snapshot.derived('fuzzy_index', lambda snapshot: FuzzyIndex(snapshot.df)))
@@ -0,0 +1,330 @@
+"""
+Ingesta concurrente de varias fuentes de stock (SFTP, FTP, HTTP)
+Las fuentes se declaran en la lista `sources` de data/config.json:
+
+    {"name": "central", "type": "sftp", "proveedor": "Lucero", "almacen": "Central",
+     "host": "...", "port": 22, "user": "...", "password": "...", "file_path": "/stock/stock.csv"}
+    {"name": "norte", "type": "ftp", "host": "...", "user": "...", "password": "...", "file_path": "stock.csv"}
+    {"name": "proveedor_x", "type": "http", "url": "https://.../stock.csv", "timeout": 15}
+
+Cada fuente se descarga y se valida en su propio hilo con su propio plazo. La
+última copia válida de cada fuente se guarda en data/sources/, de modo que una
+fuente lenta o caída no bloquea a las demás: se usa su copia anterior. El
+catálogo publicado es la unión de todas con las columnas Proveedor y Almacen.
+
+Además, `stock_feed` declara un feed parcial `Codigo,Stock` que se consulta cada
+`interval_minutes` y solo actualiza el stock del catálogo publicado:
+
+    {"enabled": true, "type": "sftp", "file_path": "/stock/stock_parcial.csv", "interval_minutes": 5}
+
+Los datos de conexión que falten se toman de `sftp_config`.
+"""
+import os
+import re
+import time
+import ftplib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import catalog
+import sftp_pool
+
+SOURCES_DIR = "data/sources"
+DEFAULT_SOURCE_TIMEOUT = 30
+MAX_WORKERS = 8
+SOURCE_COLUMNS = ['Proveedor', 'Almacen']
+STOCK_FEED_COLUMNS = ['Codigo', 'Stock']
+STOCK_FEED_PATH = os.path.join(SOURCES_DIR, "stock_feed.csv")
+DEFAULT_STOCK_FEED_MINUTES = 5
+
+
+class SourceResult:
+    """Resultado de una fuente: su DataFrame validado y cómo se obtuvo"""
+
+    def __init__(self, source, status, message, df=None, fetch=None, seconds=0.0):
+        self.source = source
+        self.status = status  # 'updated', 'unchanged', 'stale' (copia anterior) o 'failed'
+        self.message = message
+        self.df = df
+        self.fetch = fetch
+        self.seconds = seconds
+
+    @property
+    def name(self):
+        return self.source['name']
+
+    def summary(self):
+        """Fila para la tabla de estado del panel de administración"""
+        return {
+            'Fuente': self.name,
+            'Tipo': self.source.get('type', 'sftp').upper(),
+            'Estado': self.status,
+            'Productos': len(self.df) if self.df is not None else 0,
+            'Segundos': round(self.seconds, 2),
+            'Mensaje': self.message,
+        }
+
+
+def cache_path(source):
+    """Última copia válida de la fuente en disco"""
+    slug = re.sub(r'[^\w-]+', '_', source['name']).strip('_') or 'fuente'
+    return os.path.join(SOURCES_DIR, f"{slug}.csv")
+
+
+def _fetch_sftp(source, last_fetch, path, timeout):
+    return sftp_pool.download_if_changed(
+        source['host'], source.get('port', 22), source['user'], source['password'],
+        source['file_path'], last_fetch, local_path=path, timeout=timeout
+    )
+
+
+def _fetch_ftp(source, last_fetch, path, timeout):
+    ftp = ftplib.FTP()
+    try:
+        ftp.connect(source['host'], source.get('port', 21), timeout=timeout)
+        ftp.set_pasv(source.get('passive', True))
+        ftp.login(source['user'], source['password'])
+        connection = ftp.transfercmd(f"RETR {source['file_path']}")
+        with connection, connection.makefile('rb') as remote_file:
+            tmp_path, digest = catalog.spool_to_file(remote_file, path)
+        ftp.voidresp()
+    finally:
+        ftp.close()
+    return tmp_path, {
+        'source': f"ftp://{source['host']}{source['file_path']}",
+        'size': os.path.getsize(tmp_path),
+        'sha256': digest,
+    }
+
+
+def _fetch_http(source, last_fetch, path, timeout):
+    with urllib.request.urlopen(source['url'], timeout=timeout) as response:
+        tmp_path, digest = catalog.spool_to_file(response, path)
+    return tmp_path, {'source': source['url'], 'size': os.path.getsize(tmp_path), 'sha256': digest}
+
+
+FETCHERS = {
+    'sftp': _fetch_sftp,
+    'ftp': _fetch_ftp,
+    'http': _fetch_http,
+    'https': _fetch_http,
+}
+
+
+def _validate(df):
+    missing = set(catalog.REQUIRED_COLUMNS) - set(df.columns)
+    if missing:
+        raise ValueError(f"Columnas faltantes: {', '.join(sorted(missing))}")
+    if len(df) == 0:
+        raise ValueError("El archivo está vacío")
+    return df[catalog.REQUIRED_COLUMNS]
+
+
+def _read_cached(source):
+    df, _ = catalog.read_catalog_file(cache_path(source))
+    return _validate(df)
+
+
+def fetch_source(source, last_fetch=None):
+    """Descargar y validar una fuente (se ejecuta en un hilo del pool)"""
+    start = time.perf_counter()
+    path = cache_path(source)
+    has_cache = os.path.exists(path)
+    timeout = source.get('timeout', DEFAULT_SOURCE_TIMEOUT)
+    try:
+        fetcher = FETCHERS[source.get('type', 'sftp')]
+        tmp_path, fetch = fetcher(source, last_fetch if has_cache else None, path, timeout)
+        if tmp_path is not None and has_cache and fetch.get('sha256') == (last_fetch or {}).get('sha256'):
+            os.remove(tmp_path)
+            tmp_path = None
+
+        if tmp_path is None:
+            return SourceResult(source, 'unchanged', "Sin cambios", _read_cached(source), fetch,
+                                time.perf_counter() - start)
+        try:
+            df, _ = catalog.read_catalog_file(tmp_path)
+            df = _validate(df)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return SourceResult(source, 'updated', "Actualizada", df, fetch, time.perf_counter() - start)
+    except Exception as e:
+        return _fallback(source, f"{type(e).__name__}: {str(e)}", time.perf_counter() - start)
+
+
+def _fallback(source, message, seconds):
+    """Resultado de una fuente que falló: su última copia válida si existe"""
+    if os.path.exists(cache_path(source)):
+        try:
+            return SourceResult(source, 'stale', f"{message} (se usa la copia anterior)",
+                                _read_cached(source), seconds=seconds)
+        except Exception as e:
+            message = f"{message}; copia anterior ilegible: {str(e)}"
+    return SourceResult(source, 'failed', message, seconds=seconds)
+
+
+def fetch_all(sources, last_fetches=None):
+    """Descargar todas las fuentes habilitadas en paralelo; cada una con su propio plazo"""
+    sources = [source for source in sources if source.get('enabled', True)]
+    if not sources:
+        return []
+    last_fetches = last_fetches or {}
+    os.makedirs(SOURCES_DIR, exist_ok=True)
+
+    executor = ThreadPoolExecutor(max_workers=min(len(sources), MAX_WORKERS), thread_name_prefix="ingest")
+    start = time.monotonic()
+    futures = [
+        executor.submit(fetch_source, source, last_fetches.get(source['name']))
+        for source in sources
+    ]
+    results = []
+    for source, future in zip(sources, futures):
+        # El plazo de cada fuente cuenta desde el inicio, no desde que terminó la anterior
+        timeout = source.get('timeout', DEFAULT_SOURCE_TIMEOUT)
+        remaining = max(0.0, start + timeout - time.monotonic())
+        try:
+            results.append(future.result(timeout=remaining))
+        except Exception:
+            future.cancel()
+            results.append(_fallback(source, f"Sin respuesta en {timeout}s", time.monotonic() - start))
+    # Las fuentes que no respondieron terminan en segundo plano sin bloquear la ingesta
+    executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def merge_results(results):
+    """Unir las fuentes en un único catálogo con las columnas Proveedor y Almacen"""
+    frames = []
+    for result in results:
+        if result.df is None:
+            continue
+        df = result.df.copy(deep=False)
+        df['Proveedor'] = result.source.get('proveedor', result.name)
+        df['Almacen'] = result.source.get('almacen', result.name)
+        frames.append(df)
+    if not frames:
+        return None
+    merged = pd.concat(frames, ignore_index=True)
+    # Las categorías de cada fuente son distintas: se unifican antes de aplicar el esquema
+    merged['Familia'] = merged['Familia'].astype(catalog.STRING_DTYPE)
+    return catalog.apply_catalog_schema(merged)
+
+
+def _fingerprint(results, last_fetches):
+    """Qué copia de cada fuente entra en el catálogo; si no cambia, no se vuelve a publicar"""
+    fingerprint = []
+    for result in results:
+        if result.df is None:
+            continue
+        fetch = result.fetch or last_fetches.get(result.name) or {}
+        fingerprint.append([
+            result.name, result.source.get('proveedor'), result.source.get('almacen'), fetch.get('sha256')
+        ])
+    return fingerprint
+
+
+def ingest_sources(config, path=catalog.CSV_FILE_PATH):
+    """Descargar, validar y publicar todas las fuentes de config['sources']
+
+    Actualiza en `config` las claves source_fetches (última descarga de cada
+    fuente) y last_ingest; guardar la configuración queda a cargo del llamador.
+    Devuelve (resultados por fuente, catálogo publicado o None si no hubo
+    cambios o ninguna fuente tiene datos).
+    """
+    last_fetches = config.get('source_fetches') or {}
+    results = fetch_all(config.get('sources') or [], last_fetches)
+
+    fetches = dict(last_fetches)
+    fetches.update({result.name: result.fetch for result in results if result.fetch})
+    config['source_fetches'] = fetches
+
+    fingerprint = _fingerprint(results, last_fetches)
+    if fingerprint == config.get('last_ingest') and os.path.exists(path):
+        return results, None
+    merged = merge_results(results)
+    if merged is None:
+        return results, None
+    catalog.publish_catalog(merged, path)
+    config['last_ingest'] = fingerprint
+    return results, merged
+
+
+def stock_feed_source(config):
+    """Feed parcial de stock de la configuración, completado con sftp_config; None si no está activo"""
+    feed = config.get('stock_feed') or {}
+    if not feed.get('enabled', False):
+        return None
+    source = {key: value for key, value in (config.get('sftp_config') or {}).items()
+              if key in ('host', 'port', 'user', 'password')}
+    source.update(feed)
+    source.setdefault('name', 'stock_feed')
+    return source
+
+
+def read_stock_feed(source):
+    """Leer un feed Codigo,Stock (ruta o archivo binario) con las columnas de fuente si las declara"""
+    df, _ = catalog.read_catalog_file(source)
+    missing = set(STOCK_FEED_COLUMNS) - set(df.columns)
+    if missing:
+        raise ValueError(f"Columnas faltantes en el feed de stock: {', '.join(sorted(missing))}")
+    return df
+
+
+def ingest_stock_feed(config, path=catalog.CSV_FILE_PATH):
+    """Descargar el feed parcial de stock y aplicarlo sobre el catálogo publicado
+
+    Actualiza config['stock_feed_fetch']; guardar la configuración queda a
+    cargo del llamador. Devuelve (delta aplicado o None si el archivo no
+    cambió, nº de códigos del feed que no están en el catálogo).
+    """
+    source = stock_feed_source(config)
+    if source is None:
+        raise ValueError("El feed de stock no está habilitado")
+    last_fetch = config.get('stock_feed_fetch')
+    os.makedirs(SOURCES_DIR, exist_ok=True)
+
+    fetcher = FETCHERS[source.get('type', 'sftp')]
+    tmp_path, fetch = fetcher(source, last_fetch, STOCK_FEED_PATH, source.get('timeout', DEFAULT_SOURCE_TIMEOUT))
+    if tmp_path is not None and fetch.get('sha256') == (last_fetch or {}).get('sha256'):
+        os.remove(tmp_path)
+        tmp_path = None
+    if tmp_path is None:
+        config['stock_feed_fetch'] = fetch
+        return None, 0
+
+    try:
+        feed = read_stock_feed(tmp_path)
+        # Con un catálogo de varias fuentes el feed se asigna a un proveedor y almacén
+        for column, key in zip(SOURCE_COLUMNS, ('proveedor', 'almacen')):
+            if key in source and column not in feed.columns:
+                feed[column] = source[key]
+        _, delta, unknown = catalog.update_stock(feed, path)
+        os.replace(tmp_path, STOCK_FEED_PATH)
+        # Solo se recuerda la descarga si se aplicó: si falla, se reintenta en la siguiente consulta
+        config['stock_feed_fetch'] = fetch
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return delta, unknown
+
+
+def poll_sftp(config):
+    """Comprobar con un stat si el archivo SFTP principal cambió desde el último sondeo
+
+    Devuelve (cambió, datos del stat para guardar en config['poll_stat'] cuando
+    la actualización termine bien). Sin fecha de modificación se considera cambiado.
+    """
+    sftp_config = config['sftp_config']
+    port = sftp_config.get('port', 22)
+    size, mtime = sftp_pool.stat_file(
+        sftp_config['host'], port, sftp_config['user'], sftp_config['password'], sftp_config['file_path']
+    )
+    stat = {
+        'source': sftp_pool.remote_source(sftp_config['host'], port, sftp_config['user'], sftp_config['file_path']),
+        'size': size,
+        'mtime': mtime,
+    }
+    return mtime is None or stat != config.get('poll_stat'), stat
@@ -0,0 +1,544 @@
+"""
+Programador de tareas por eventos para las actualizaciones automáticas
+Las tareas se guardan en un montículo ordenado por su próxima ejecución y el
+hilo del programador duerme exactamente hasta la primera; al añadir, quitar o
+cambiar tareas (p. ej. al guardar la configuración) se le despierta con una
+variable de condición. El estado se mantiene en memoria y solo se escribe a
+disco cuando cambia (tareas configuradas, inicio y fin de una ejecución).
+
+Disparadores:
+    CronTrigger("0 2 * * *")      expresión cron de 5 campos (minuto hora día mes día_semana)
+    IntervalTrigger(5 * 60)       cada N segundos
+    PollingTrigger(60, 30 * 60)   sondeo con espera adaptativa de noche y desfase aleatorio
+    OnDemandTrigger()             solo cuando se pide con run_at() (p. ej. desde el webhook)
+    parse_trigger("02:00")        "HH:MM" diario o expresión cron
+"""
+import os
+import json
+import time
+import heapq
+import random
+import itertools
+import threading
+from datetime import datetime, timedelta
+
+import catalog
+from job_store import missed_slot
+
+STATUS_FILE_PATH = "data/scheduler_status.json"
+
+# Sección `polling` de data/config.json: sondeo del archivo remoto cada pocos minutos
+POLLING_DEFAULTS = {
+    'enabled': False,
+    'interval_minutes': 1,
+    'night_max_minutes': 30,
+    'night_start': "22:00",
+    'night_end': "06:00",
+    'jitter_seconds': 20,
+}
+
+# (mínimo, máximo) de cada campo cron; en día de la semana 0 y 7 son domingo
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_cron_field(field, low, high):
+    """Valores permitidos de un campo cron: *, listas, rangos y pasos (*/15, 1-5, 0,30)"""
+    values = set()
+    for part in field.split(','):
+        expression, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if expression == '*':
+            start, end = low, high
+        elif '-' in expression:
+            start, end = (int(value) for value in expression.split('-', 1))
+        else:
+            start = int(expression)
+            end = high if step > 1 else start
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"Campo cron fuera de rango: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronTrigger:
+    """Disparador con expresión cron de 5 campos, en hora local"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"La expresión cron debe tener 5 campos: {expression}")
+        self.expression = " ".join(fields)
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        # cron usa 0 = domingo; datetime.weekday() usa 0 = lunes
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, dt):
+        in_days = dt.day in self.days
+        in_weekdays = dt.weekday() in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        # Como en cron, si se restringen ambos basta con que coincida uno
+        return in_days or in_weekdays
+
+    def next_after(self, dt):
+        """Primer minuto que cumple la expresión estrictamente posterior a dt"""
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt <= limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+            elif dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"La expresión cron nunca se cumple: {self.expression}")
+
+    def __eq__(self, other):
+        return isinstance(other, CronTrigger) and other.expression == self.expression
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+
+class IntervalTrigger:
+    """Disparador cada `seconds` segundos desde la ejecución anterior"""
+
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError("El intervalo debe ser positivo")
+        self.seconds = seconds
+
+    def next_after(self, dt):
+        return dt + timedelta(seconds=self.seconds)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalTrigger) and other.seconds == self.seconds
+
+    def __str__(self):
+        if self.seconds % 60 == 0:
+            return f"cada {self.seconds // 60} min"
+        return f"cada {self.seconds} s"
+
+
+class OnDemandTrigger:
+    """Sin ejecuciones programadas: la tarea solo se ejecuta cuando se pide con run_at() o run_now()"""
+
+    def next_after(self, dt):
+        return None
+
+    def __eq__(self, other):
+        return isinstance(other, OnDemandTrigger)
+
+    def __str__(self):
+        return "bajo demanda"
+
+
+def _parse_time(spec):
+    hour, minute = (int(value) for value in spec.split(':'))
+    return hour * 60 + minute
+
+
+class PollingTrigger:
+    """Sondeo cada `seconds` con espera adaptativa de noche y desfase aleatorio
+
+    Entre night_start y night_end el intervalo se duplica tras cada sondeo sin
+    cambios ('unchanged') hasta night_max_seconds, y vuelve al base en cuanto
+    hay un cambio o se hace de día. Cada ejecución se retrasa además un tiempo
+    aleatorio de hasta `jitter` segundos para que varios nodos no consulten al
+    proveedor en el mismo instante.
+    """
+
+    def __init__(self, seconds, night_max_seconds=None, night_start="22:00", night_end="06:00", jitter=0):
+        if seconds <= 0:
+            raise ValueError("El intervalo debe ser positivo")
+        self.seconds = seconds
+        self.night_max_seconds = night_max_seconds
+        self.night_start = night_start
+        self.night_end = night_end
+        self.jitter = jitter
+        self.idle_polls = 0
+        self._night = (_parse_time(night_start), _parse_time(night_end))
+
+    def is_night(self, dt):
+        minute = dt.hour * 60 + dt.minute
+        start, end = self._night
+        if start <= end:
+            return start <= minute < end
+        return minute >= start or minute < end
+
+    def interval(self, dt):
+        """Segundos hasta el próximo sondeo, sin el desfase aleatorio"""
+        if self.night_max_seconds and self.is_night(dt):
+            return max(self.seconds, min(self.seconds * 2 ** min(self.idle_polls, 16), self.night_max_seconds))
+        return self.seconds
+
+    @classmethod
+    def from_config(cls, polling):
+        """Disparador a partir de la sección `polling` de la configuración"""
+        polling = {**POLLING_DEFAULTS, **(polling or {})}
+        return cls(
+            polling['interval_minutes'] * 60,
+            polling['night_max_minutes'] * 60 if polling['night_max_minutes'] else None,
+            polling['night_start'],
+            polling['night_end'],
+            polling['jitter_seconds'],
+        )
+
+    def next_after(self, dt):
+        return dt + timedelta(seconds=self.interval(dt) + random.uniform(0, self.jitter))
+
+    def record(self, outcome):
+        self.idle_polls = self.idle_polls + 1 if outcome == 'unchanged' else 0
+
+    def _key(self):
+        return (self.seconds, self.night_max_seconds, self.night_start, self.night_end, self.jitter)
+
+    def __eq__(self, other):
+        return isinstance(other, PollingTrigger) and other._key() == self._key()
+
+    def __str__(self):
+        text = f"sondeo cada {self.seconds / 60:g} min"
+        if self.night_max_seconds:
+            text += f" (de noche hasta {self.night_max_seconds / 60:g} min)"
+        return text
+
+
+def parse_trigger(spec):
+    """Disparador a partir de "HH:MM" (diario) o de una expresión cron"""
+    spec = spec.strip()
+    if ':' in spec and len(spec.split()) == 1:
+        hour, minute = (int(value) for value in spec.split(':'))
+        return CronTrigger(f"{minute} {hour} * * *")
+    return CronTrigger(spec)
+
+
+class Job:
+    """Tarea programada: función, disparador y resultado de la última ejecución"""
+
+    def __init__(self, name, func, trigger, next_run, leader_only=False, quiet=False):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.leader_only = leader_only
+        self.quiet = quiet
+        self.next_run = next_run
+        self.recovery_slot = None  # ejecución perdida pendiente (hasta que la haga el líder)
+        self.rerun_at = None  # petición recibida mientras se ejecutaba
+        self.last_run = None
+        self.last_error = None
+        self.running = False
+
+    def summary(self):
+        return {
+            'name': self.name,
+            'trigger': str(self.trigger),
+            'leader_only': self.leader_only,
+            'next_run': _format(self.next_run),
+            'last_run': _format(self.last_run),
+            'last_error': self.last_error,
+            'running': self.running,
+        }
+
+
+def _format(dt):
+    return dt.strftime("%Y-%m-%d %H:%M:%S") if dt else None
+
+
+def _run_order(job):
+    # Las tareas bajo demanda sin petición pendiente van al final
+    return job.next_run or datetime.max
+
+
+class JobScheduler:
+    """Montículo de tareas y un hilo que duerme hasta la siguiente
+
+    Las entradas del montículo que quedan obsoletas al reprogramar o quitar una
+    tarea se descartan al llegar a la cima. Las tareas se ejecutan una a una en
+    el hilo del programador, como hacía schedule.run_pending(). Las tareas
+    `leader_only` se saltan si hay un `lease` (leader.LeaderLease) y este
+    proceso no es el líder. Con un `store` (job_store.JobStore) cada ejecución
+    queda registrada; la función de la tarea puede devolver un diccionario con
+    outcome, message, bytes y rows para el historial.
+    """
+
+    def __init__(self, status_path=None, log=print, lease=None, store=None):
+        self.status_path = status_path
+        self.log = log
+        self.lease = lease
+        self.store = store
+        self.started_at = None
+        self.wakeups = 0
+        self._jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def _push(self, job):
+        if job.next_run is None:
+            return  # tarea bajo demanda sin petición pendiente
+        heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+
+    def add_job(self, name, func, trigger, run_now=False, leader_only=False, catch_up=False, quiet=False):
+        """Programar (o reprogramar) la tarea `name`
+
+        Si ya existe con el mismo disparador solo se actualiza la función y se
+        conserva su próxima ejecución; así se puede llamar en cada recarga.
+        Con `catch_up`, si el historial muestra ejecuciones perdidas (p. ej. el
+        proceso estaba parado a su hora) se hace una sola de recuperación en
+        cuanto arranca el hilo, sin bloquear a quien llama. Las tareas `quiet`
+        no escriben historial ni estado cuando su resultado es 'unchanged'.
+        """
+        with self._cond:
+            existing = self._jobs.get(name)
+            if existing is not None and existing.trigger == trigger and not run_now:
+                existing.func = func
+                existing.leader_only = leader_only
+                existing.quiet = quiet
+                return existing
+        recovery_slot = None
+        if catch_up and self.store is not None and existing is None:
+            recovery_slot = missed_slot(trigger, self.store.last_scheduled(name), datetime.now())
+        with self._cond:
+            now = datetime.now()
+            job = Job(name, func, trigger, now if run_now or recovery_slot else trigger.next_after(now),
+                      leader_only, quiet)
+            job.recovery_slot = recovery_slot
+            if existing is not None:
+                job.last_run, job.last_error = existing.last_run, existing.last_error
+            self._jobs[name] = job
+            self._push(job)
+            self._cond.notify_all()
+        self._state_changed()
+        return job
+
+    def remove_job(self, name):
+        with self._cond:
+            removed = self._jobs.pop(name, None)
+            self._cond.notify_all()
+        if removed is not None:
+            self._state_changed()
+        return removed is not None
+
+    def clear(self):
+        with self._cond:
+            self._jobs.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+        self._state_changed()
+
+    def run_now(self, name):
+        """Adelantar la tarea `name` para que se ejecute en cuanto el hilo quede libre"""
+        return self.run_at(name, datetime.now())
+
+    def run_at(self, name, when):
+        """Programar una ejecución de `name` a la hora `when` en lugar de la prevista
+
+        Si la tarea se está ejecutando, la petición se guarda y se ejecuta una
+        sola vez al terminar; varias peticiones seguidas se funden en una.
+        """
+        with self._cond:
+            job = self._jobs.get(name)
+            if job is None:
+                return False
+            if job.running:
+                job.rerun_at = when
+            else:
+                job.next_run = when
+                self._push(job)
+                self._cond.notify_all()
+        return True
+
+    def leadership_gained(self):
+        """Adelantar las recuperaciones que se saltaron mientras otro nodo era el líder
+
+        Se registra con lease.on_elected(): al reiniciar, el lease del proceso
+        anterior puede seguir vigente unos segundos y la recuperación de
+        add_job() se salta; queda pendiente hasta que este nodo es el líder.
+        """
+        with self._cond:
+            pending = [job.name for job in self._jobs.values() if job.recovery_slot is not None]
+        for name in pending:
+            self.run_now(name)
+
+    def get_job(self, name):
+        with self._cond:
+            return self._jobs.get(name)
+
+    def jobs(self):
+        with self._cond:
+            return sorted(self._jobs.values(), key=_run_order)
+
+    def next_run(self):
+        with self._cond:
+            return min((job.next_run for job in self._jobs.values() if job.next_run), default=None)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_name="scheduler_worker"):
+        """Arrancar el hilo del programador; False si ya estaba en marcha"""
+        with self._cond:
+            if self.running:
+                return False
+            self._stopping = False
+            self.started_at = datetime.now()
+            self._thread = threading.Thread(target=self._loop, name=thread_name, daemon=True)
+            self._thread.start()
+        self._state_changed()
+        return True
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._state_changed()
+
+    def join(self, timeout=None):
+        """Esperar a que termine el hilo del programador"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_due(self):
+        """Esperar (con el lock tomado) hasta la próxima tarea vencida; None si hay que parar"""
+        while not self._stopping:
+            if not self._heap:
+                self._cond.wait()
+                self.wakeups += 1
+                continue
+            due, _, job = self._heap[0]
+            if self._jobs.get(job.name) is not job or job.next_run != due:
+                heapq.heappop(self._heap)  # entrada obsoleta
+                continue
+            delay = (due - datetime.now()).total_seconds()
+            if delay <= 0:
+                heapq.heappop(self._heap)
+                job.running = True
+                return job
+            self._cond.wait(delay)
+            self.wakeups += 1
+        return None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                job = self._next_due()
+            if job is None:
+                return
+            if not job.quiet:
+                self._state_changed()
+
+            result = {}
+            # En los seguidores las tareas del líder se saltan sin log: los cambios de
+            # liderazgo ya los registra el lease
+            skipped = job.leader_only and self.lease is not None and not self.lease.is_leader
+            if not skipped:
+                try:
+                    result = self._run(job)
+                except Exception as e:
+                    result = {'outcome': 'failed', 'message': f"{type(e).__name__}: {str(e)}"}
+                    self.log(f"💥 Error en la tarea {job.name}: {result['message']}")
+                job.recovery_slot = None  # si se saltó, la recuperación sigue pendiente (leadership_gained)
+                # Los disparadores adaptativos ajustan su intervalo según el resultado
+                record = getattr(job.trigger, 'record', None)
+                if record is not None:
+                    record(result.get('outcome'))
+
+            with self._cond:
+                now = datetime.now()
+                job.running = False
+                job.last_run = now
+                job.last_error = result.get('message') if result.get('outcome') == 'failed' else None
+                if self._jobs.get(job.name) is job:
+                    if job.rerun_at is not None:
+                        job.next_run, job.rerun_at = max(now, job.rerun_at), None
+                    else:
+                        job.next_run = job.trigger.next_after(max(now, job.next_run))
+                    self._push(job)
+            if not (job.quiet and (skipped or result.get('outcome') == 'unchanged')):
+                self._state_changed()
+
+    def _run(self, job):
+        """Ejecutar la tarea registrándola en el historial; devuelve su resultado"""
+        if job.recovery_slot is not None:
+            following = job.trigger.next_after(job.recovery_slot)
+            if following is not None and following <= job.next_run:
+                job.recovery_slot = None  # esta ejecución programada ya cubre la perdida
+        scheduled_at, recovery = job.next_run, job.recovery_slot is not None
+        if recovery:
+            scheduled_at = job.recovery_slot
+            last = self.store.last_scheduled(job.name)
+            if last is not None and last >= scheduled_at:
+                self.log(f"⏭️ {job.name}: la ejecución de {_format(scheduled_at)} ya la hizo otro nodo")
+                return {}
+            self.log(f"🔍 {job.name}: recuperando la ejecución perdida de {_format(scheduled_at)}")
+
+        holder = self.lease.holder if self.lease is not None else None
+        started_at = datetime.now()
+        run_id = None
+        # Las tareas `quiet` (sondeos) solo dejan rastro en el historial cuando algo cambia
+        if self.store is not None and not job.quiet:
+            run_id = self.store.start_run(job.name, scheduled_at, holder, recovery)
+        start = time.perf_counter()
+        result = {}
+        try:
+            result = job.func()
+            result = result if isinstance(result, dict) else {}
+        except Exception as e:
+            result = {'outcome': 'failed', 'message': f"{type(e).__name__}: {str(e)}"}
+            raise
+        finally:
+            if self.store is not None and run_id is None and result.get('outcome') != 'unchanged':
+                run_id = self.store.start_run(job.name, scheduled_at, holder, recovery, started_at)
+            if run_id is not None:
+                self.store.finish_run(
+                    run_id, result.get('outcome', 'ok'), result.get('message'),
+                    result.get('bytes'), result.get('rows'), time.perf_counter() - start
+                )
+        return result
+
+    def status(self):
+        """Estado en memoria del programador y de sus tareas"""
+        with self._cond:
+            jobs = sorted(self._jobs.values(), key=_run_order)
+            return {
+                'worker_active': self.running,
+                'started_at': _format(self.started_at),
+                'last_check': _format(datetime.now()) if self.running else None,
+                'next_run': _format(jobs[0].next_run) if jobs else None,  # None si solo hay tareas bajo demanda
+                'wakeups': self.wakeups,
+                'leader': self.lease.is_leader if self.lease is not None else None,
+                'jobs': [job.summary() for job in jobs],
+            }
+
+    def _state_changed(self):
+        """Escribir el estado a disco solo cuando cambia, para otros procesos y paneles"""
+        if not self.status_path:
+            return
+        status = self.status()
+        try:
+            os.makedirs(os.path.dirname(self.status_path) or ".", exist_ok=True)
+            catalog.atomic_write(self.status_path, lambda tmp: _write_json(tmp, status))
+        except Exception:
+            pass  # No fallar si no se puede escribir el estado
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+# Programador compartido por el proceso (la app de Streamlit vuelve a ejecutar su script en cada recarga)
+scheduler = JobScheduler(status_path=STATUS_FILE_PATH)
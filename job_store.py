@@ -0,0 +1,138 @@
+"""
+Historial persistente de las ejecuciones programadas en SQLite
+Cada ejecución de una tarea queda en la tabla `job_runs` de data/scheduler.db
+(la misma base que el lease de líder) con su hora programada, inicio, fin,
+resultado, bytes descargados, filas y duración. El scheduler lo usa para
+detectar al arrancar si se perdió alguna ejecución y el panel de
+administración para mostrar el historial sin leer scheduler.log.
+"""
+import threading
+from datetime import datetime
+
+import leader
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Resultados: 'running', 'updated', 'unchanged', 'ok' o 'failed'
+RUN_COLUMNS = [
+    'id', 'job', 'scheduled_at', 'started_at', 'finished_at', 'outcome',
+    'bytes', 'rows', 'duration', 'message', 'holder', 'recovery'
+]
+
+
+def _format(dt):
+    return dt.strftime(DATE_FORMAT) if dt else None
+
+
+class JobStore:
+    """Tabla job_runs; cada operación abre y cierra su conexión (se usa desde varios hilos)"""
+
+    def __init__(self, path=leader.DB_PATH):
+        self.path = path
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = leader.connect(self.path)
+        if not self._ready:
+            with self._lock:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS job_runs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        job TEXT NOT NULL,
+                        scheduled_at TEXT NOT NULL,
+                        started_at TEXT NOT NULL,
+                        finished_at TEXT,
+                        outcome TEXT NOT NULL,
+                        bytes INTEGER,
+                        rows INTEGER,
+                        duration REAL,
+                        message TEXT,
+                        holder TEXT,
+                        recovery INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS job_runs_job_scheduled ON job_runs (job, scheduled_at)"
+                )
+                self._ready = True
+        return connection
+
+    def start_run(self, job, scheduled_at, holder=None, recovery=False, started_at=None):
+        """Registrar el inicio de una ejecución; devuelve su id"""
+        connection = self._connect()
+        try:
+            cursor = connection.execute(
+                "INSERT INTO job_runs (job, scheduled_at, started_at, outcome, holder, recovery) "
+                "VALUES (?, ?, ?, 'running', ?, ?)",
+                (job, _format(scheduled_at), _format(started_at or datetime.now()), holder, int(recovery))
+            )
+            return cursor.lastrowid
+        finally:
+            connection.close()
+
+    def finish_run(self, run_id, outcome, message=None, size=None, rows=None, duration=None):
+        connection = self._connect()
+        try:
+            connection.execute(
+                "UPDATE job_runs SET finished_at = ?, outcome = ?, message = ?, bytes = ?, rows = ?, duration = ? "
+                "WHERE id = ?",
+                (_format(datetime.now()), outcome, message, size, rows, duration, run_id)
+            )
+        finally:
+            connection.close()
+
+    def last_scheduled(self, job):
+        """Hora programada de la última ejecución registrada de `job` (o None)"""
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT MAX(scheduled_at) FROM job_runs WHERE job = ?", (job,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return datetime.strptime(row[0], DATE_FORMAT) if row and row[0] else None
+
+    def recent_runs(self, limit=20, job=None):
+        """Últimas ejecuciones, de la más reciente a la más antigua, como diccionarios"""
+        query = f"SELECT {', '.join(RUN_COLUMNS)} FROM job_runs"
+        params = ()
+        if job:
+            query += " WHERE job = ?"
+            params = (job,)
+        query += " ORDER BY id DESC LIMIT ?"
+        connection = self._connect()
+        try:
+            rows = connection.execute(query, params + (limit,)).fetchall()
+        finally:
+            connection.close()
+        return [dict(zip(RUN_COLUMNS, row)) for row in rows]
+
+
+def run_result(outcome, message=None, size=None, rows=None):
+    """Resultado que devuelve una tarea para su registro en el historial"""
+    return {'outcome': outcome, 'message': message, 'bytes': size, 'rows': rows}
+
+
+def missed_slot(trigger, last_scheduled, now, max_slots=10000):
+    """Última ejecución programada entre last_scheduled y now, o None si no se perdió ninguna
+
+    Sin historial (last_scheduled None) se considera perdida la ejecución de ahora.
+    Las tareas bajo demanda no tienen ejecuciones programadas que perder.
+    """
+    if trigger.next_after(now) is None:
+        return None
+    if last_scheduled is None:
+        return now
+    slot = None
+    candidate = trigger.next_after(last_scheduled)
+    for _ in range(max_slots):
+        if candidate > now:
+            break
+        slot = candidate
+        candidate = trigger.next_after(candidate)
+    return slot
+
+
+# Historial compartido por el proceso
+store = JobStore()
@@ -0,0 +1,160 @@
+"""
+Elección de líder entre procesos y réplicas con un lease en SQLite
+Todos los procesos (servidores de Streamlit, réplicas de Railway, el scheduler
+de ENABLE_SCHEDULER) comparten data/scheduler.db. Solo el que tiene el lease
+vigente ejecuta las descargas programadas; los demás se limitan a leer el
+catálogo publicado, que get_catalog() recarga al cambiar el archivo. El líder
+renueva el lease cada tercio de su duración y los seguidores intentan tomarlo
+en cuanto caduca, así que si el líder cae otro le sustituye en un periodo.
+"""
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+DB_PATH = "data/scheduler.db"
+LEASE_NAME = "ingest"
+DEFAULT_LEASE_SECONDS = int(os.environ.get("LEADER_LEASE_SECONDS", 60))
+
+
+def connect(path=DB_PATH):
+    """Conexión en modo autocommit; las transacciones se abren explícitamente"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+
+class LeaderLease:
+    """Lease con caducidad en la tabla `leases`; un único titular por nombre"""
+
+    def __init__(self, name=LEASE_NAME, path=DB_PATH, ttl=DEFAULT_LEASE_SECONDS, log=print):
+        self.name = name
+        self.path = path
+        self.ttl = ttl
+        self.log = log
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.current_holder = None
+        self.expires_at = 0.0
+        self._deadline = 0.0  # hasta cuándo este proceso puede considerarse líder (reloj monótono)
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._elected_callbacks = []
+
+    @property
+    def is_leader(self):
+        return self.current_holder == self.holder and time.monotonic() < self._deadline
+
+    def acquire(self):
+        """Tomar o renovar el lease si está libre, caducado o ya es nuestro; True si somos líder"""
+        with self._lock:
+            was_leader = self.is_leader
+            started = time.monotonic()
+            now = time.time()
+            connection = connect(self.path)
+            try:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute(
+                    "SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)
+                ).fetchone()
+                if row is None or row[0] == self.holder or row[1] <= now:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                        (self.name, self.holder, now + self.ttl)
+                    )
+                    row = (self.holder, now + self.ttl)
+                connection.execute("COMMIT")
+            except Exception:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+            finally:
+                connection.close()
+
+            self.current_holder, self.expires_at = row
+            if self.current_holder == self.holder:
+                # El plazo cuenta desde antes de la consulta: nunca se sobreestima
+                self._deadline = started + self.ttl
+            leader = self.is_leader
+
+        if leader and not was_leader:
+            self.log(f"👑 Este nodo es el líder de las actualizaciones ({self.holder})")
+            for callback in list(self._elected_callbacks):
+                try:
+                    callback()
+                except Exception as e:
+                    self.log(f"⚠️ Error al asumir el liderazgo: {str(e)}")
+        elif was_leader and not leader:
+            self.log(f"🔁 Liderazgo perdido; nuevo líder: {self.current_holder}")
+        return leader
+
+    def on_elected(self, callback):
+        """Registrar una función que se llama cada vez que este nodo pasa a ser líder"""
+        if callback not in self._elected_callbacks:
+            self._elected_callbacks.append(callback)
+
+    def release(self):
+        """Liberar el lease para que otro nodo lo tome sin esperar a que caduque"""
+        with self._lock:
+            connection = connect(self.path)
+            try:
+                connection.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+            finally:
+                connection.close()
+            self.current_holder = None
+            self._deadline = 0.0
+
+    def _next_attempt(self):
+        """Segundos hasta el próximo intento: renovar a un tercio del plazo o tomarlo al caducar"""
+        if self.current_holder == self.holder:
+            return self.ttl / 3
+        return max(0.1, min(self.ttl / 3, self.expires_at - time.time() + 0.1))
+
+    def _renew_loop(self):
+        while not self._stop.wait(self._next_attempt()):
+            try:
+                self.acquire()
+            except Exception as e:
+                self.log(f"⚠️ Error renovando el lease de líder: {str(e)}")
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_name="leader_lease"):
+        """Intentar tomar el lease ya y mantenerlo en un hilo aparte; False si ya estaba en marcha"""
+        if self.running:
+            return False
+        self._stop.clear()
+        try:
+            self.acquire()
+        except Exception as e:
+            self.log(f"⚠️ Error tomando el lease de líder: {str(e)}")
+        self._thread = threading.Thread(target=self._renew_loop, name=thread_name, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, release=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if release:
+            self.release()
+
+    def describe(self):
+        """Texto corto para el panel de estado"""
+        if self.is_leader:
+            return "Líder: este nodo"
+        if self.current_holder:
+            return f"Seguidor (líder: {self.current_holder})"
+        return "Sin líder"
+
+
+# Lease compartido por el proceso
+lease = LeaderLease()
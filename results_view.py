@@ -0,0 +1,212 @@
+"""
+Vista de resultados compartida por app.py y app_railway.py: búsqueda, orden,
+paginación y exportación de los productos del catálogo.
+"""
+
+import streamlit as st
+import pandas as pd
+import numpy as np
+from export import available_formats, ExportJob
+from fuzzy import search_fuzzy_rows, suggest_queries
+from ingest import SOURCE_COLUMNS
+from search import search_rows, search_state, sort_rows, get_stock_levels, STOCK_LEVEL_BADGES
+
+# Resultados por páginas: orden disponible (columna) y tamaños de página
+SORT_OPTIONS = {
+    "Orden del catálogo": None,
+    "Código": 'Codigo',
+    "Descripción": 'Descripcion',
+    "Familia": 'Familia',
+    "Stock": 'Stock',
+}
+PAGE_SIZES = [50, 100, 250, 500]
+
+# Espera máxima a una exportación dentro de una ejecución; si tarda más, sigue en segundo plano
+EXPORT_WAIT_SECONDS = 2
+# Desde Streamlit 1.52 el botón de descarga acepta una función: el archivo solo se lee al pulsarlo
+DEFERRED_DOWNLOAD = tuple(int(part) for part in st.__version__.split('.')[:2]) >= (1, 52)
+
+def stock_levels(df):
+    """Nivel de stock de cada fila con los umbrales configurados (int8, cacheado por instantánea)"""
+    return get_stock_levels(
+        df,
+        st.session_state.get('stock_low_threshold', 5),
+        st.session_state.get('stock_high_threshold', 20)
+    )
+
+def filter_rows(df, search_term, fuzzy=False):
+    """Posiciones de las filas que coinciden con el término de búsqueda"""
+    if not search_term:
+        return np.arange(len(df))
+    
+    if fuzzy:
+        # Modo tolerante: sus resultados no sirven para refinar la siguiente búsqueda exacta
+        st.session_state.last_search = None
+        return search_fuzzy_rows(df, search_term)
+    
+    # Si la consulta refina la anterior ("pav" -> "pavo"), solo se revisan sus resultados
+    rows = search_rows(df, search_term, st.session_state.get('last_search'))
+    st.session_state.last_search = search_state(df, search_term, rows)
+    return rows
+
+def selected_sort():
+    """(columna, descendente) elegidos en los controles de orden de los resultados"""
+    sort_label = st.session_state.get('results_sort', next(iter(SORT_OPTIONS)))
+    return SORT_OPTIONS[sort_label], st.session_state.get('results_order') == "Descendente"
+
+def export_results(df, rows, search_term, fuzzy_mode=False):
+    """Exportar resultados bajo demanda; el archivo se genera en segundo plano al pedirlo"""
+    with st.popover("📥 Exportar Resultados", help="Descargar resultados en CSV, CSV comprimido, Parquet o Excel"):
+        export_format = st.selectbox("Formato:", available_formats(), key="export_format")
+        
+        # Una exportación preparada para otra búsqueda, otro modo, otro orden u otro formato ya no sirve
+        sort = selected_sort()
+        job = st.session_state.get('export_job')
+        if job is not None and not job.matches(df, export_format, search_term, fuzzy_mode, sort):
+            job.discard()
+            job = st.session_state.export_job = None
+        
+        if job is None:
+            if st.button(f"⚙️ Preparar archivo ({len(rows)} filas)", key="export_prepare"):
+                file_prefix = f"stock_productos_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}"
+                job = st.session_state.export_job = ExportJob(
+                    df, rows, export_format, search_term, file_prefix, fuzzy_mode, sort
+                )
+        
+        if job is not None:
+            if not job.wait(timeout=EXPORT_WAIT_SECONDS):
+                st.info("⏳ Preparando archivo en segundo plano...")
+                st.button("🔄 Comprobar", key="export_refresh")
+            elif job.error:
+                st.error(f"❌ Error al exportar: {job.error}")
+            else:
+                st.download_button(
+                    label="💾 Descargar",
+                    data=job.read if DEFERRED_DOWNLOAD else job.read(),
+                    file_name=job.file_name,
+                    mime=job.mime,
+                    key="export_download"
+                )
+
+def results_page(df, rows, search_term):
+    """Controles de orden y paginación; devuelve las posiciones de la página visible"""
+    col_sort, col_order, col_size, col_page = st.columns([2, 1, 1, 1])
+    with col_sort:
+        st.selectbox("↕️ Ordenar por:", list(SORT_OPTIONS), key="results_sort")
+    with col_order:
+        st.selectbox("Sentido:", ["Ascendente", "Descendente"], key="results_order")
+    with col_size:
+        page_size = st.selectbox("Filas por página:", PAGE_SIZES, index=1, key="results_page_size")
+    
+    total_pages = max(1, -(-len(rows) // page_size))
+    # Una búsqueda nueva vuelve a la primera página
+    if st.session_state.get('results_page_query') != search_term or st.session_state.get('results_page', 1) > total_pages:
+        st.session_state.results_page = 1
+        st.session_state.results_page_query = search_term
+    with col_page:
+        page = st.number_input(f"Página (de {total_pages}):", min_value=1, max_value=total_pages, key="results_page")
+    
+    # Orden y ventana sobre posiciones de fila: solo se materializa la página visible
+    ordered = sort_rows(df, rows, *selected_sort())
+    start = (page - 1) * page_size
+    window = ordered[start:start + page_size]
+    st.caption(f"Mostrando {start + 1}–{start + len(window)} de {len(rows)} productos")
+    return window
+
+def search_panel(df):
+    """Buscador y resultados sobre el catálogo; se ejecuta dentro del fragmento de cada app"""
+    
+    # Barra de búsqueda
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        search_term = st.text_input(
+            "🔍 Buscar productos:",
+            placeholder='Ej: pienso "pavo basic" familia:nobby stock<5',
+            help=(
+                "Todas las palabras deben aparecer (en cualquier campo). "
+                "Frases entre comillas. Filtros: familia:texto, codigo:texto, "
+                "stock<5, stock>=10, stock:0, stock:5..20"
+            )
+        )
+        fuzzy_mode = st.checkbox(
+            "🔤 Tolerar errores de escritura",
+            key="fuzzy_search",
+            help="Incluye palabras parecidas (hasta 2 letras de diferencia)"
+        )
+    
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        clear_search = st.button("🗑️ Limpiar", help="Limpiar búsqueda")
+        if clear_search:
+            st.rerun(scope="fragment")
+    
+    # Filtrar datos (posiciones de fila; el DataFrame solo se materializa por páginas)
+    rows = filter_rows(df, search_term, fuzzy_mode)
+    
+    # Sin resultados: probar con la corrección más probable de la consulta
+    if len(rows) == 0 and search_term and not fuzzy_mode:
+        suggestions = suggest_queries(df, search_term)
+        if suggestions:
+            st.info(f"🔤 Sin resultados para «{search_term}». Mostrando resultados para «{suggestions[0]}»")
+            if len(suggestions) > 1:
+                st.caption(f"¿Quizás quiso decir: {', '.join(suggestions[1:])}?")
+            rows = filter_rows(df, suggestions[0])
+    
+    # Mostrar resultados
+    if len(rows) == 0:
+        st.warning("🔍 No se encontraron productos que coincidan con la búsqueda.")
+    else:
+        # Información de resultados
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("📊 Productos Encontrados", len(rows))
+        with col2:
+            if search_term:
+                st.metric("📋 Total en Base", len(df))
+        with col3:
+            export_results(df, rows, search_term, fuzzy_mode)
+        
+        st.markdown("---")
+        
+        # Preparar solo la página visible para mostrar, de forma segura
+        window = results_page(df, rows, search_term)
+        page_df = df.iloc[window]
+        try:
+            display_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock'] + [c for c in SOURCE_COLUMNS if c in df.columns]
+            display_df = page_df[display_columns].copy()
+            display_df.insert(0, 'Indicador', STOCK_LEVEL_BADGES[stock_levels(df)[window]])
+            
+            # Mostrar tabla
+            st.dataframe(
+                display_df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Indicador": st.column_config.TextColumn(
+                        "Estado",
+                        help="🟢 Stock Alto | 🟡 Stock Medio | 🔴 Stock Bajo",
+                        width="small"
+                    ),
+                    "Codigo": st.column_config.TextColumn("Código", width="medium"),
+                    "Descripcion": st.column_config.TextColumn("Descripción", width="large"),
+                    "Familia": st.column_config.TextColumn("Familia", width="medium"),
+                    "Stock": st.column_config.NumberColumn("Stock", width="small", format="%d"),
+                    "Proveedor": st.column_config.TextColumn("Proveedor", width="medium"),
+                    "Almacen": st.column_config.TextColumn("Almacén", width="medium")
+                }
+            )
+        except Exception as e:
+            st.error(f"Error mostrando datos: {str(e)}")
+            st.dataframe(page_df, use_container_width=True)
+        
+        # Leyenda de colores
+        st.markdown("---")
+        low_val = st.session_state.get('stock_low_threshold', 5)
+        high_val = st.session_state.get('stock_high_threshold', 20)
+        st.markdown(f"""
+        **Leyenda de Stock:**
+        - 🟢 **Stock Alto:** Más de {high_val} unidades
+        - 🟡 **Stock Medio:** Entre {low_val + 1} y {high_val} unidades  
+        - 🔴 **Stock Bajo:** {low_val} unidades o menos
+        """)
@@ -1,12 +1,17 @@
 import os
+import atexit
 import threading
-import time
-import schedule
 import json
 from datetime import datetime
-import paramiko
 import pandas as pd
 from io import StringIO
+from catalog import publish_catalog, publish_catalog_file, read_catalog_csv, read_catalog_file
+import sftp_pool
+from job_scheduler import scheduler as job_scheduler, IntervalTrigger, PollingTrigger, parse_trigger, POLLING_DEFAULTS
+from leader import lease as leader_lease
+from job_store import store as job_history, run_result
+from webhook import server as webhook_server
+from ingest import ingest_sources, ingest_stock_feed, stock_feed_source, poll_sftp, DEFAULT_STOCK_FEED_MINUTES
 
 def log_message(message):
     """Log con timestamp para Railway"""
@@ -16,7 +21,7 @@ def log_message(message):
 def validate_csv_content(content):
     """Validar contenido CSV descargado"""
     try:
-        df = pd.read_csv(StringIO(content))
+        df = read_catalog_csv(StringIO(content))
         required_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock']
         
         if all(col in df.columns for col in required_columns):
@@ -27,26 +32,38 @@ def validate_csv_content(content):
         return False, f"Error al procesar CSV: {str(e)}"
 
 def download_sftp_file(host, port, username, password, remote_path):
-    """Descargar archivo via SFTP"""
+    """Descargar archivo via SFTP con una sesión del pool compartido"""
     try:
-        transport = paramiko.Transport((host, port))
-        transport.connect(username=username, password=password)
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        
-        with sftp.open(remote_path, 'r') as remote_file:
-            content = remote_file.read().decode('utf-8')
-        
-        sftp.close()
-        transport.close()
+        content = sftp_pool.download_file(host, port, username, password, remote_path).decode('utf-8')
+        log_message(f"⏱️ SFTP: {sftp_pool.format_timings(sftp_pool.pool.last_timings)}")
         return True, content, "Archivo descargado exitosamente"
     except Exception as e:
         return False, "", str(e)
 
+def validate_csv_file(path):
+    """Validar un CSV descargado leyéndolo directamente de disco; devuelve (válido, df o mensaje, codificación)"""
+    try:
+        df, encoding = read_catalog_file(path)
+    except Exception as e:
+        return False, f"Error al procesar CSV: {str(e)}", None
+    required_columns = ['Codigo', 'Descripcion', 'Familia', 'Stock']
+    if not all(col in df.columns for col in required_columns):
+        return False, f"Columnas faltantes: {set(required_columns) - set(df.columns)}", None
+    return True, df, encoding
+
 def save_data(df):
-    """Guardar datos CSV"""
+    """Guardar datos CSV y publicar la nueva instantánea del catálogo"""
     try:
-        os.makedirs("data", exist_ok=True)
-        df.to_csv("data/productos.csv", index=False)
+        publish_catalog(df, "data/productos.csv")
+        return True
+    except Exception as e:
+        log_message(f"Error guardando datos: {str(e)}")
+        return False
+
+def save_data_file(path, df, encoding, digest):
+    """Publicar el CSV descargado moviéndolo a data/productos.csv, sin volver a serializarlo"""
+    try:
+        publish_catalog_file(path, df, encoding, digest, "data/productos.csv")
         return True
     except Exception as e:
         log_message(f"Error guardando datos: {str(e)}")
@@ -82,11 +99,14 @@ def save_config(config):
         os.makedirs("data", exist_ok=True)
         with open("data/config.json", 'w', encoding='utf-8') as f:
             json.dump(config, f, indent=2, ensure_ascii=False)
+        # Un cambio de horarios despierta al scheduler sin esperar a la próxima tarea
+        if job_scheduler.running:
+            configure_jobs(config)
     except Exception as e:
         log_message(f"Error guardando config: {str(e)}")
 
 def run_scheduled_update():
-    """Ejecutar actualización programada"""
+    """Ejecutar actualización programada; devuelve el resultado para el historial"""
     try:
         log_message("🔄 Iniciando actualización automática SFTP...")
         config = load_config()
@@ -94,93 +114,183 @@ def run_scheduled_update():
         
         if not sftp_config.get('enabled', False):
             log_message("❌ SFTP deshabilitado en configuración")
-            return
+            return run_result('ok', "SFTP deshabilitado en configuración")
         
-        success, content, message = download_sftp_file(
-            sftp_config.get('host'),
-            sftp_config.get('port', 22),
-            sftp_config.get('user'),
-            sftp_config.get('password'),
-            sftp_config.get('file_path')
-        )
+        if config.get('sources'):
+            return run_sources_update(config)
         
-        if success:
-            log_message("✅ Archivo descargado exitosamente")
-            is_valid, result = validate_csv_content(content)
-            if is_valid:
-                if save_data(result):
-                    config['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    save_config(config)
-                    log_message(f"🎉 Actualización automática exitosa: {config['last_update']}")
-                    log_message(f"📊 Productos actualizados: {len(result)}")
-                else:
-                    log_message("❌ Error guardando datos")
+        # Descarga condicional: sin cambios en el archivo remoto no se parsea ni se reescribe
+        last_fetch = config.get('last_fetch') if os.path.exists("data/productos.csv") else None
+        try:
+            tmp_path, fetch = sftp_pool.download_if_changed(
+                sftp_config.get('host'),
+                sftp_config.get('port', 22),
+                sftp_config.get('user'),
+                sftp_config.get('password'),
+                sftp_config.get('file_path'),
+                last_fetch,
+                local_path="data/productos.csv"
+            )
+        except Exception as e:
+            log_message(f"❌ Error en descarga SFTP: {str(e)}")
+            return run_result('failed', f"Error en descarga SFTP: {str(e)}")
+        log_message(f"⏱️ SFTP: {sftp_pool.format_timings(sftp_pool.pool.last_timings)}")
+        
+        if tmp_path is None:
+            config['last_fetch'] = fetch
+            save_config(config)
+            log_message("⏭️ El archivo remoto no ha cambiado desde la última descarga")
+            return run_result('unchanged', "El archivo remoto no ha cambiado", 0)
+        
+        log_message("✅ Archivo descargado exitosamente")
+        is_valid, result, encoding = validate_csv_file(tmp_path)
+        if is_valid:
+            if save_data_file(tmp_path, result, encoding, fetch['sha256']):
+                config['last_fetch'] = fetch
+                config['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                save_config(config)
+                log_message(f"🎉 Actualización automática exitosa: {config['last_update']}")
+                log_message(f"📊 Productos actualizados: {len(result)}")
+                outcome = run_result('updated', "Datos actualizados desde SFTP", fetch.get('size'), len(result))
             else:
-                log_message(f"❌ Error en validación CSV: {result}")
+                log_message("❌ Error guardando datos")
+                outcome = run_result('failed', "Error guardando datos", fetch.get('size'))
         else:
-            log_message(f"❌ Error en descarga SFTP: {message}")
+            log_message(f"❌ Error en validación CSV: {result}")
+            outcome = run_result('failed', f"Error en validación CSV: {result}", fetch.get('size'))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return outcome
             
     except Exception as e:
         log_message(f"💥 Error crítico en actualización automática: {str(e)}")
+        return run_result('failed', str(e))
+
+def run_sources_update(config):
+    """Actualizar desde todas las fuentes de config['sources'] en paralelo"""
+    log_message(f"📡 Descargando {len(config['sources'])} fuentes en paralelo...")
+    results, merged = ingest_sources(config, "data/productos.csv")
+    for result in results:
+        log_message(f"   · {result.name}: {result.status} ({result.seconds:.1f}s) {result.message}")
+    size = sum((result.fetch or {}).get('size') or 0 for result in results if result.status == 'updated')
+    if merged is not None:
+        config['last_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_message(f"🎉 Actualización automática exitosa: {config['last_update']}")
+        log_message(f"📊 Productos actualizados: {len(merged)}")
+        outcome = run_result('updated', "Datos actualizados desde las fuentes", size, len(merged))
+    elif any(result.df is not None for result in results):
+        log_message("⏭️ Ninguna fuente ha cambiado")
+        outcome = run_result('unchanged', "Ninguna fuente ha cambiado", size)
+    else:
+        log_message("❌ Ninguna fuente tiene datos válidos")
+        outcome = run_result('failed', "Ninguna fuente tiene datos válidos", size)
+    save_config(config)
+    return outcome
+
+def run_stock_feed_update():
+    """Aplicar el feed parcial Codigo,Stock sobre el catálogo publicado; devuelve el resultado para el historial"""
+    try:
+        config = load_config()
+        delta, unknown = ingest_stock_feed(config, "data/productos.csv")
+        if unknown:
+            log_message(f"⚠️ {unknown} códigos del feed de stock no están en el catálogo")
+        if delta is None:
+            save_config(config)
+            return run_result('unchanged', "El feed de stock no ha cambiado", 0)
+        if delta.is_empty:
+            save_config(config)
+            return run_result('unchanged', "El feed de stock no cambia ningún producto", 0)
+        config['last_stock_update'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_message(f"📦 Stock actualizado en {len(delta.stock_rows)} productos")
+        save_config(config)
+        return run_result(
+            'updated', f"Stock actualizado en {len(delta.stock_rows)} productos",
+            config['stock_feed_fetch'].get('size'), len(delta.stock_rows)
+        )
+    except Exception as e:
+        log_message(f"❌ Error en el feed de stock: {str(e)}")
+        return run_result('failed', f"Error en el feed de stock: {str(e)}")
+
+def run_sftp_poll():
+    """Sondeo del archivo remoto: un stat y, solo si cambió, la actualización completa"""
+    config = load_config()
+    if not config.get('sftp_config', {}).get('enabled', False):
+        return run_result('unchanged', "SFTP deshabilitado en configuración")
+    try:
+        changed, stat = poll_sftp(config)
+    except Exception as e:
+        log_message(f"❌ Error en el sondeo SFTP: {str(e)}")
+        return run_result('failed', f"Error en el sondeo SFTP: {str(e)}")
+    if not changed:
+        return run_result('unchanged', "El archivo remoto no ha cambiado", 0)
+    
+    log_message("🔔 Cambio detectado en el archivo remoto")
+    result = run_scheduled_update()
+    if result['outcome'] != 'failed':
+        config = load_config()
+        config['poll_stat'] = stat
+        save_config(config)
+    return result
+
+def configure_jobs(config):
+    """Programar las tareas; UPDATE_SCHEDULE_TIME admite "HH:MM" o una expresión cron"""
+    custom_time = os.environ.get("UPDATE_SCHEDULE_TIME", "02:00")
+    # Solo la réplica líder descarga; las demás leen el catálogo que publica
+    # Si la réplica estaba parada a su hora, se recupera una sola ejecución al arrancar
+    job_scheduler.add_job("sftp_update", run_scheduled_update, parse_trigger(custom_time),
+                          leader_only=True, catch_up=True)
+    
+    # El feed parcial de stock se consulta con su propio intervalo
+    stock_feed = stock_feed_source(config)
+    if stock_feed:
+        interval = stock_feed.get('interval_minutes', DEFAULT_STOCK_FEED_MINUTES)
+        job_scheduler.add_job("stock_feed", run_stock_feed_update, IntervalTrigger(interval * 60), leader_only=True)
+    else:
+        job_scheduler.remove_job("stock_feed")
+    
+    # Sondeo del archivo remoto (sección `polling` o POLL_INTERVAL_MINUTES); sin cambios no deja historial
+    polling = {**POLLING_DEFAULTS, **(config.get('polling') or {})}
+    if os.environ.get("POLL_INTERVAL_MINUTES"):
+        polling.update(enabled=True, interval_minutes=float(os.environ["POLL_INTERVAL_MINUTES"]))
+    if polling['enabled']:
+        job_scheduler.add_job("sftp_poll", run_sftp_poll, PollingTrigger.from_config(polling),
+                              leader_only=True, quiet=True)
+    else:
+        job_scheduler.remove_job("sftp_poll")
 
 def railway_scheduler():
-    """Scheduler optimizado para Railway"""
+    """Scheduler optimizado para Railway: duerme hasta la próxima tarea en lugar de revisar cada minuto"""
     log_message("🚀 Railway Scheduler iniciado")
     
-    # Programar actualización a las 2:00 AM
-    schedule.every().day.at("02:00").do(run_scheduled_update)
-    
-    # En Railway, usar variables de entorno para horarios personalizados
+    job_scheduler.log = log_message
+    leader_lease.log = log_message
+    # Las recuperaciones saltadas como seguidor se hacen al pasar a ser líder
+    leader_lease.on_elected(job_scheduler.leadership_gained)
+    if leader_lease.start():
+        # Liberar el lease al salir para que el siguiente proceso no espere a que caduque
+        atexit.register(leader_lease.stop)
+    job_scheduler.lease = leader_lease
+    job_scheduler.store = job_history
+    configure_jobs(load_config())
     custom_time = os.environ.get("UPDATE_SCHEDULE_TIME", "02:00")
     if custom_time != "02:00":
-        schedule.clear()
-        schedule.every().day.at(custom_time).do(run_scheduled_update)
         log_message(f"⏰ Horario personalizado configurado: {custom_time}")
     
-    # Ejecutar verificación de actualizaciones perdidas al inicio
-    check_missed_updates()
+    # Las ejecuciones perdidas se detectan con el historial y se recuperan en el hilo del scheduler
+    if not leader_lease.is_leader:
+        log_message(f"ℹ️ {leader_lease.describe()}: esta réplica solo leerá el catálogo publicado")
     
-    while True:
-        try:
-            schedule.run_pending()
-            
-            # Log cada 6 horas para Railway logs
-            current_time = datetime.now()
-            if current_time.minute == 0 and current_time.hour % 6 == 0:
-                next_run = schedule.next_run()
-                if next_run:
-                    log_message(f"⏰ Scheduler activo - próxima ejecución: {next_run.strftime('%Y-%m-%d %H:%M:%S')}")
-            
-            time.sleep(60)  # Revisar cada minuto
-            
-        except Exception as e:
-            log_message(f"💥 Error en scheduler: {str(e)}")
-            time.sleep(300)  # Esperar 5 minutos antes de reintentar
-
-def check_missed_updates():
-    """Verificar actualizaciones perdidas - optimizado para Railway"""
-    try:
-        config = load_config()
-        last_update_str = config.get('last_update', '')
-        now = datetime.now()
-        
-        if last_update_str:
-            last_update = datetime.strptime(last_update_str, "%Y-%m-%d %H:%M:%S")
-            hours_since = (now - last_update).total_seconds() / 3600
-            
-            # En Railway, verificar si han pasado más de 25 horas (considerando reinicio de contenedores)
-            if hours_since > 25:
-                log_message(f"🔍 Última actualización hace {hours_since:.1f} horas. Ejecutando actualización de recuperación...")
-                run_scheduled_update()
-        else:
-            log_message("🔍 No hay registro de actualizaciones previas. Ejecutando primera actualización...")
-            run_scheduled_update()
-            
-    except Exception as e:
-        log_message(f"💥 Error verificando actualizaciones perdidas: {str(e)}")
+    job_scheduler.start("railway_scheduler")
+    # Avisos de "archivo listo" del ERP (solo si hay WEBHOOK_SECRET)
+    webhook_server.start(run_scheduled_update, log=log_message)
+    next_run = job_scheduler.next_run()
+    if next_run:
+        log_message(f"⏰ Próxima ejecución: {next_run.strftime('%Y-%m-%d %H:%M:%S')}")
 
 def start_railway_scheduler():
     """Inicializar scheduler para Railway"""
+    if job_scheduler.running:
+        return None  # Streamlit vuelve a ejecutar la app en cada recarga
     if os.environ.get("ENABLE_SCHEDULER", "false").lower() == "true":
         log_message("🔧 ENABLE_SCHEDULER=true detectado, iniciando scheduler...")
         scheduler_thread = threading.Thread(target=railway_scheduler, daemon=True)
@@ -193,4 +303,5 @@ def start_railway_scheduler():
 
 if __name__ == "__main__":
     # Ejecutar solo el scheduler (útil para testing)
-    railway_scheduler()
\ No newline at end of file
+    railway_scheduler()
+    job_scheduler.join()
\ No newline at end of file
@@ -0,0 +1,983 @@
+"""
+Búsqueda de productos sobre la instantánea compartida del catálogo
+Los campos de búsqueda se normalizan una sola vez por instantánea (minúsculas,
+sin acentos y con los caracteres cp850 del proveedor reparados). Un índice
+invertido de trigramas reduce cada consulta a intersectar listas de filas y
+verificar solo esas candidatas; texto e índice se guardan en
+data/productos.search.npz para no reconstruirlos al reiniciar.
+"""
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import catalog
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+SEARCH_COLUMNS = ['Codigo', 'Descripcion', 'Familia', 'Stock']
+
+# Una consulta igual a un código completo devuelve ese producto sin recorrer el
+# catálogo cuando ninguna otra fila puede contenerlo (el índice de trigramas solo
+# la propone a ella). Por debajo de esta longitud siempre se busca por subcadena.
+MIN_EXACT_CODE_LENGTH = 6
+
+# Separador entre campos dentro del texto de búsqueda de cada fila; se elimina
+# de las consultas para que un término nunca coincida a caballo entre dos campos
+FIELD_SEPARATOR = "\x1f"
+
+# Niveles de stock según los umbrales configurados, con su indicador en la tabla
+STOCK_LEVEL_LOW, STOCK_LEVEL_MEDIUM, STOCK_LEVEL_HIGH, STOCK_LEVEL_UNKNOWN = range(4)
+STOCK_LEVEL_BADGES = np.array(["🔴", "🟡", "🟢", "⚪"], dtype=object)
+
+# Resultados de consulta cacheados (posiciones de fila, no copias del DataFrame)
+QUERY_CACHE_SIZE = 256
+
+# El archivo del proveedor llega en cp850 pero se decodificó como cp1252, así que
+# "PEQUEÑO" aparece como "PEQUE¥O". Varios de esos caracteres también son texto
+# correcto (µ de micras, à, ¡), así que cada uno se repara solo donde no puede ser
+# otra cosa; el espacio duro (á), ¨ (¿) y el guion blando (¡) no se tocan porque
+# ahí nunca se distinguen de un texto bien decodificado.
+# Sin carácter en cp1252: siempre son mojibake
+_CP850_ALWAYS = [0x81, 0x90]
+# Símbolos (‚ ¢ £ ¤ ¥ ¦ §) que detrás de una letra o cifra solo pueden ser mojibake
+_CP850_AFTER_ALNUM = [0x82, 0xA2, 0xA3, 0xA4, 0xA5, 0xA6, 0xA7]
+# Letras válidas (š ¡ µ à) que solo se reparan dentro de una palabra
+_CP850_INSIDE_WORD = [0x9A, 0xA1, 0xB5, 0xE0]
+
+
+def _mangled_char(byte):
+    try:
+        return bytes([byte]).decode('cp1252')
+    except UnicodeDecodeError:
+        return chr(byte)
+
+
+def _cp850_repair(byte, context=None):
+    """(carácter, patrón RE2 de pyarrow, reemplazo, patrón re) que repara un carácter
+
+    context: None (siempre), 'after' (tras letra o cifra) o 'inside' (entre dos letras)
+    """
+    char = _mangled_char(byte)
+    mangled = re.escape(char)
+    repaired = bytes([byte]).decode('cp850')
+    if context == 'inside':
+        pattern, python_pattern, replacement = rf"(\pL){mangled}(\pL)", rf"([^\W\d_]){mangled}([^\W\d_])", rf"\1{repaired}\2"
+    elif context == 'after':
+        pattern, python_pattern, replacement = rf"([\pL\pN]){mangled}", rf"([^\W_]){mangled}", rf"\1{repaired}"
+    else:
+        pattern, python_pattern, replacement = mangled, mangled, repaired
+    return char, pattern, replacement, re.compile(python_pattern)
+
+
+CP850_REPAIRS = (
+    [_cp850_repair(byte) for byte in _CP850_ALWAYS]
+    + [_cp850_repair(byte, 'after') for byte in _CP850_AFTER_ALNUM]
+    + [_cp850_repair(byte, 'inside') for byte in _CP850_INSIDE_WORD]
+)
+
+
+def repair_cp850(text):
+    """Reparar los caracteres cp850 mal decodificados del archivo del proveedor"""
+    if text.isascii():
+        return text
+    for char, _, replacement, pattern in CP850_REPAIRS:
+        if char in text:
+            text = pattern.sub(replacement, text)
+    return text
+
+
+def normalize_text(text):
+    """Normalizar texto para búsqueda: cp850 reparado, sin acentos y en minúsculas"""
+    if text is None or text is pd.NA or (isinstance(text, float) and np.isnan(text)):
+        return ""
+    decomposed = unicodedata.normalize('NFKD', repair_cp850(str(text)))
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return folded.lower().replace(FIELD_SEPARATOR, "")
+
+
+def _normalize_column(series):
+    """Normalizar una columna completa calculando cada valor distinto una sola vez"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype("string").fillna("").tolist()
+
+    cache = {}
+    normalized = []
+    for value in series.tolist():
+        key = value if isinstance(value, str) else None
+        if key is None or key not in cache:
+            result = normalize_text(value)
+            if key is not None:
+                cache[key] = result
+        else:
+            result = cache[key]
+        normalized.append(result)
+    return normalized
+
+
+def _normalize_column_arrow(series):
+    """Versión vectorizada con pyarrow.compute de _normalize_column"""
+    values = pa.array(series.astype("string"), type=pa.large_string())
+    if isinstance(values, pa.ChunkedArray):
+        # Las columnas leídas de una instantánea grande llegan en varios bloques
+        values = values.combine_chunks()
+    if not pd.api.types.is_numeric_dtype(series):
+        # Texto solo ASCII (p.ej. listas de códigos): no hay acentos ni cp850 que reparar
+        if not pc.all(pc.string_is_ascii(values)).as_py():
+            for char, pattern, replacement, _ in CP850_REPAIRS:
+                mask = pc.match_substring(values, char)
+                matches = pc.sum(mask).as_py() or 0
+                if matches > len(values) // 4:
+                    values = pc.replace_substring_regex(values, pattern, replacement)
+                elif matches:
+                    # Pocas filas afectadas: la expresión regular solo recorre esas
+                    repaired = pc.replace_substring_regex(values.filter(mask), pattern, replacement)
+                    values = pc.replace_with_mask(values, mask, repaired)
+            values = pc.utf8_normalize(values, 'NFKD')
+            values = pc.replace_substring_regex(values, r'\p{Mn}', '')
+        values = pc.ascii_lower(values) if pc.all(pc.string_is_ascii(values)).as_py() else pc.utf8_lower(values)
+        values = pc.replace_substring(values, FIELD_SEPARATOR, '')
+    return pc.fill_null(values, '')
+
+
+def _build_haystack(df):
+    """Texto de búsqueda por fila: campos normalizados unidos por FIELD_SEPARATOR"""
+    columns = [column for column in SEARCH_COLUMNS if column in df.columns]
+    if ARROW_AVAILABLE:
+        fields = [_normalize_column_arrow(df[column]) for column in columns]
+        if not fields:
+            return pa.array([""] * len(df), type=pa.large_string())
+        return pc.binary_join_element_wise(*fields, pa.scalar(FIELD_SEPARATOR, pa.large_string()))
+
+    fields = [_normalize_column(df[column]) for column in columns]
+    rows = [FIELD_SEPARATOR.join(values) for values in zip(*fields)] if fields else [""] * len(df)
+    return pd.Series(rows, dtype=object)
+
+
+def _haystack_buffers(haystack):
+    """Offsets (int64) y bytes UTF-8 (uint8) del texto de búsqueda"""
+    if ARROW_AVAILABLE:
+        haystack = haystack.cast(pa.large_string())
+        offsets = np.frombuffer(haystack.buffers()[1], dtype=np.int64)
+        offsets = offsets[haystack.offset:haystack.offset + len(haystack) + 1]
+        data = np.frombuffer(haystack.buffers()[2], dtype=np.uint8) if len(haystack) else np.empty(0, np.uint8)
+        return offsets, data
+
+    encoded = [value.encode('utf-8') for value in haystack]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _haystack_from_buffers(offsets, data):
+    """Reconstruir el texto de búsqueda a partir de sus buffers persistidos"""
+    if ARROW_AVAILABLE:
+        return pa.LargeStringArray.from_buffers(
+            len(offsets) - 1, pa.py_buffer(offsets), pa.py_buffer(data)
+        )
+    raw = data.tobytes()
+    return pd.Series(
+        [raw[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])],
+        dtype=object
+    )
+
+
+def _trigram_keys(data):
+    """Clave entera de 24 bits de cada trigrama de bytes consecutivos"""
+    data = data.astype(np.uint32)
+    return (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+
+
+def _sorted_unique(values):
+    """Valores únicos ordenados (por ordenación; más rápido que np.unique con hash aquí)"""
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+
+class TrigramIndex:
+    """Índice invertido de trigramas: clave -> lista ordenada de filas que la contienen"""
+
+    # Filas procesadas por bloque al construir, para acotar la memoria temporal
+    BUILD_CHUNK_ROWS = 100_000
+
+    def __init__(self, keys, offsets, postings):
+        self.keys = keys            # uint32, claves ordenadas
+        self.offsets = offsets      # int64, inicio de la lista de cada clave (+1 final)
+        self.postings = postings    # int32, filas de todas las listas concatenadas
+
+    @classmethod
+    def _pairs(cls, row_offsets, data, row_ids=None):
+        """Pares (clave << 32 | fila) únicos y ordenados del texto de búsqueda
+
+        `row_ids` traduce las filas de los buffers a posiciones del catálogo
+        (cuando los buffers son solo de algunas filas).
+        """
+        size = len(row_offsets) - 1
+        pairs = []
+        for start in range(0, size, cls.BUILD_CHUNK_ROWS):
+            stop = min(size, start + cls.BUILD_CHUNK_ROWS)
+            chunk = data[row_offsets[start]:row_offsets[stop]]
+            if len(chunk) < 3:
+                continue
+            rows = np.repeat(np.arange(start, stop, dtype=np.int64), np.diff(row_offsets[start:stop + 1]))
+            # Solo trigramas que empiezan y terminan dentro de la misma fila
+            same_row = rows[:-2] == rows[2:]
+            keys = _trigram_keys(chunk)[same_row].astype(np.int64)
+            rows = rows[:-2][same_row]
+            if row_ids is not None:
+                rows = row_ids[rows]
+            pairs.append(_sorted_unique((keys << 32) | rows))
+        return np.sort(np.concatenate(pairs)) if pairs else np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def build(cls, row_offsets, data):
+        """Construir el índice a partir de los buffers del texto de búsqueda"""
+        return cls._from_pairs(cls._pairs(row_offsets, data))
+
+    @classmethod
+    def _from_pairs(cls, pairs):
+        """Índice a partir de pares (clave << 32 | fila) ordenados"""
+        all_keys = (pairs >> 32).astype(np.uint32)
+        postings = (pairs & 0xFFFFFFFF).astype(np.int32)
+        # Las claves ya están ordenadas: cada lista empieza donde cambia la clave
+        changes = np.ones(len(all_keys), dtype=bool)
+        np.not_equal(all_keys[1:], all_keys[:-1], out=changes[1:])
+        starts = np.flatnonzero(changes)
+        keys = all_keys[starts]
+        offsets = np.append(starts, len(postings)).astype(np.int64)
+        return cls(keys, offsets, postings)
+
+    def replace_rows(self, rows, row_offsets, data, size):
+        """Índice nuevo con las filas `rows` (ordenadas) reindexadas con su texto nuevo
+
+        `row_offsets` y `data` son los buffers del texto nuevo de solo esas filas;
+        las listas del resto de filas se conservan sin volver a calcular trigramas.
+        """
+        replaced = np.zeros(size, dtype=bool)
+        replaced[rows] = True
+        keep = ~replaced[self.postings]
+        keys = np.repeat(self.keys, np.diff(self.offsets))[keep].astype(np.int64)
+        kept = (keys << 32) | self.postings[keep]
+        added = self._pairs(row_offsets, data, rows)
+        return self._from_pairs(np.insert(kept, np.searchsorted(kept, added), added))
+
+    def candidates(self, term):
+        """Filas que contienen todos los trigramas del término (None si es demasiado corto)"""
+        encoded = np.frombuffer(term.encode('utf-8'), dtype=np.uint8)
+        if len(encoded) < 3:
+            return None
+
+        query_keys = _sorted_unique(_trigram_keys(encoded))
+        positions = np.searchsorted(self.keys, query_keys)
+        if (positions >= len(self.keys)).any() or (self.keys[np.minimum(positions, len(self.keys) - 1)] != query_keys).any():
+            return np.empty(0, dtype=np.int64)
+
+        lists = sorted(
+            (self.postings[self.offsets[p]:self.offsets[p + 1]] for p in positions),
+            key=len
+        )
+        result = lists[0]
+        for posting in lists[1:]:
+            # El resultado nunca es más largo que la lista siguiente: búsqueda binaria en ella
+            found = np.minimum(np.searchsorted(posting, result), len(posting) - 1)
+            result = result[posting[found] == result]
+            if len(result) == 0:
+                break
+        return result.astype(np.int64)
+
+
+class SearchIndex:
+    """Texto de búsqueda precalculado e índice de trigramas de una instantánea del catálogo"""
+
+    def __init__(self, df=None, haystack=None, trigrams=None):
+        self.haystack = haystack if haystack is not None else _build_haystack(df)
+        self.size = len(self.haystack)
+        self.trigrams = trigrams if trigrams is not None else TrigramIndex.build(*_haystack_buffers(self.haystack))
+
+    def updated(self, df, rows):
+        """Índice de `df` (mismas filas que este) con el texto de `rows` recalculado"""
+        rows = np.asarray(rows, dtype=np.int64)
+        text = _build_haystack(df.iloc[rows])
+        trigrams = self.trigrams.replace_rows(rows, *_haystack_buffers(text), self.size)
+        if ARROW_AVAILABLE:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[rows] = True
+            haystack = pc.replace_with_mask(self.haystack.cast(pa.large_string()), pa.array(mask), text)
+        else:
+            haystack = self.haystack.copy()
+            haystack.iloc[rows] = text.to_numpy()
+        return SearchIndex(haystack=haystack, trigrams=trigrams)
+
+    def scan(self, term, rows=None):
+        """Comprobar el término sobre el texto completo o solo sobre las filas indicadas"""
+        if ARROW_AVAILABLE:
+            haystack = self.haystack if rows is None else self.haystack.take(pa.array(rows))
+            mask = pc.match_substring(haystack, term).to_numpy(zero_copy_only=False)
+        else:
+            haystack = self.haystack if rows is None else self.haystack.iloc[rows]
+            mask = haystack.str.contains(term, regex=False).to_numpy()
+        matches = np.flatnonzero(mask)
+        return matches if rows is None else rows[matches]
+
+    def match(self, term):
+        """Posiciones de las filas cuyo texto contiene el término ya normalizado"""
+        if not term:
+            return np.arange(self.size)
+        candidates = self.trigrams.candidates(term)
+        if candidates is None:
+            # Términos de menos de tres bytes: recorrido completo
+            return self.scan(term)
+        if len(candidates) == 0:
+            return candidates
+        # Los trigramas solo garantizan presencia, no orden ni contigüidad
+        return self.scan(term, candidates)
+
+
+# Versión del formato persistido; cambiarla invalida los índices guardados
+INDEX_FORMAT = 2
+
+
+def index_path(path=catalog.CSV_FILE_PATH):
+    """Ruta del índice de búsqueda persistido junto a la instantánea"""
+    return os.path.splitext(path)[0] + ".search.npz"
+
+
+def save_search_index(index, path, digest):
+    """Guardar texto de búsqueda y trigramas como arrays enteros compactos"""
+    row_offsets, data = _haystack_buffers(index.haystack)
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                format=np.array(INDEX_FORMAT),
+                digest=np.array(digest),
+                row_offsets=row_offsets,
+                data=data,
+                keys=index.trigrams.keys,
+                offsets=index.trigrams.offsets,
+                postings=index.trigrams.postings,
+            )
+
+    catalog.atomic_write(index_path(path), write)
+
+
+def load_search_index(path, digest):
+    """Cargar el índice persistido si corresponde al contenido actual del catálogo"""
+    if not os.path.exists(index_path(path)):
+        return None
+    with np.load(index_path(path)) as stored:
+        if int(stored['format']) != INDEX_FORMAT or str(stored['digest']) != digest:
+            return None
+        trigrams = TrigramIndex(stored['keys'], stored['offsets'], stored['postings'])
+        haystack = _haystack_from_buffers(stored['row_offsets'], stored['data'])
+    return SearchIndex(haystack=haystack, trigrams=trigrams)
+
+
+def _snapshot_search_index(snapshot):
+    """Índice de una instantánea: se carga del disco o se construye y se guarda"""
+    try:
+        index = load_search_index(snapshot.path, snapshot.digest)
+        if index is not None:
+            return index
+    except Exception as e:
+        print(f"Error cargando índice de búsqueda, se reconstruye: {str(e)}")
+
+    index = SearchIndex(snapshot.df)
+    try:
+        save_search_index(index, snapshot.path, snapshot.digest)
+    except Exception as e:
+        print(f"Error guardando índice de búsqueda: {str(e)}")
+    return index
+
+
+def _normalize_codes(series):
+    """Códigos normalizados igual que el texto de búsqueda y sin espacios en los extremos"""
+    if ARROW_AVAILABLE:
+        return pc.utf8_trim_whitespace(_normalize_column_arrow(series))
+    return pd.Series([value.strip() for value in _normalize_column(series)], dtype=object)
+
+
+def _contains(values, term):
+    """Posiciones (ordenadas) de los valores normalizados que contienen el término"""
+    if ARROW_AVAILABLE:
+        return np.flatnonzero(pc.match_substring(values, term).to_numpy(zero_copy_only=False))
+    return np.flatnonzero(values.str.contains(term, regex=False).to_numpy())
+
+
+class CodeIndex:
+    """Índice hash de código normalizado -> posición de la fila en la instantánea"""
+
+    def __init__(self, df):
+        self.normalized = _normalize_codes(df['Codigo'])
+        codes = pd.Index(np.asarray(self.normalized, dtype=object), dtype=object)
+        # Con códigos repetidos gana la primera aparición, como en un buscarv
+        first = ~codes.duplicated(keep='first')
+        self.codes = codes[first]
+        self.positions = np.flatnonzero(first)
+
+    def get(self, code):
+        """Posición del código ya normalizado, o None si no existe"""
+        try:
+            return int(self.positions[self.codes.get_loc(code)])
+        except KeyError:
+            return None
+
+    def contains(self, term):
+        """Filas cuyo código contiene el término ya normalizado (filtro codigo:)"""
+        return _contains(self.normalized, term)
+
+    def filter(self, rows, term):
+        """Subconjunto de `rows` cuyo código contiene el término"""
+        if ARROW_AVAILABLE:
+            return rows[_contains(self.normalized.take(pa.array(rows)), term)]
+        return rows[_contains(self.normalized.iloc[rows], term)]
+
+    def lookup(self, codes):
+        """Posiciones de una lista de códigos en una sola operación (-1 si no existen)"""
+        normalized = [
+            code.strip().lower() if code.isascii() else normalize_text(code).strip()
+            for code in map(str, codes)
+        ]
+        locations = self.codes.get_indexer(normalized)
+        return np.where(locations >= 0, self.positions[locations], -1)
+
+
+class FamilyIndex:
+    """Familias normalizadas (pocas) y el código de familia de cada fila"""
+
+    def __init__(self, df):
+        codes, families = pd.factorize(df['Familia'], use_na_sentinel=True)
+        self.codes = codes
+        self.families = _normalize_codes(pd.Series(families, dtype=object))
+
+    def contains(self, term):
+        """Filas cuya familia contiene el término ya normalizado (filtro familia:)"""
+        return np.flatnonzero(np.isin(self.codes, _contains(self.families, term)))
+
+    def filter(self, rows, term):
+        """Subconjunto de `rows` cuya familia contiene el término"""
+        return rows[np.isin(self.codes[rows], _contains(self.families, term))]
+
+
+def _stock_values(series):
+    """Stock como float64 con NaN donde falta o no es numérico"""
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+
+
+class StockIndex:
+    """Posiciones de fila ordenadas por stock, para filtrar rangos con searchsorted"""
+
+    def __init__(self, df):
+        stock = _stock_values(df['Stock'])
+        valid = np.flatnonzero(~np.isnan(stock))
+        self.order = valid[np.argsort(stock[valid], kind='stable')]
+        self.values = stock[self.order]
+
+    def between(self, low=None, high=None):
+        """Filas (ordenadas por posición) con low <= stock <= high; None = sin límite"""
+        start = 0 if low is None else np.searchsorted(self.values, low, side='left')
+        stop = len(self.values) if high is None else np.searchsorted(self.values, high, side='right')
+        return np.sort(self.order[start:stop])
+
+
+def _filter_stock(df, rows, low, high):
+    """Subconjunto de `rows` con low <= stock <= high, comparando solo esas filas"""
+    stock = _stock_values(df['Stock'].iloc[rows])
+    mask = ~np.isnan(stock)
+    if low is not None:
+        mask &= stock >= low
+    if high is not None:
+        mask &= stock <= high
+    return rows[mask]
+
+
+class SortIndex:
+    """Orden de las filas por una columna y rango de cada fila en ese orden"""
+
+    def __init__(self, df, column):
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Orden alfabético de las categorías; los nulos (-1) al final
+            category_rank = np.argsort(np.argsort(np.asarray(series.cat.categories, dtype=object)))
+            codes = series.cat.codes.to_numpy()
+            keys = np.where(codes >= 0, category_rank[codes], len(category_rank))
+            self.order = np.argsort(keys, kind='stable')
+        else:
+            self.order = np.asarray(series.array.argsort(kind='stable', na_position='last'))
+        # Los nulos quedan al final del orden, también al ordenar de mayor a menor
+        self.valid = int(series.notna().sum())
+        self.rank = np.empty(len(self.order), dtype=np.int64)
+        self.rank[self.order] = np.arange(len(self.order))
+
+
+def _snapshot_derived(df, key, builder):
+    """Estructura derivada de un DataFrame; se reutiliza si es la instantánea publicada"""
+    snapshot = catalog.snapshot_for(df)
+    if snapshot is not None:
+        return snapshot.derived(key, lambda snapshot: builder(snapshot.df))
+    return builder(df)
+
+
+def compute_stock_levels(stock, low_threshold, high_threshold):
+    """Nivel de stock por fila (int8): bajo <= low < medio <= high < alto; sin dato si no es numérico"""
+    levels = np.searchsorted(
+        np.array([low_threshold, high_threshold], dtype='float64'), stock, side='left'
+    ).astype(np.int8)
+    levels[np.isnan(stock)] = STOCK_LEVEL_UNKNOWN
+    return levels
+
+
+def get_stock_levels(df, low_threshold, high_threshold):
+    """Niveles de stock de un DataFrame, calculados una vez por (instantánea, umbrales)"""
+    return _snapshot_derived(
+        df, f'stock_levels:{low_threshold}:{high_threshold}',
+        lambda df: compute_stock_levels(_stock_values(df['Stock']), low_threshold, high_threshold)
+    )
+
+
+def count_stock_levels(levels):
+    """Número de filas de cada nivel, indexado por STOCK_LEVEL_*"""
+    return np.bincount(levels, minlength=len(STOCK_LEVEL_BADGES))
+
+
+def get_code_index(df):
+    """Índice de códigos de un DataFrame"""
+    return _snapshot_derived(df, 'code_index', CodeIndex)
+
+
+def get_family_index(df):
+    """Índice de familias de un DataFrame"""
+    return _snapshot_derived(df, 'family_index', FamilyIndex)
+
+
+def get_stock_index(df):
+    """Índice de stock ordenado de un DataFrame"""
+    return _snapshot_derived(df, 'stock_index', StockIndex)
+
+
+def sort_rows(df, rows, column=None, descending=False):
+    """Ordenar posiciones de fila por una columna sin materializar el DataFrame
+
+    column=None conserva el orden del catálogo.
+    """
+    if column is None:
+        return rows[::-1] if descending else rows
+
+    index = _snapshot_derived(df, f'sort_index:{column}', lambda df: SortIndex(df, column))
+    if len(rows) == len(index.order):
+        rows = index.order  # catálogo completo: el orden ya está calculado
+    else:
+        rows = rows[np.argsort(index.rank[rows], kind='stable')]
+    if descending:
+        valid = np.searchsorted(index.rank[rows], index.valid)
+        rows = np.concatenate([rows[:valid][::-1], rows[valid:]])
+    return rows
+
+
+def parse_code_list(text):
+    """Extraer códigos de un texto pegado o de un archivo: uno por línea (primera columna)"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) == 1:
+        # Una sola línea: lista separada por comas, punto y coma o tabuladores
+        return [code.strip() for code in re.split(r'[,;\t]', lines[0]) if code.strip()]
+
+    codes = [re.split(r'[,;\t]', line)[0].strip().strip('"') for line in lines]
+    if codes and normalize_text(codes[0]) == 'codigo':
+        codes = codes[1:]  # cabecera de un CSV exportado
+    return [code for code in codes if code]
+
+
+def lookup_codes(df, codes):
+    """Consulta masiva: stock de una lista de códigos con un único join vectorizado"""
+    positions = get_code_index(df).lookup(codes) if len(df) else np.full(len(codes), -1)
+    found = positions >= 0
+
+    matched = df.iloc[np.where(found, positions, 0)].reset_index(drop=True) if len(df) else df.reindex(range(len(codes)))
+    result = pd.DataFrame({'Solicitado': pd.Series(codes, dtype=object)})
+    for column in matched.columns:
+        result[column] = matched[column].mask(~found)
+    return result
+
+
+def get_search_index(df):
+    """Índice de búsqueda de un DataFrame; se reutiliza si es la instantánea publicada"""
+    snapshot = catalog.snapshot_for(df)
+    if snapshot is not None:
+        return snapshot.derived('search_index', _snapshot_search_index)
+    return SearchIndex(df)
+
+
+# Lenguaje de consulta:
+#   pienso 20kg           todas las palabras deben aparecer (en cualquier campo)
+#   "pavo basic"          frase exacta
+#   familia:nobby         solo en la familia (también familia:"dapac premium")
+#   codigo:v02            solo en el código
+#   stock<5  stock>=10    comparaciones de stock (<, <=, >, >=, =)
+#   stock:0  stock:5..20  stock exacto o rango inclusivo (stock:..3, stock:50..)
+QUERY_TOKEN = re.compile(
+    r'(?P<field>[^\W\d_]+)(?P<op><=|>=|<|>|=|:)(?:"(?P<quoted_value>[^"]*)"?|(?P<value>\S*))'
+    r'|"(?P<phrase>[^"]*)"?'
+    r'|(?P<term>\S+)'
+)
+QUERY_FIELDS = {'familia': 'familia', 'codigo': 'codigo', 'stock': 'stock'}
+
+
+class QueryPlan:
+    """Consulta ya interpretada: términos de texto, filtros por campo y rangos de stock"""
+
+    def __init__(self):
+        self.terms = []
+        self.families = []
+        self.codes = []
+        self.stock_ranges = []
+
+    @property
+    def is_single_term(self):
+        return len(self.terms) == 1 and not (self.families or self.codes or self.stock_ranges)
+
+
+def _parse_stock_clause(op, value):
+    """Convertir una condición de stock en rango inclusivo (low, high); None si no es válida"""
+    try:
+        if op == ':' and '..' in value:
+            low, high = value.split('..', 1)
+            return (int(low) if low else None, int(high) if high else None)
+        number = int(value)
+    except ValueError:
+        return None
+    return {
+        ':': (number, number),
+        '=': (number, number),
+        '<': (None, number - 1),
+        '<=': (None, number),
+        '>': (number + 1, None),
+        '>=': (number, None),
+    }[op]
+
+
+@lru_cache(maxsize=1024)
+def parse_query(text):
+    """Interpretar el texto del buscador (se cachea: cada consulta se analiza una vez)"""
+    plan = QueryPlan()
+    for match in QUERY_TOKEN.finditer(text or ""):
+        field = QUERY_FIELDS.get(normalize_text(match.group('field') or ""))
+        op = match.group('op')
+        if field is not None and (field == 'stock' or op == ':'):
+            value = match.group('quoted_value')
+            if value is None:
+                value = match.group('value')
+            if not value:
+                continue  # filtro a medio escribir ("familia:", "stock<"): se ignora
+            if field == 'stock':
+                stock_range = _parse_stock_clause(op, value)
+                if stock_range is not None:
+                    plan.stock_ranges.append(stock_range)
+                    continue
+                plan.terms.append(normalize_text(match.group(0)))
+            elif field == 'familia':
+                plan.families.append(normalize_text(value).strip())
+            else:
+                plan.codes.append(normalize_text(value).strip())
+        elif match.group('phrase') is not None:
+            if match.group('phrase').strip():
+                plan.terms.append(normalize_text(match.group('phrase')))
+        else:
+            plan.terms.append(normalize_text(match.group(0)))
+    return plan
+
+
+def _intersect(row_sets):
+    """Intersección de arrays de posiciones ordenados, empezando por el más pequeño"""
+    row_sets = sorted(row_sets, key=len)
+    result = row_sets[0]
+    for rows in row_sets[1:]:
+        if len(result) == 0:
+            break
+        result = np.intersect1d(result, rows, assume_unique=True)
+    return result
+
+
+def _covers(old_values, new_values):
+    """Cada valor anterior es subcadena de alguno de los nuevos"""
+    return all(any(old in new for new in new_values) for old in old_values)
+
+
+def _range_covers(old_range, new_range):
+    """El rango de stock nuevo está contenido en el anterior"""
+    (old_low, old_high), (new_low, new_high) = old_range, new_range
+    low_ok = old_low is None or (new_low is not None and new_low >= old_low)
+    high_ok = old_high is None or (new_high is not None and new_high <= old_high)
+    return low_ok and high_ok
+
+
+def refines(new_plan, old_plan):
+    """True si toda fila que cumple new_plan cumple también old_plan"""
+    return (
+        _covers(old_plan.terms, new_plan.terms)
+        and _covers(old_plan.families, new_plan.families)
+        and _covers(old_plan.codes, new_plan.codes)
+        and all(
+            any(_range_covers(old_range, new_range) for new_range in new_plan.stock_ranges)
+            for old_range in old_plan.stock_ranges
+        )
+    )
+
+
+def _narrow_rows(df, plan, rows, checked):
+    """Ejecutar un plan comprobando solo las filas candidatas (resultado anterior de la sesión)
+
+    Las condiciones que ya estaban en `checked` (el plan anterior) no se vuelven a comprobar.
+    """
+    index = get_search_index(df)
+    for family in plan.families:
+        if family not in checked.families:
+            rows = get_family_index(df).filter(rows, family)
+    for code in plan.codes:
+        if code not in checked.codes:
+            rows = get_code_index(df).filter(rows, code)
+    for low, high in plan.stock_ranges:
+        if (low, high) not in checked.stock_ranges:
+            rows = _filter_stock(df, rows, low, high)
+    for term in plan.terms:
+        if term in checked.terms:
+            continue
+        if len(rows) == 0:
+            break
+        rows = index.scan(term, rows)
+    return rows.astype(np.int64)
+
+
+def execute_query(df, plan, rows=None, checked=None):
+    """Ejecutar un plan: índices y comparaciones vectorizadas primero, verificación de texto al final
+
+    Con `rows` solo se comprueban esas filas: el resultado de `checked`, un plan
+    anterior que este refina.
+    """
+    if rows is not None:
+        return _narrow_rows(df, plan, rows, checked or QueryPlan())
+
+    index = get_search_index(df)
+
+    row_sets = []
+    for term in plan.terms:
+        candidates = index.trigrams.candidates(term)
+        if candidates is not None:
+            row_sets.append(candidates)
+    row_sets += [get_family_index(df).contains(family) for family in plan.families]
+    row_sets += [get_code_index(df).contains(code) for code in plan.codes]
+    row_sets += [get_stock_index(df).between(low, high) for low, high in plan.stock_ranges]
+
+    rows = _intersect(row_sets) if row_sets else None
+    for term in plan.terms:
+        if rows is not None and len(rows) == 0:
+            break
+        rows = index.scan(term, rows)
+    return np.arange(index.size) if rows is None else rows.astype(np.int64)
+
+
+class QueryCache:
+    """LRU de resultados (posiciones de fila) compartida por todas las sesiones
+
+    Clave: (ruta, versión de la instantánea, consulta normalizada). Si varias
+    sesiones piden a la vez la misma consulta, solo una la calcula y el resto
+    espera su resultado (single-flight). Los resultados de versiones anteriores
+    no se borran al publicar: las sesiones que aún muestran esa instantánea los
+    siguen usando y salen de la caché por LRU como cualquier otro.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _store(self, key, rows):
+        """Guardar un resultado y expulsar los menos usados (llamar con el lock)"""
+        self._entries[key] = rows
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, snapshot, query, compute):
+        """Resultado cacheado de `query`, calculándolo con compute() una sola vez"""
+        key = (snapshot.path, snapshot.version, query)
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return rows
+            flight = self._in_flight.get(key)
+            owner = flight is None
+            if owner:
+                self.misses += 1
+                flight = self._in_flight[key] = [threading.Event(), None]
+            else:
+                self.hits += 1  # otra sesión ya la está calculando
+
+        if not owner:
+            flight[0].wait()
+            if flight[1] is not None:
+                return flight[1]
+            return compute()  # la sesión que calculaba falló: se calcula aquí
+
+        try:
+            rows = compute()
+            rows.setflags(write=False)  # compartido entre sesiones: solo lectura
+            flight[1] = rows
+            with self._lock:
+                self._store(key, rows)
+            return rows
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight[0].set()
+
+    def invalidate(self, snapshot):
+        """Preparar la caché para una instantánea recién publicada
+
+        Si la instantánea solo cambió el stock, los resultados de consultas que
+        solo filtran por familia o código siguen siendo válidos y se copian a la
+        nueva versión. Los términos de texto no: el stock forma parte del texto
+        de búsqueda. Los resultados de la versión anterior se conservan.
+        """
+        delta = snapshot.delta
+        if delta is None or not delta.stock_only:
+            return
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == snapshot.path and key[1] == delta.base_version]:
+                plan = parse_query(key[2].lstrip("~"))
+                rows = self._entries.get(key)  # puede haber salido al copiar las anteriores
+                if rows is not None and not (plan.terms or plan.stock_ranges):
+                    self._store((snapshot.path, snapshot.version, key[2]), rows)
+
+    def clear(self):
+        """Vaciar la caché (no afecta a las consultas en curso)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contadores de aciertos y fallos y número de entradas"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+query_cache = QueryCache()
+
+
+def _exact_code_row(df, plan):
+    """Posición del producto si la consulta es un código completo y ninguna otra fila la contiene"""
+    if not (plan.is_single_term and len(plan.terms[0].strip()) >= MIN_EXACT_CODE_LENGTH and 'Codigo' in df.columns):
+        return None
+    term = plan.terms[0].strip()
+    position = get_code_index(df).get(term)
+    if position is None:
+        return None
+    # Otra fila con todos los trigramas del código (código más largo, repetido, o en
+    # la descripción) también es resultado: se busca por subcadena como con menos letras
+    candidates = get_search_index(df).trigrams.candidates(term)
+    return position if candidates is not None and len(candidates) == 1 else None
+
+
+def _search_rows(df, plan, previous):
+    """Ejecutar una consulta ya interpretada, sin caché"""
+    position = _exact_code_row(df, plan)
+    if position is not None:
+        # Código completo (tecleado o escaneado): acceso directo sin recorrer el catálogo
+        return np.array([position])
+
+    if previous is not None:
+        version, previous_term, previous_rows = previous
+        previous_plan = parse_query(previous_term)
+        # El resultado anterior sirve de candidatos si la nueva consulta lo refina
+        # ("pav" -> "pavo" -> "pavo b"); un acierto por código exacto no vale
+        # porque oculta el resto de coincidencias por subcadena
+        if (version == _df_version(df) and refines(plan, previous_plan)
+                and _exact_code_row(df, previous_plan) is None):
+            return execute_query(df, plan, previous_rows, previous_plan)
+    return execute_query(df, plan)
+
+
+def _df_version(df):
+    snapshot = catalog.snapshot_for(df)
+    return snapshot.version if snapshot is not None else id(df)
+
+
+def search_state(df, search_term, rows):
+    """Estado que la sesión guarda para refinar la siguiente búsqueda"""
+    return (_df_version(df), search_term, rows)
+
+
+def search_rows(df, search_term, previous=None):
+    """Posiciones de las filas que coinciden con la consulta del buscador
+
+    `previous` es el search_state() de la búsqueda anterior de la sesión.
+    """
+    plan = parse_query(search_term)
+    snapshot = catalog.snapshot_for(df)
+    if snapshot is None:
+        return _search_rows(df, plan, previous)
+    query = normalize_text(search_term or "").strip()
+    return query_cache.get(snapshot, query, lambda: _search_rows(df, plan, previous))
+
+
+# Estructuras que solo dependen del texto; las de stock son stock_index,
+# sort_index:Stock y stock_levels:*. El índice de búsqueda incluye ambos.
+TEXT_DERIVED = ('code_index', 'family_index')
+
+
+def _update_derived(key, value, delta, df):
+    """Reutilizar o actualizar una estructura cuando la nueva instantánea conserva las filas"""
+    if key == 'search_index':
+        # Solo se recalculan el texto y los trigramas de las filas cambiadas
+        rows = np.union1d(delta.stock_rows, delta.text_rows)
+        return value.updated(df, rows) if len(rows) else value
+    if key.startswith('stock_levels:'):
+        # Solo se reclasifican las filas cuyo stock cambió
+        _, low_threshold, high_threshold = key.split(':')
+        levels = value.copy()
+        rows = delta.stock_rows
+        levels[rows] = compute_stock_levels(
+            _stock_values(df['Stock'].iloc[rows]), float(low_threshold), float(high_threshold)
+        )
+        return levels
+    if key in ('stock_index', 'sort_index:Stock'):
+        return value if not len(delta.stock_rows) else None
+    if key in TEXT_DERIVED or key.startswith('sort_index:'):
+        return value if not len(delta.text_rows) else None
+    return None
+
+
+def _prepare_search_index(snapshot):
+    """Construir (o cargar) el índice al publicar; si se heredó, persistirlo para la nueva versión"""
+    inherited = snapshot.has_derived('search_index')
+    index = snapshot.derived('search_index', _snapshot_search_index)
+    if inherited:
+        try:
+            save_search_index(index, snapshot.path, snapshot.digest)
+        except Exception as e:
+            print(f"Error guardando índice de búsqueda: {str(e)}")
+
+
+# Al publicar una instantánea nueva el índice se construye (y persiste) en ese momento
+catalog.register_derived_updater(_update_derived)
+catalog.register_publish_hook(query_cache.invalidate)
+catalog.register_publish_hook(_prepare_search_index)
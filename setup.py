@@ -23,6 +23,8 @@ setup(
         "streamlit>=1.46.1",
         "pandas>=2.3.1",
         "paramiko>=3.5.1", 
+        "pyarrow>=17.0.0",
+        "openpyxl>=3.1.0",
         "schedule>=1.2.2",
         "requests>=2.31.0",
     ],
@@ -0,0 +1,309 @@
+"""
+Sesiones SFTP reutilizables compartidas por todo el proceso
+Los botones del panel de administración, el scheduler interno y el de Railway
+piden la sesión al mismo pool: el apretón de manos TCP + SSH y la
+autenticación solo se pagan cuando no hay una sesión viva para ese servidor.
+Las sesiones mantienen keepalive, un temporizador las cierra tras
+IDLE_TIMEOUT_SECONDS sin uso (y todas al salir del proceso) y, si una sesión
+reutilizada falla, se reconecta una vez antes de dar el error.
+"""
+import os
+import time
+import atexit
+import socket
+import hashlib
+import threading
+
+import paramiko
+
+import catalog
+
+KEEPALIVE_SECONDS = 30
+IDLE_TIMEOUT_SECONDS = 300
+MAX_IDLE_PER_SERVER = 2
+# Lecturas de prefetch pendientes a la vez al descargar a disco (~2 MiB en vuelo)
+PREFETCH_REQUESTS = 64
+
+PHASES = ['connect', 'auth', 'open', 'transfer']
+PHASE_LABELS = {
+    'connect': "conexión",
+    'auth': "autenticación",
+    'open': "apertura",
+    'transfer': "transferencia",
+}
+
+
+class SFTPSession:
+    """Transporte SSH autenticado con su canal SFTP abierto"""
+
+    def __init__(self, transport, sftp):
+        self.transport = transport
+        self.sftp = sftp
+        self.last_used = time.monotonic()
+
+    @property
+    def alive(self):
+        return self.transport.is_active()
+
+    def close(self):
+        for resource in (self.sftp, self.transport):
+            try:
+                resource.close()
+            except Exception:
+                pass  # la conexión ya puede estar cortada
+
+
+class SFTPPool:
+    """Sesiones SFTP inactivas por servidor (host, puerto, usuario, contraseña)"""
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT_SECONDS, max_idle=MAX_IDLE_PER_SERVER):
+        self.idle_timeout = idle_timeout
+        self.max_idle = max_idle
+        self.last_timings = None
+        self._idle = {}
+        self._reaper = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(host, port, user, password):
+        return (host, int(port), user, hashlib.sha256((password or "").encode('utf-8')).hexdigest())
+
+    def _connect(self, host, port, user, password, timeout, timings):
+        """Abrir una sesión nueva midiendo conexión, autenticación y apertura del canal"""
+        start = time.perf_counter()
+        sock = socket.create_connection((host, int(port)), timeout=timeout)
+        transport = None
+        try:
+            transport = paramiko.Transport(sock)
+            transport.start_client(timeout=timeout)
+            timings['connect'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            transport.auth_password(user, password)
+            timings['auth'] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            transport.set_keepalive(KEEPALIVE_SECONDS)
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            sftp.get_channel().settimeout(timeout)
+            timings['open'] = time.perf_counter() - start
+        except Exception:
+            if transport is not None:
+                transport.close()
+            sock.close()  # Transport.close() no cierra el socket si la negociación no llegó a activarlo
+            raise
+        return SFTPSession(transport, sftp)
+
+    def _evict_idle(self, now):
+        """Sacar del pool las sesiones caducadas o cerradas; devuelve las que hay que cerrar"""
+        expired = []
+        for key, sessions in list(self._idle.items()):
+            keep = [s for s in sessions if s.alive and now - s.last_used <= self.idle_timeout]
+            expired.extend(s for s in sessions if s not in keep)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return expired
+
+    def _arm_reaper(self):
+        """Programar el cierre de la próxima sesión que caduque (llamar con el lock)"""
+        if self._reaper is not None or not self._idle:
+            return
+        oldest = min(session.last_used for sessions in self._idle.values() for session in sessions)
+        delay = max(0.0, oldest + self.idle_timeout - time.monotonic()) + 1
+        self._reaper = threading.Timer(delay, self._reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    def _reap(self):
+        with self._lock:
+            self._reaper = None
+            expired = self._evict_idle(time.monotonic())
+            self._arm_reaper()
+        for session in expired:
+            session.close()
+
+    def _acquire(self, key):
+        with self._lock:
+            expired = self._evict_idle(time.monotonic())
+            sessions = self._idle.get(key)
+            session = sessions.pop() if sessions else None
+        for stale in expired:
+            stale.close()
+        return session
+
+    def _release(self, key, session):
+        session.last_used = time.monotonic()
+        with self._lock:
+            sessions = self._idle.setdefault(key, [])
+            if len(sessions) < self.max_idle:
+                sessions.append(session)
+                self._arm_reaper()
+                return
+        session.close()
+
+    def evict_idle(self):
+        """Cerrar las sesiones que llevan más de idle_timeout sin usarse"""
+        with self._lock:
+            expired = self._evict_idle(time.monotonic())
+        for session in expired:
+            session.close()
+        return len(expired)
+
+    def close_all(self):
+        """Cerrar todas las sesiones inactivas"""
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle.clear()
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+        for session in sessions:
+            session.close()
+
+    def run(self, host, port, user, password, operation, timeout=30):
+        """Ejecutar operation(sftp, timings) con una sesión del pool
+
+        Las fases que no se ejecutan (conexión y autenticación de una sesión
+        reutilizada) quedan a 0. Si la sesión reutilizada se ha cortado, se
+        descarta y se repite una vez con una conexión nueva.
+        """
+        key = self._key(host, port, user, password)
+        session = self._acquire(key)
+        while True:
+            reused = session is not None
+            timings = dict.fromkeys(PHASES, 0.0)
+            timings['reused'] = reused
+            if session is None:
+                session = self._connect(host, port, user, password, timeout, timings)
+            try:
+                result = operation(session.sftp, timings)
+            except Exception:
+                if session.alive:
+                    # Error de la operación (p. ej. archivo inexistente): la sesión sigue sirviendo
+                    self._release(key, session)
+                    raise
+                session.close()
+                if not reused:
+                    raise
+                session = None
+                continue
+            self._release(key, session)
+            self.last_timings = timings
+            return result
+
+    def stats(self):
+        """Sesiones inactivas disponibles"""
+        with self._lock:
+            return {'idle': sum(len(sessions) for sessions in self._idle.values())}
+
+
+pool = SFTPPool()
+# Cerrar las sesiones SSH con el proveedor al terminar el proceso
+atexit.register(pool.close_all)
+
+
+def _read_file(sftp, remote_path, timings):
+    """Leer el archivo remoto completo midiendo apertura y transferencia"""
+    start = time.perf_counter()
+    with sftp.open(remote_path, 'rb') as remote_file:
+        timings['open'] += time.perf_counter() - start
+        start = time.perf_counter()
+        content = remote_file.read()
+    timings['transfer'] = time.perf_counter() - start
+    return content
+
+
+def download_file(host, port, user, password, remote_path, timeout=30):
+    """Contenido del archivo remoto (bytes) usando una sesión del pool"""
+    return pool.run(host, port, user, password,
+                    lambda sftp, timings: _read_file(sftp, remote_path, timings), timeout)
+
+
+def remote_source(host, port, user, remote_path):
+    """Identificador del archivo remoto para comparar con la última descarga"""
+    return f"{user}@{host}:{int(port)}{remote_path}"
+
+
+def _stream_to_file(sftp, remote_path, local_path, timings):
+    """Descargar por bloques a un temporal junto a local_path con lecturas en paralelo (prefetch)
+
+    Devuelve (ruta temporal, sha256). Como mucho PREFETCH_REQUESTS lecturas
+    (de hasta 32 KiB) quedan pendientes a la vez, así que la memoria no crece
+    con el tamaño del archivo.
+    """
+    start = time.perf_counter()
+    with sftp.open(remote_path, 'rb') as remote_file:
+        remote_file.prefetch(remote_file.stat().st_size, max_concurrent_requests=PREFETCH_REQUESTS)
+        timings['open'] += time.perf_counter() - start
+        start = time.perf_counter()
+        result = catalog.spool_to_file(remote_file, local_path)
+    timings['transfer'] = time.perf_counter() - start
+    return result
+
+
+def download_if_changed(host, port, user, password, remote_path, last_fetch=None,
+                        local_path=catalog.CSV_FILE_PATH, timeout=30):
+    """Descargar el archivo remoto a disco solo si cambió desde last_fetch
+
+    Primero un stat: si tamaño y fecha de modificación coinciden con la última
+    descarga no se transfiere nada. Si difieren se descarga a un temporal junto
+    a local_path calculando el hash, y si el contenido es el mismo se descarta.
+    Devuelve (ruta del temporal o None si no cambió, datos de esta comprobación
+    para guardar como nuevo last_fetch).
+    """
+    source = remote_source(host, port, user, remote_path)
+    if not last_fetch or last_fetch.get('source') != source:
+        last_fetch = {}
+
+    def operation(sftp, timings):
+        start = time.perf_counter()
+        attributes = sftp.stat(remote_path)
+        timings['open'] += time.perf_counter() - start
+        fetch = {
+            'source': source,
+            'size': attributes.st_size,
+            'mtime': attributes.st_mtime,
+            'sha256': last_fetch.get('sha256'),
+        }
+        if fetch['mtime'] is not None and last_fetch and \
+                (fetch['size'], fetch['mtime']) == (last_fetch.get('size'), last_fetch.get('mtime')):
+            return None, fetch
+
+        tmp_path, fetch['sha256'] = _stream_to_file(sftp, remote_path, local_path, timings)
+        if fetch['sha256'] == last_fetch.get('sha256'):
+            os.remove(tmp_path)
+            return None, fetch
+        return tmp_path, fetch
+
+    return pool.run(host, port, user, password, operation, timeout)
+
+
+def stat_file(host, port, user, password, remote_path, timeout=30):
+    """(tamaño, fecha de modificación) del archivo remoto con una sola petición stat en una sesión del pool"""
+    def operation(sftp, timings):
+        start = time.perf_counter()
+        attributes = sftp.stat(remote_path)
+        timings['open'] += time.perf_counter() - start
+        return attributes.st_size, attributes.st_mtime
+    return pool.run(host, port, user, password, operation, timeout)
+
+
+def check_connection(host, port, user, password, timeout=10):
+    """Comprobar que el servidor responde con una sesión SFTP del pool"""
+    def operation(sftp, timings):
+        start = time.perf_counter()
+        sftp.normalize('.')
+        timings['open'] += time.perf_counter() - start
+        return True
+    return pool.run(host, port, user, password, operation, timeout)
+
+
+def format_timings(timings):
+    """Texto con la duración de cada fase de la última operación SFTP"""
+    if not timings:
+        return ""
+    parts = [f"{PHASE_LABELS[phase]} {timings[phase] * 1e3:.0f} ms" for phase in PHASES]
+    origin = "sesión reutilizada" if timings.get('reused') else "sesión nueva"
+    return " · ".join(parts) + f" ({origin})"
@@ -0,0 +1,98 @@
+"""
+Servidor SFTP local (paramiko) para las pruebas de descarga
+"""
+import os
+import socket
+import threading
+from types import SimpleNamespace
+
+import paramiko
+import pytest
+
+SFTP_USER = "stock"
+SFTP_PASSWORD = "clave"
+
+
+class _Server(paramiko.ServerInterface):
+    def check_auth_password(self, username, password):
+        if (username, password) == (SFTP_USER, SFTP_PASSWORD):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _Handle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+def _sftp_interface(root, requests):
+    class Interface(paramiko.SFTPServerInterface):
+        def canonicalize(self, path):
+            return os.path.normpath("/" + path)
+
+        def _local(self, path):
+            return os.path.join(root, self.canonicalize(path).lstrip("/"))
+
+        def stat(self, path):
+            requests.append(('stat', path))
+            try:
+                return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+
+        lstat = stat
+
+        def open(self, path, flags, attr):
+            requests.append(('open', path))
+            try:
+                handle = _Handle(flags)
+                handle.readfile = open(self._local(path), 'rb')
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            handle.filename = self._local(path)
+            return handle
+
+    return Interface
+
+
+@pytest.fixture(scope="session")
+def host_key():
+    return paramiko.RSAKey.generate(2048)
+
+
+@pytest.fixture
+def sftp_server(tmp_path, host_key):
+    """Servidor SFTP en 127.0.0.1 que sirve tmp_path/sftp; anota conexiones y peticiones"""
+    root = tmp_path / "sftp"
+    root.mkdir()
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(8)
+    server = SimpleNamespace(
+        host="127.0.0.1", port=listener.getsockname()[1], user=SFTP_USER, password=SFTP_PASSWORD,
+        root=root, transports=[], requests=[],
+    )
+
+    def accept():
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return  # servidor cerrado al terminar la prueba
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _sftp_interface(str(root), server.requests))
+            transport.start_server(server=_Server())
+            server.transports.append(transport)
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield server
+    listener.close()
+    for transport in server.transports:
+        transport.close()
@@ -0,0 +1,54 @@
+"""
+Pruebas de lectura del catálogo con el esquema declarado
+Ejecutar con: python -m pytest -q
+"""
+from io import StringIO
+
+import pandas as pd
+
+import catalog
+
+
+def test_fractional_stock_is_rounded_instead_of_rejected(capsys):
+    df = catalog.read_catalog_csv(StringIO(
+        "Codigo,Descripcion,Familia,Stock\n"
+        "A1,Pienso,Nobby,2.5\n"
+        "B2,Arena,Dapac,3\n"
+        "C3,Hueso,Nobby,-1.5\n"
+        "D4,Collar,Nobby,\n"
+        "E5,Correa,Nobby,9999999999\n"
+    ))
+
+    assert df['Stock'].dtype == 'Int32'
+    assert df['Stock'].tolist() == [3, 3, -2, pd.NA, pd.NA]
+    output = capsys.readouterr().out
+    assert "redondeado en 2 filas: A1, C3" in output
+    assert "fuera de rango" in output and "E5" in output
+
+
+def test_apply_schema_rounds_fractional_stock():
+    df = catalog.apply_catalog_schema(pd.DataFrame({
+        'Codigo': ['A1', 'B2'], 'Descripcion': ['x', 'y'], 'Familia': ['f', 'f'], 'Stock': [4.6, 7.0],
+    }))
+
+    assert df['Stock'].tolist() == [5, 7]
+
+
+def test_feather_snapshot_loads_without_conversion(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = "data/productos.csv"
+    catalog.publish_catalog(pd.DataFrame({
+        'Codigo': ['007', 'B2'], 'Descripcion': ['Pienso', 'Arena'], 'Familia': ['Nobby', 'Dapac'], 'Stock': [1, 2],
+    }), path)
+
+    # La instantánea ya trae los tipos declarados: apply_catalog_schema no tiene nada que convertir
+    apply_catalog_schema = catalog.apply_catalog_schema
+    converted = []
+    monkeypatch.setattr(catalog, 'apply_catalog_schema', lambda df: converted.append(apply_catalog_schema(df) is not df) or df)
+    try:
+        df = catalog._read_snapshot(catalog.snapshot_path(path))
+
+        assert converted == [False]
+        assert df['Codigo'].tolist() == ['007', 'B2']
+    finally:
+        catalog.invalidate_catalog(path)
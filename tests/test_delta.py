@@ -0,0 +1,139 @@
+"""
+Pruebas de las diferencias por clave entre catálogos
+Ejecutar con: python -m pytest -q
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import catalog
+import delta
+
+
+def _catalog(codes, stock, descriptions=None, families=None):
+    return catalog.apply_catalog_schema(pd.DataFrame({
+        'Codigo': codes,
+        'Descripcion': descriptions or [f"Producto {code}" for code in codes],
+        'Familia': families or ['Nobby'] * len(codes),
+        'Stock': stock,
+    }))
+
+
+def _brute_force(old_df, new_df):
+    """Altas, bajas y cambios comparando fila a fila por Codigo"""
+    old = {row.Codigo: row for row in old_df.astype(object).itertuples(index=False)}
+    new = {row.Codigo: row for row in new_df.astype(object).itertuples(index=False)}
+
+    def same(a, b):
+        return (pd.isna(a) and pd.isna(b)) or (not pd.isna(a) and not pd.isna(b) and a == b)
+
+    kept = [code for code in old if code in new]
+    return {
+        'added': sorted(code for code in new if code not in old),
+        'removed': sorted(code for code in old if code not in new),
+        'stock': sorted(code for code in kept if not same(old[code].Stock, new[code].Stock)),
+        'text': sorted(code for code in kept if not (same(old[code].Descripcion, new[code].Descripcion)
+                                                     and same(old[code].Familia, new[code].Familia))),
+    }
+
+
+def _observed(changes, old_df, new_df):
+    result = changes.apply(new_df)
+    codes = result['Codigo'].tolist()
+    return {
+        'added': sorted(codes[len(changes.kept):]),
+        'removed': sorted(old_df['Codigo'].iloc[changes.removed]),
+        'stock': sorted(codes[row] for row in changes.stock_rows),
+        'text': sorted(codes[row] for row in changes.text_rows),
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_diff_matches_brute_force_on_random_changes(seed):
+    rng = np.random.default_rng(seed)
+    size = 200
+    codes = [f"P{n:04d}" for n in range(size)]
+    stock = rng.integers(0, 50, size=size).astype(object)
+    stock[rng.choice(size, 10, replace=False)] = None
+    families = rng.choice(['Nobby', 'Dapac', 'Flexi'], size=size).tolist()
+    old_df = _catalog(codes, stock, families=families)
+
+    new = old_df.astype(object).copy()
+    rows = rng.choice(size, 30, replace=False)
+    new.loc[rows[:10], 'Stock'] = rng.integers(0, 50, size=10)
+    new.loc[rows[10:15], 'Stock'] = None
+    new.loc[rows[15:20], 'Descripcion'] = "Descripción nueva"
+    new.loc[rows[20:25], 'Familia'] = "Familia nueva"
+    new = new.drop(index=rows[25:]).sample(frac=1, random_state=seed)
+    new = pd.concat([new, pd.DataFrame({'Codigo': ['N1', 'N2'], 'Descripcion': ['Alta', 'Alta'],
+                                        'Familia': ['Nobby', None], 'Stock': [1, None]})])
+    new_df = _catalog(new['Codigo'].tolist(), new['Stock'].tolist(),
+                      new['Descripcion'].tolist(), new['Familia'].tolist())
+
+    changes = delta.diff_catalog(old_df, new_df)
+
+    assert _observed(changes, old_df, new_df) == _brute_force(old_df, new_df)
+    # Las filas conservadas mantienen el orden de la instantánea anterior
+    result = changes.apply(new_df)
+    kept_codes = result['Codigo'].iloc[:len(changes.kept)].tolist()
+    assert kept_codes == [code for code in old_df['Codigo'] if code in set(new_df['Codigo'])]
+
+
+def test_stock_only_changes_keep_positions():
+    old_df = _catalog(['A1', 'B2', 'C3'], [5, 12, 40])
+    new_df = _catalog(['A1', 'B2', 'C3'], [5, 13, None])
+
+    changes = delta.diff_catalog(old_df, new_df, base_version=7)
+
+    assert changes.stock_only and changes.in_order and not changes.is_empty
+    assert changes.stock_rows.tolist() == [1, 2] and changes.base_version == 7
+    assert delta.diff_catalog(old_df, old_df.copy()).is_empty
+
+
+@pytest.mark.parametrize("old_codes, new_codes", [
+    (['A1', 'A1', 'C3'], ['A1', 'B2', 'C3']),
+    (['A1', 'B2', 'C3'], ['A1', 'B2', 'B2']),
+])
+def test_duplicate_keys_disable_the_diff(old_codes, new_codes):
+    assert delta.diff_catalog(_catalog(old_codes, [1, 2, 3]), _catalog(new_codes, [1, 2, 3])) is None
+
+
+def test_same_code_in_other_source_is_not_a_duplicate():
+    old_df = _catalog(['A1', 'A1'], [1, 2])
+    old_df['Proveedor'] = ['Lucero', 'Lucero']
+    old_df['Almacen'] = ['Norte', 'Sur']
+    new_df = old_df.copy()
+    new_df['Stock'] = new_df['Stock'].astype(object)
+    new_df.loc[1, 'Stock'] = 9
+    new_df = catalog.apply_catalog_schema(new_df)
+
+    changes = delta.diff_catalog(old_df, new_df)
+
+    assert changes.key_columns == ['Codigo', 'Proveedor', 'Almacen']
+    assert changes.stock_rows.tolist() == [1]
+
+
+def test_stock_feed_with_duplicate_codes_keeps_the_last_value():
+    old_df = _catalog(['A1', 'B2', 'C3'], [5, 12, 40])
+    feed = pd.DataFrame({'Codigo': ['B2', 'B2', 'ZZ'], 'Stock': [1, 2, 3]})
+
+    changes, new_df, unknown = delta.stock_delta(old_df, feed)
+
+    assert new_df['Stock'].tolist() == [5, 2, 40]
+    assert changes.stock_rows.tolist() == [1] and unknown == 1
+    with pytest.raises(ValueError, match="Claves repetidas"):
+        delta.stock_delta(_catalog(['A1', 'A1'], [1, 2]), feed)
+
+
+def test_catalog_with_duplicate_codes_is_published_whole(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = "data/productos.csv"
+    catalog.publish_catalog(_catalog(['A1', 'B2'], [1, 2]), path)
+    try:
+        snapshot = catalog.publish_catalog(_catalog(['A1', 'B2', 'B2'], [1, 3, 4]), path)
+
+        assert snapshot.delta is None
+        assert snapshot.df['Codigo'].tolist() == ['A1', 'B2', 'B2']
+        assert snapshot.df['Stock'].tolist() == [1, 3, 4]
+    finally:
+        catalog.invalidate_catalog(path)
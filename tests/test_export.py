@@ -0,0 +1,107 @@
+"""
+Pruebas de la exportación de resultados en segundo plano
+Ejecutar con: python -m pytest -q
+"""
+import gzip
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import export
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'Codigo': ['A1', 'B2', 'C3', 'D4', 'E5'],
+        'Descripcion': ['Pienso pavo', 'Arena gato', 'Hueso perro', 'Collar', 'Snack'],
+        'Familia': ['Nobby', 'Dapac', 'Nobby', None, 'Dapac'],
+        'Stock': [5, 12, 40, 0, 3],
+    })
+
+
+def _read(export_format, content):
+    if export_format == "CSV":
+        return pd.read_csv(io.BytesIO(content), dtype={'Codigo': str})
+    if export_format == "CSV comprimido (gzip)":
+        return pd.read_csv(io.BytesIO(gzip.decompress(content)), dtype={'Codigo': str})
+    if export_format == "Parquet":
+        return pd.read_parquet(io.BytesIO(content))
+    return pd.read_excel(io.BytesIO(content))
+
+
+def _finished(job):
+    assert job.wait(timeout=30)
+    assert job.error is None
+    return job
+
+
+@pytest.mark.parametrize("export_format", export.available_formats())
+def test_export_writes_selected_rows_in_every_format(df, export_format, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 2)
+    rows = np.array([0, 2, 3, 4])
+
+    job = _finished(export.ExportJob(df, rows, export_format, "pavo", "prueba"))
+
+    exported = _read(export_format, job.read())
+    assert exported['Codigo'].tolist() == ['A1', 'C3', 'D4', 'E5']
+    assert exported['Stock'].tolist() == [5, 40, 0, 3]
+    assert exported['Familia'].isna().tolist() == [False, False, True, False]
+    assert job.file_name == f"prueba.{export.EXPORT_FORMATS[export_format][0]}"
+    assert os.path.dirname(job.path) == export.EXPORT_DIR
+
+
+def test_export_follows_the_view_sort(df):
+    rows = np.array([0, 1, 2, 4])
+
+    job = _finished(export.ExportJob(df, rows, "CSV", "", sort=('Stock', True)))
+
+    assert _read("CSV", job.read())['Codigo'].tolist() == ['C3', 'B2', 'A1', 'E5']
+    assert job.matches(df, "CSV", "", sort=('Stock', True))
+    assert not job.matches(df, "CSV", "", sort=('Stock', False))
+    assert not job.matches(df, "CSV", "", fuzzy=True, sort=('Stock', True))
+    assert not job.matches(df.copy(), "CSV", "", sort=('Stock', True))
+
+
+@pytest.mark.skipif(not export.OPENPYXL_AVAILABLE, reason="openpyxl no instalado")
+def test_xlsx_export_over_the_sheet_limit_reports_an_error(df, monkeypatch):
+    monkeypatch.setattr(export, "XLSX_MAX_ROWS", 3)
+
+    job = export.ExportJob(df, np.arange(4), "Excel (XLSX)", "")
+
+    assert job.wait(timeout=30)
+    assert "como máximo 3 filas" in job.error
+    # Justo en el límite sí se genera
+    assert _read("Excel (XLSX)", _finished(export.ExportJob(df, np.arange(3), "Excel (XLSX)", "")).read()).shape[0] == 3
+
+
+def test_prepared_file_is_read_once_and_removed_on_discard(df):
+    job = _finished(export.ExportJob(df, np.arange(5), "CSV", ""))
+    content = job.read()
+    os.remove(job.path)
+    assert job.read() is content
+
+    other = _finished(export.ExportJob(df, np.arange(5), "CSV", ""))
+    other.discard()
+    for _ in range(100):
+        if not os.path.exists(other.path):
+            break
+        time.sleep(0.01)
+    assert not os.path.exists(other.path)
+
+
+def test_cleanup_removes_only_stale_exports(df):
+    job = _finished(export.ExportJob(df, np.arange(5), "CSV", ""))
+    stale = os.path.join(export.EXPORT_DIR, "export_abandonada.csv")
+    with open(stale, 'w') as f:
+        f.write("Codigo\n")
+    os.utime(stale, (0, 0))
+
+    export.cleanup_exports()
+
+    assert not os.path.exists(stale)
+    assert os.path.exists(job.path)
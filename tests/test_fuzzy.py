@@ -0,0 +1,78 @@
+"""
+Pruebas de la búsqueda tolerante a errores de escritura
+Ejecutar con: python -m pytest -q
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import fuzzy
+import search
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'Codigo': ['A1', 'B2', 'C3', 'D4', 'E5'],
+        'Descripcion': ['Pienso pavo basic', 'Pienso pollo', 'Arena gato', 'Collar gato grande', 'Snack sal'],
+        'Familia': ['Nobby', 'Nobby', 'Dapac', 'Nobby', 'Dapac'],
+        'Stock': [5, 12, 40, 0, 3],
+    })
+
+
+def _reference_distance(a, b):
+    """Damerau-Levenshtein (transposiciones contiguas) sin límite ni atajos"""
+    d = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i, j in itertools.product(range(1, len(a) + 1), range(1, len(b) + 1)):
+        d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+        if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+            d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[-1][-1]
+
+
+def test_edit_distance_matches_reference_up_to_limit():
+    rng = np.random.default_rng(3)
+    for _ in range(500):
+        a, b = ("".join(rng.choice(list("abcs"), size=rng.integers(0, 7))) for _ in range(2))
+        assert fuzzy.edit_distance(a, b) == min(_reference_distance(a, b), fuzzy.MAX_EDIT_DISTANCE + 1)
+
+
+@pytest.mark.parametrize("term", ['pienzo', 'piesno', 'gatto', 'colar', 'sel', 'arenas', 'xyzzy'])
+def test_suggestions_are_every_close_vocabulary_word(df, term):
+    index = fuzzy.FuzzyIndex(df)
+    limit = fuzzy.max_distance_for(term)
+    expected = sorted(
+        (word, _reference_distance(term, word), int(count))
+        for word, count in zip(index.words, index.counts)
+        if _reference_distance(term, word) <= limit
+    )
+
+    suggestions = index.suggest(term, limit=len(index.words))
+
+    assert sorted(suggestions) == expected
+    assert suggestions == sorted(suggestions, key=lambda item: (item[1], -item[2], item[0]))
+
+
+def test_short_words_allow_fewer_errors(df):
+    index = fuzzy.FuzzyIndex(df)
+    assert fuzzy.max_distance_for('sa') == 0 and index.suggest('sa') == []
+    assert [word for word, _, _ in index.suggest('sol')] == ['sal']
+    assert [word for word, _, _ in index.suggest('pienzzo')] == ['pienso']
+
+
+def test_suggest_queries_corrects_only_unknown_words(df):
+    assert fuzzy.suggest_queries(df, 'pienzo familia:nobby "pavo basic"') == ['pienso familia:nobby "pavo basic"']
+    assert fuzzy.suggest_queries(df, 'pienso gato') == []
+    assert fuzzy.suggest_queries(df, 'gatp pollp')[0] == 'gato pollo'
+
+
+def test_fuzzy_rows_tolerate_typos_but_keep_filters_and_phrases(df):
+    assert fuzzy.fuzzy_rows(df, 'pienzo').tolist() == [0, 1]
+    assert fuzzy.fuzzy_rows(df, 'pienzo stock>10').tolist() == [1]
+    assert fuzzy.fuzzy_rows(df, 'gatto familia:nobby').tolist() == [3]
+    assert fuzzy.fuzzy_rows(df, '"pavo basik"').tolist() == []
+    # Sin errores coincide con la búsqueda exacta
+    for term in ['pienso', 'gato', 'a1', '40', 'familia:dapac']:
+        assert fuzzy.fuzzy_rows(df, term).tolist() == search.search_rows(df, term).tolist()
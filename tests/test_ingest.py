@@ -0,0 +1,115 @@
+"""
+Pruebas de la ingesta concurrente de varias fuentes
+Ejecutar con: python -m pytest -q
+"""
+import os
+import time
+
+import pytest
+
+import catalog
+import ingest
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Directorio de trabajo con data/ vacío; el catálogo publicado se retira al terminar"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    yield tmp_path
+    catalog.invalidate_catalog(catalog.CSV_FILE_PATH)
+
+
+def _http_source(tmp_path, name, rows, **extra):
+    path = tmp_path / f"{name}.csv"
+    path.write_text("Codigo,Descripcion,Familia,Stock\n" + "".join(f"{row}\n" for row in rows))
+    return dict({'name': name, 'type': 'http', 'url': path.as_uri()}, **extra)
+
+
+def _by_source(results):
+    return {result.name: result.status for result in results}
+
+
+def test_sources_are_merged_with_supplier_and_warehouse(workdir, sftp_server):
+    (sftp_server.root / "stock.csv").write_text("Codigo,Descripcion,Familia,Stock\nS1,Arena,Dapac,3\n")
+    config = {'sources': [
+        _http_source(workdir, 'norte', ["N1,Pienso,Nobby,5", "N2,Hueso,Nobby,0"], proveedor="Lucero", almacen="Norte"),
+        {'name': 'central', 'type': 'sftp', 'host': sftp_server.host, 'port': sftp_server.port,
+         'user': sftp_server.user, 'password': sftp_server.password, 'file_path': '/stock.csv'},
+        _http_source(workdir, 'apagada', ["X1,Otro,Nobby,1"], enabled=False),
+    ]}
+
+    results, merged = ingest.ingest_sources(config)
+
+    assert _by_source(results) == {'norte': 'updated', 'central': 'updated'}
+    assert merged['Codigo'].tolist() == ['N1', 'N2', 'S1']
+    assert merged['Proveedor'].astype(str).tolist() == ['Lucero', 'Lucero', 'central']
+    assert merged['Almacen'].astype(str).tolist() == ['Norte', 'Norte', 'central']
+    assert catalog.get_catalog(catalog.CSV_FILE_PATH).df['Codigo'].tolist() == ['N1', 'N2', 'S1']
+    assert set(config['source_fetches']) == {'norte', 'central'}
+
+
+def test_unchanged_sources_do_not_republish(workdir):
+    config = {'sources': [_http_source(workdir, 'norte', ["N1,Pienso,Nobby,5"])]}
+    ingest.ingest_sources(config)
+    version = catalog.get_catalog(catalog.CSV_FILE_PATH).version
+
+    results, merged = ingest.ingest_sources(config)
+
+    assert _by_source(results) == {'norte': 'unchanged'} and merged is None
+    assert catalog.get_catalog(catalog.CSV_FILE_PATH).version == version
+
+
+def test_failing_source_falls_back_to_its_last_valid_copy(workdir):
+    norte = _http_source(workdir, 'norte', ["N1,Pienso,Nobby,5"])
+    sur = _http_source(workdir, 'sur', ["S1,Arena,Dapac,3"])
+    config = {'sources': [norte, sur]}
+    ingest.ingest_sources(config)
+
+    (workdir / "norte.csv").write_text("Codigo,Stock\nN1,9\n")  # columnas incompletas
+    (workdir / "sur.csv").unlink()
+    nueva = _http_source(workdir, 'nueva', ["Z1,Collar,Nobby,2"])
+    config['sources'].append(dict(nueva, url=(workdir / "no_existe.csv").as_uri()))
+    results, merged = ingest.ingest_sources(config)
+
+    assert _by_source(results) == {'norte': 'stale', 'sur': 'stale', 'nueva': 'failed'}
+    assert "Columnas faltantes" in results[0].message
+    assert merged is None  # las copias anteriores son las ya publicadas
+    assert catalog.get_catalog(catalog.CSV_FILE_PATH).df['Codigo'].tolist() == ['N1', 'S1']
+
+
+def test_slow_source_does_not_block_the_others(workdir, monkeypatch):
+    def slow_fetch(source, last_fetch, path, timeout):
+        time.sleep(2)
+        raise TimeoutError("demasiado tarde")
+
+    monkeypatch.setitem(ingest.FETCHERS, 'lenta', slow_fetch)
+    config = {'sources': [
+        {'name': 'lenta', 'type': 'lenta', 'timeout': 0.2},
+        _http_source(workdir, 'norte', ["N1,Pienso,Nobby,5"]),
+    ]}
+
+    start = time.monotonic()
+    results, merged = ingest.ingest_sources(config)
+
+    assert time.monotonic() - start < 1.5
+    assert _by_source(results) == {'lenta': 'failed', 'norte': 'updated'}
+    assert "Sin respuesta en 0.2s" in results[0].message
+    assert merged['Codigo'].tolist() == ['N1']
+
+
+def test_poll_sftp_detects_changes_with_a_single_stat(sftp_server):
+    remote = sftp_server.root / "stock.csv"
+    remote.write_text("Codigo,Descripcion,Familia,Stock\nA1,Pienso,Nobby,5\n")
+    config = {'sftp_config': {'host': sftp_server.host, 'port': sftp_server.port, 'user': sftp_server.user,
+                              'password': sftp_server.password, 'file_path': '/stock.csv'}}
+
+    changed, stat = ingest.poll_sftp(config)
+    assert changed and stat['size'] == remote.stat().st_size
+    config['poll_stat'] = stat  # la actualización terminó bien
+
+    assert ingest.poll_sftp(config) == (False, stat)
+    remote.write_text("Codigo,Descripcion,Familia,Stock\nA1,Pienso,Nobby,7\n")
+    os.utime(remote, (stat['mtime'] + 60, stat['mtime'] + 60))
+    assert ingest.poll_sftp(config)[0]
+    assert {request[0] for request in sftp_server.requests} == {'stat'}
@@ -0,0 +1,106 @@
+"""
+Pruebas del historial de ejecuciones y de la recuperación de ejecuciones perdidas
+Ejecutar con: python -m pytest -q
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from job_scheduler import CronTrigger, IntervalTrigger, JobScheduler, OnDemandTrigger
+from job_store import JobStore, missed_slot, run_result
+
+DAILY = CronTrigger("0 2 * * *")
+
+
+@pytest.mark.parametrize("last, now, expected", [
+    (datetime(2025, 6, 1, 2, 0), datetime(2025, 6, 1, 10, 0), None),
+    (datetime(2025, 6, 1, 2, 0), datetime(2025, 6, 2, 1, 59), None),
+    (datetime(2025, 6, 1, 2, 0), datetime(2025, 6, 2, 2, 0), datetime(2025, 6, 2, 2, 0)),
+    # Varias perdidas: solo se recupera la última
+    (datetime(2025, 6, 1, 2, 0), datetime(2025, 6, 4, 9, 30), datetime(2025, 6, 4, 2, 0)),
+    (None, datetime(2025, 6, 4, 9, 30), datetime(2025, 6, 4, 9, 30)),
+])
+def test_missed_slot_of_a_daily_job(last, now, expected):
+    assert missed_slot(DAILY, last, now) == expected
+
+
+def test_missed_slot_of_interval_and_on_demand_jobs():
+    last = datetime(2025, 6, 1, 12, 0)
+    assert missed_slot(IntervalTrigger(600), last, datetime(2025, 6, 1, 12, 35)) == datetime(2025, 6, 1, 12, 30)
+    assert missed_slot(IntervalTrigger(600), last, datetime(2025, 6, 1, 12, 9)) is None
+    assert missed_slot(OnDemandTrigger(), last, datetime(2025, 6, 2)) is None
+    assert missed_slot(OnDemandTrigger(), None, datetime(2025, 6, 2)) is None
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(path=str(tmp_path / "scheduler.db"))
+
+
+def test_runs_are_recorded_with_their_outcome(store):
+    run_id = store.start_run("diaria", datetime(2025, 6, 1, 2, 0), holder="nodo-a")
+    store.finish_run(run_id, 'updated', "Catálogo actualizado", size=2048, rows=4548, duration=1.5)
+    store.start_run("diaria", datetime(2025, 6, 2, 2, 0), recovery=True)
+
+    assert store.last_scheduled("diaria") == datetime(2025, 6, 2, 2, 0)
+    assert store.last_scheduled("otra") is None
+    latest, first = store.recent_runs(job="diaria")
+    assert latest['outcome'] == 'running' and latest['recovery'] == 1
+    assert (first['outcome'], first['bytes'], first['rows'], first['holder']) == ('updated', 2048, 4548, 'nodo-a')
+    assert store.recent_runs(limit=1)[0]['id'] == latest['id']
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_scheduler_catches_up_once_after_downtime(store):
+    store.start_run("diaria", datetime.now() - timedelta(days=3))
+    slot = missed_slot(DAILY, store.last_scheduled("diaria"), datetime.now())
+    runs = []
+    scheduler = JobScheduler(log=lambda message: None, store=store)
+    job = scheduler.add_job("diaria", lambda: runs.append(1) or run_result('updated', rows=10), DAILY, catch_up=True)
+    assert job.recovery_slot == slot
+
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: store.recent_runs(job="diaria")[0]['finished_at'] is not None)
+    finally:
+        scheduler.stop(timeout=5)
+
+    latest = store.recent_runs(job="diaria")[0]
+    assert runs == [1]
+    assert (latest['outcome'], latest['rows'], latest['recovery']) == ('updated', 10, 1)
+    assert latest['scheduled_at'] == slot.strftime("%Y-%m-%d %H:%M:%S")
+    assert job.recovery_slot is None and job.next_run == DAILY.next_after(job.last_run)
+
+
+def test_recovery_already_done_by_another_node_is_skipped(store):
+    store.start_run("diaria", datetime.now() - timedelta(days=3))
+    runs = []
+    scheduler = JobScheduler(log=lambda message: None, store=store)
+    job = scheduler.add_job("diaria", lambda: runs.append(1), DAILY, catch_up=True)
+    store.start_run("diaria", job.recovery_slot, holder="otro-nodo")
+
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: scheduler.get_job("diaria").last_run is not None)
+    finally:
+        scheduler.stop(timeout=5)
+
+    assert runs == []
+    assert len(store.recent_runs(job="diaria")) == 2
+
+
+def test_no_catch_up_when_nothing_was_missed(store):
+    store.start_run("diaria", DAILY.next_after(datetime.now() - timedelta(days=1)))
+    scheduler = JobScheduler(log=lambda message: None, store=store)
+
+    job = scheduler.add_job("diaria", lambda: None, DAILY, catch_up=True)
+
+    assert job.recovery_slot is None
+    assert job.next_run == DAILY.next_after(datetime.now())
@@ -0,0 +1,111 @@
+"""
+Pruebas de la elección de líder con el lease de SQLite
+Ejecutar con: python -m pytest -q
+"""
+import threading
+import time
+
+import pytest
+
+from job_scheduler import IntervalTrigger, JobScheduler
+from leader import LeaderLease
+
+
+@pytest.fixture
+def make_lease(tmp_path):
+    leases = []
+
+    def make(ttl=0.5):
+        lease = LeaderLease(path=str(tmp_path / "scheduler.db"), ttl=ttl, log=lambda message: None)
+        leases.append(lease)
+        return lease
+
+    yield make
+    for lease in leases:
+        lease.stop(release=False)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_only_one_node_holds_the_lease_until_it_expires(make_lease):
+    first, second = make_lease(), make_lease()
+
+    assert first.acquire() and first.is_leader
+    assert not second.acquire()
+    assert second.current_holder == first.holder and "líder" in second.describe()
+    assert first.acquire()  # renovar
+
+    time.sleep(0.6)
+    assert not first.is_leader  # sin renovar, el plazo local también caduca
+    assert second.acquire() and second.is_leader
+    assert not first.acquire()
+    assert first.current_holder == second.holder
+
+
+def test_released_lease_is_taken_without_waiting(make_lease):
+    first, second = make_lease(ttl=60), make_lease(ttl=60)
+    first.acquire()
+    first.release()
+
+    assert not first.is_leader
+    assert second.acquire()
+
+
+def test_concurrent_candidates_elect_a_single_leader(make_lease):
+    leases = [make_lease(ttl=30) for _ in range(6)]
+    barrier = threading.Barrier(len(leases))
+    winners = []
+
+    def candidate(lease):
+        barrier.wait()
+        if lease.acquire():
+            winners.append(lease.holder)
+
+    threads = [threading.Thread(target=candidate, args=(lease,)) for lease in leases]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(winners) == 1
+
+
+def test_follower_takes_over_when_the_leader_stops_renewing(make_lease):
+    first, second = make_lease(), make_lease()
+    elected = []
+    second.on_elected(lambda: elected.append(second.holder))
+    first.start()
+    second.start()
+    assert first.is_leader and not second.is_leader
+
+    first.stop(release=False)  # el proceso líder cae sin liberar el lease
+
+    assert _wait_for(lambda: second.is_leader)
+    assert elected == [second.holder]
+    time.sleep(0.6)  # el nuevo líder renueva: sigue siéndolo tras un plazo completo
+    assert second.is_leader and elected == [second.holder]
+
+
+def test_followers_skip_leader_only_jobs(make_lease):
+    leader, follower = make_lease(ttl=30), make_lease(ttl=30)
+    leader.acquire()
+    follower.acquire()
+    runs = {'leader': 0, 'follower': 0}
+    schedulers = []
+    for name, lease in (('leader', leader), ('follower', follower)):
+        scheduler = JobScheduler(log=lambda message: None, lease=lease)
+        scheduler.add_job("descarga", lambda name=name: runs.__setitem__(name, runs[name] + 1),
+                          IntervalTrigger(0.05), run_now=True, leader_only=True)
+        scheduler.start()
+        schedulers.append(scheduler)
+    try:
+        assert _wait_for(lambda: runs['leader'] >= 3)
+        assert runs['follower'] == 0
+    finally:
+        for scheduler in schedulers:
+            scheduler.stop(timeout=5)
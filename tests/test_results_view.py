@@ -0,0 +1,64 @@
+"""
+Pruebas de la vista de resultados compartida (orden y paginación)
+Ejecutar con: python -m pytest -q
+"""
+import pytest
+from streamlit.testing.v1 import AppTest
+
+
+def _results_page_app():
+    import numpy as np
+    import pandas as pd
+    import streamlit as st
+    from results_view import results_page
+
+    df = pd.DataFrame({'Codigo': [f"C{n:03d}" for n in range(120)], 'Stock': np.arange(120)[::-1]})
+    rows = np.arange(st.session_state.get('result_count', 120))
+    st.session_state.window = results_page(df, rows, st.session_state.get('query', ''))
+
+
+@pytest.fixture
+def app():
+    at = AppTest.from_function(_results_page_app, default_timeout=30)
+    at.run()
+    return at
+
+
+def _page_input(at):
+    return [widget for widget in at.number_input if widget.key == "results_page"][0]
+
+
+def test_results_page_windows_cover_every_row_once(app):
+    app.selectbox(key="results_page_size").select(50).run()
+    windows = []
+    for page in (1, 2, 3):
+        _page_input(app).set_value(page).run()
+        windows.append(app.session_state.window.tolist())
+
+    assert [len(window) for window in windows] == [50, 50, 20]
+    assert sum(windows, []) == list(range(120))
+    assert app.caption[0].value == "Mostrando 101–120 de 120 productos"
+    assert _page_input(app).max == 3
+
+
+def test_results_page_follows_the_selected_sort(app):
+    app.selectbox(key="results_sort").select("Stock").run()
+    assert app.session_state.window.tolist()[:3] == [119, 118, 117]
+    app.selectbox(key="results_order").select("Descendente").run()
+    assert app.session_state.window.tolist()[:3] == [0, 1, 2]
+
+
+def test_results_page_returns_to_first_page_on_new_search_or_fewer_pages(app):
+    app.selectbox(key="results_page_size").select(50).run()
+    _page_input(app).set_value(3).run()
+
+    app.session_state.query = 'pavo'
+    app.run()
+    assert _page_input(app).value == 1
+
+    _page_input(app).set_value(3).run()
+    app.session_state.result_count = 60
+    app.run()
+    assert _page_input(app).value == 1
+    assert _page_input(app).max == 2
+    assert app.session_state.window.tolist() == list(range(50))
@@ -0,0 +1,198 @@
+"""
+Pruebas de los disparadores y del programador de tareas
+Ejecutar con: python -m pytest -q
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from job_scheduler import CronTrigger, IntervalTrigger, JobScheduler, OnDemandTrigger, PollingTrigger, parse_trigger
+from job_store import JobStore, run_result
+
+
+def _cron_values(field, low, high):
+    """Valores de un campo cron, interpretados de forma independiente al programador"""
+    values = set()
+    for part in field.split(','):
+        base, step = (part.split('/') + ['1'])[:2]
+        if base == '*':
+            first, last = low, high
+        elif '-' in base:
+            first, last = map(int, base.split('-'))
+        else:
+            first, last = int(base), (high if step != '1' else int(base))
+        values |= set(range(first, last + 1, int(step)))
+    return values
+
+
+def _brute_force_next(expression, dt):
+    """Siguiente minuto que cumple la expresión, probando minuto a minuto"""
+    minute, hour, day, month, weekday = expression.split()
+    minutes, hours = _cron_values(minute, 0, 59), _cron_values(hour, 0, 23)
+    days, months = _cron_values(day, 1, 31), _cron_values(month, 1, 12)
+    weekdays = {value % 7 for value in _cron_values(weekday, 0, 7)}
+    either = '*' not in (day, weekday)
+
+    candidate = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    while True:
+        day_ok, weekday_ok = candidate.day in days, candidate.isoweekday() % 7 in weekdays
+        if (candidate.minute in minutes and candidate.hour in hours and candidate.month in months
+                and ((day_ok or weekday_ok) if either else (day_ok and weekday_ok))):
+            return candidate
+        candidate += timedelta(minutes=1)
+
+
+@pytest.mark.parametrize("expression", [
+    "0 2 * * *",
+    "*/15 * * * *",
+    "30 9 * * 1-5",
+    "0 0 1,15 * 1",
+    "5-10/2 */6 * * 0",
+    "0 3 * * 7",
+    "59 23 31 * *",
+    "0 8 * 3 *",
+])
+def test_cron_next_run_matches_minute_by_minute_scan(expression):
+    trigger = CronTrigger(expression)
+    dt = datetime(2025, 1, 30, 22, 47, 13)
+    for _ in range(12):
+        expected = _brute_force_next(expression, dt)
+        assert trigger.next_after(dt) == expected
+        dt = expected + timedelta(seconds=30)
+
+
+def test_cron_finds_a_leap_day_years_ahead():
+    assert CronTrigger("0 12 29 2 *").next_after(datetime(2025, 3, 1)) == datetime(2028, 2, 29, 12, 0)
+
+
+@pytest.mark.parametrize("expression", ["61 * * * *", "* 24 * * *", "* * *", "0 0 0 * *", "*/0 * * * *"])
+def test_invalid_cron_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        CronTrigger(expression)
+
+
+def test_cron_that_never_fires_is_rejected():
+    with pytest.raises(ValueError, match="nunca"):
+        CronTrigger("0 0 31 2 *").next_after(datetime(2025, 1, 1))
+
+
+def test_interval_and_daily_triggers():
+    start = datetime(2025, 6, 1, 23, 59, 30)
+    assert IntervalTrigger(90).next_after(start) == datetime(2025, 6, 2, 0, 1, 0)
+    assert parse_trigger("02:00") == CronTrigger("0 2 * * *")
+    assert parse_trigger(" 0 */4 * * * ") == CronTrigger("0 */4 * * *")
+    assert OnDemandTrigger().next_after(start) is None
+    with pytest.raises(ValueError):
+        IntervalTrigger(0)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = JobScheduler(log=lambda message: None)
+    yield scheduler
+    scheduler.stop(timeout=5)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_interval_job_runs_repeatedly_until_removed(scheduler):
+    runs = []
+    scheduler.add_job("sondeo", lambda: runs.append(datetime.now()), IntervalTrigger(0.05), run_now=True)
+    scheduler.start()
+
+    assert _wait_for(lambda: len(runs) >= 3)
+    assert scheduler.remove_job("sondeo")
+    count = len(runs)
+    time.sleep(0.2)
+    assert len(runs) <= count + 1  # como mucho la que ya estaba en marcha
+
+
+def test_requests_during_a_run_are_merged_into_one(scheduler):
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def job():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+
+    scheduler.add_job("webhook", job, OnDemandTrigger())
+    scheduler.start()
+    assert scheduler.run_now("webhook")
+    assert started.wait(5)
+    for _ in range(3):
+        scheduler.run_now("webhook")
+    release.set()
+
+    assert _wait_for(lambda: len(runs) == 2)
+    time.sleep(0.1)
+    assert len(runs) == 2
+    assert not scheduler.run_now("no_existe")
+
+
+def test_failed_run_is_reported_and_rescheduled(scheduler):
+    calls = []
+
+    def job():
+        calls.append(1)
+        raise RuntimeError("sin conexión")
+
+    scheduler.add_job("diaria", job, CronTrigger("0 2 * * *"), run_now=True)
+    scheduler.start()
+
+    assert _wait_for(lambda: scheduler.get_job("diaria").last_error is not None)
+    job_state = scheduler.get_job("diaria")
+    assert job_state.last_error == "RuntimeError: sin conexión"
+    assert job_state.next_run == CronTrigger("0 2 * * *").next_after(job_state.last_run)
+    assert len(calls) == 1
+
+
+def test_polling_backs_off_at_night_only_while_nothing_changes():
+    trigger = PollingTrigger(60, night_max_seconds=600, night_start="22:00", night_end="06:00")
+    day, night, after_midnight = datetime(2025, 6, 1, 12, 0), datetime(2025, 6, 1, 23, 0), datetime(2025, 6, 2, 3, 0)
+
+    intervals = []
+    for _ in range(6):
+        intervals.append(trigger.interval(night))
+        trigger.record('unchanged')
+    assert intervals == [60, 120, 240, 480, 600, 600]
+    assert trigger.interval(after_midnight) == 600
+    assert trigger.interval(day) == 60  # de día siempre el intervalo base
+
+    trigger.record('updated')
+    assert trigger.interval(night) == 60
+    assert trigger.next_after(day) == day + timedelta(seconds=60)
+
+
+def test_polling_jitter_and_config():
+    trigger = PollingTrigger.from_config({'interval_minutes': 2, 'night_max_minutes': 0, 'jitter_seconds': 20})
+    start = datetime(2025, 6, 1, 23, 0)
+    delays = [(trigger.next_after(start) - start).total_seconds() for _ in range(200)]
+
+    assert all(120 <= delay <= 140 for delay in delays) and max(delays) > min(delays)
+    assert trigger.night_max_seconds is None
+    assert trigger == PollingTrigger(120, None, "22:00", "06:00", 20)
+    assert trigger != PollingTrigger(120, None, "22:00", "06:00", 0)
+
+
+def test_quiet_polls_only_leave_history_when_something_changes(tmp_path):
+    store = JobStore(path=str(tmp_path / "scheduler.db"))
+    outcomes = ['unchanged', 'unchanged', 'updated', 'unchanged']
+    trigger = PollingTrigger(0.05, night_max_seconds=0.4, night_start="00:00", night_end="23:59")
+    scheduler = JobScheduler(log=lambda message: None, store=store)
+    scheduler.add_job("sondeo", lambda: run_result(outcomes.pop(0) if outcomes else 'unchanged'),
+                      trigger, run_now=True, quiet=True)
+    scheduler.start()
+    try:
+        assert _wait_for(lambda: not outcomes)
+    finally:
+        scheduler.stop(timeout=5)
+
+    assert [run['outcome'] for run in store.recent_runs(job="sondeo")] == ['updated']
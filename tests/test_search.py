@@ -0,0 +1,383 @@
+"""
+Pruebas de búsqueda sobre instantáneas publicadas del catálogo
+Ejecutar con: python -m pytest -q
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import catalog
+import ingest
+import search
+
+
+@pytest.fixture
+def catalog_path(tmp_path, monkeypatch):
+    """Catálogo pequeño publicado en un directorio temporal"""
+    monkeypatch.chdir(tmp_path)
+    path = "data/productos.csv"
+    df = pd.DataFrame({
+        'Codigo': ['A1', 'B2', 'C3'],
+        'Descripcion': ['Pienso pavo', 'Arena gato', 'Hueso perro'],
+        'Familia': ['Nobby', 'Dapac', 'Nobby'],
+        'Stock': [5, 12, 40],
+    })
+    catalog.publish_catalog(df, path)
+    search.query_cache.clear()
+    yield path
+    catalog.invalidate_catalog(path)
+
+
+def _search(path, term):
+    return search.search_rows(catalog.get_catalog(path).df, term).tolist()
+
+
+def test_search_finds_new_stock_after_update_stock(catalog_path):
+    assert _search(catalog_path, '5') == [0]
+    catalog.update_stock(pd.DataFrame({'Codigo': ['A1'], 'Stock': [777]}), catalog_path)
+
+    assert _search(catalog_path, '777') == [0]
+    assert _search(catalog_path, '5') == []
+    assert _search(catalog_path, 'pavo') == [0]
+
+    # El índice persistido para la nueva versión también tiene el stock nuevo
+    catalog.invalidate_catalog(catalog_path)
+    search.query_cache.clear()
+    assert _search(catalog_path, '777') == [0]
+
+
+def test_search_finds_new_stock_after_stock_feed(catalog_path, tmp_path):
+    _search(catalog_path, '12')  # resultado cacheado de la versión anterior
+    feed_path = tmp_path / "stock_parcial.csv"
+    feed_path.write_text("Codigo,Stock\nB2,4321\nZZ9,1\n")
+    config = {'stock_feed': {'enabled': True, 'type': 'http', 'url': feed_path.as_uri()}}
+
+    delta, unknown = ingest.ingest_stock_feed(config, catalog_path)
+
+    assert delta.stock_rows.tolist() == [1] and unknown == 1
+    assert _search(catalog_path, '4321') == [1]
+    assert _search(catalog_path, '12') == []
+
+
+def test_incremental_search_index_matches_rebuild(catalog_path):
+    previous = catalog.get_catalog(catalog_path)
+    index = search.get_search_index(previous.df)
+    snapshot, delta, _ = catalog.update_stock(pd.DataFrame({'Codigo': ['C3', 'A1'], 'Stock': [0, 9]}), catalog_path)
+
+    updated = search.get_search_index(snapshot.df)
+    rebuilt = search.SearchIndex(snapshot.df)
+    assert updated is not index
+    assert list(updated.haystack) == list(rebuilt.haystack)
+    for name in ('keys', 'offsets', 'postings'):
+        assert np.array_equal(getattr(updated.trigrams, name), getattr(rebuilt.trigrams, name))
+
+
+def test_exact_code_keeps_other_rows_that_contain_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = "data/productos.csv"
+    df = pd.DataFrame({
+        'Codigo': ['V02FN01', 'V02FN01B', 'V45BBX961', 'R12345', 'R12345', 'K777', 'P55501'],
+        'Descripcion': ['Arnés', 'Arnés grande', 'Correa', 'Collar', 'Collar azul', 'Recambio V45BBX961', 'Pienso'],
+        'Familia': ['Nobby'] * 7,
+        'Stock': [1, 2, 3, 4, 5, 6, 7],
+    })
+    catalog.publish_catalog(df, path)
+    search.query_cache.clear()
+    try:
+        assert _search(path, 'v02fn01') == [0, 1]
+        assert _search(path, 'V02FN01B') == [1]
+        assert _search(path, 'v45bbx961') == [2, 5]
+        assert _search(path, 'r12345') == [3, 4]
+        assert _search(path, 'p55501') == [6]
+        assert search._exact_code_row(catalog.get_catalog(path).df, search.parse_query('p55501')) == 6
+    finally:
+        catalog.invalidate_catalog(path)
+
+
+
+def _query_catalog(size=240):
+    """Catálogo variado y determinista para comparar el buscador con un filtro fila a fila"""
+    rng = np.random.default_rng(7)
+    words = ['Pienso', 'pavo', 'basic', 'Piénso', 'gato', 'Arnés', 'collar', 'pollo']
+    descriptions = [" ".join(rng.choice(words, size=3)) for _ in range(size)]
+    stock = rng.integers(-2, 60, size=size).astype(object)
+    stock[::17] = None
+    return pd.DataFrame({
+        'Codigo': [f"{rng.choice(['A0', 'B1', 'PV'])}{n:04d}" for n in range(size)],
+        'Descripcion': descriptions,
+        'Familia': rng.choice(['Nobby', 'Dapac', 'Nobby Premium', 'Fléxi'], size=size),
+        'Stock': stock,
+    })
+
+
+def _brute_force(df, predicate):
+    """Filas que cumplen el predicado sobre los campos normalizados, una a una"""
+    rows = []
+    for position, row in enumerate(df.itertuples(index=False)):
+        stock = None if pd.isna(row.Stock) else int(row.Stock)
+        fields = SimpleNamespace(
+            codigo=search.normalize_text(row.Codigo),
+            familia=search.normalize_text(row.Familia),
+            stock=stock,
+            text=search.FIELD_SEPARATOR.join(
+                search.normalize_text(value) for value in (row.Codigo, row.Descripcion, row.Familia, stock)
+            ),
+        )
+        if predicate(fields):
+            rows.append(position)
+    return rows
+
+
+@pytest.mark.parametrize("query, predicate", [
+    ('pavo', lambda r: 'pavo' in r.text),
+    ('basic pavo', lambda r: 'basic' in r.text and 'pavo' in r.text),
+    ('"pavo basic"', lambda r: 'pavo basic' in r.text),
+    ('"PAVO basic', lambda r: 'pavo basic' in r.text),
+    ('piénso', lambda r: 'pienso' in r.text),
+    ('familia:nobby', lambda r: 'nobby' in r.familia),
+    ('familia:"nobby premium"', lambda r: 'nobby premium' in r.familia),
+    ('familia:flexi gato', lambda r: 'flexi' in r.familia and 'gato' in r.text),
+    ('codigo:pv', lambda r: 'pv' in r.codigo),
+    ('codigo:A00', lambda r: 'a00' in r.codigo),
+    ('stock:0', lambda r: r.stock == 0),
+    ('stock:5..20', lambda r: r.stock is not None and 5 <= r.stock <= 20),
+    ('stock:..3', lambda r: r.stock is not None and r.stock <= 3),
+    ('stock:50..', lambda r: r.stock is not None and r.stock >= 50),
+    ('stock<5', lambda r: r.stock is not None and r.stock < 5),
+    ('stock<=5', lambda r: r.stock is not None and r.stock <= 5),
+    ('stock>10', lambda r: r.stock is not None and r.stock > 10),
+    ('stock>=10', lambda r: r.stock is not None and r.stock >= 10),
+    ('stock=7', lambda r: r.stock == 7),
+    ('pienso familia:nobby stock<5', lambda r: 'pienso' in r.text and 'nobby' in r.familia
+                                               and r.stock is not None and r.stock < 5),
+    # Filtros a medio escribir: se ignoran y no vacían el resultado
+    ('stock<', lambda r: True),
+    ('familia:', lambda r: True),
+    ('pollo familia:', lambda r: 'pollo' in r.text),
+    ('gato stock>=', lambda r: 'gato' in r.text),
+    # Un valor de stock no numérico se busca como texto
+    ('stock<abc', lambda r: 'stock<abc' in r.text),
+])
+def test_query_language_matches_brute_force_filter(tmp_path, monkeypatch, query, predicate):
+    monkeypatch.chdir(tmp_path)
+    path = "data/productos.csv"
+    df = _query_catalog()
+    snapshot = catalog.publish_catalog(df, path)
+    search.query_cache.clear()
+    try:
+        expected = _brute_force(df, predicate)
+        assert search.search_rows(snapshot.df, query).tolist() == expected
+        # Mismo resultado sin la instantánea publicada (sin índices persistidos ni caché)
+        assert search.search_rows(df, query).tolist() == expected
+    finally:
+        catalog.invalidate_catalog(path)
+
+
+def test_parse_query_ignores_incomplete_filters():
+    plan = search.parse_query('stock< familia: codigo: pavo')
+
+    assert plan.terms == ['pavo']
+    assert plan.families == [] and plan.codes == [] and plan.stock_ranges == []
+    assert search.parse_query('stock:5..20 stock<3').stock_ranges == [(5, 20), (None, 2)]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("CORTAU¥AS PEQUE¥O", "cortaunas pequeno"),
+    ("MICO N§4 1¦ EDAD", "mico no4 1a edad"),
+    ("W SALMàN CON CµNULA", "w salmon con canula"),
+    ("Collar 50µm", "collar 50μm"),
+    ("¡Oferta! café à la crème", "¡oferta! cafe a la creme"),
+    ("Arena\xa0gato", "arena gato"),
+])
+def test_normalize_repairs_only_cp850_mojibake(text, expected):
+    assert search.normalize_text(text) == expected
+    if search.ARROW_AVAILABLE:
+        assert search._normalize_column_arrow(pd.Series([text])).to_pylist() == [expected]
+
+
+def _snapshot(version, delta=None):
+    return SimpleNamespace(path="data/productos.csv", version=version, delta=delta)
+
+
+def _computed(calls, value):
+    def compute():
+        calls.append(value)
+        return np.array([value])
+    return compute
+
+
+def test_query_cache_keeps_results_of_older_and_newer_snapshots():
+    cache = search.QueryCache(max_entries=4)
+    calls = []
+
+    cache.get(_snapshot(1), "pavo", _computed(calls, 1))
+    cache.get(_snapshot(2), "pavo", _computed(calls, 2))
+    # Sesiones con la instantánea anterior y la nueva alternan sin expulsarse
+    for _ in range(3):
+        assert cache.get(_snapshot(1), "pavo", _computed(calls, 1)).tolist() == [1]
+        assert cache.get(_snapshot(2), "pavo", _computed(calls, 2)).tolist() == [2]
+    assert calls == [1, 2]
+
+    for query in ("a", "b", "c", "d"):
+        cache.get(_snapshot(2), query, _computed(calls, 0))
+    assert cache.stats()['entries'] == 4
+    cache.get(_snapshot(1), "pavo", _computed(calls, 1))
+    assert calls[-1] == 1  # expulsada por LRU, no por cambiar de versión
+
+
+def test_query_cache_computes_concurrent_requests_once():
+    cache = search.QueryCache()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return np.array([7])
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(_snapshot(1), "pavo", slow).tolist()))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [[7]] * 5
+    assert not cache.get(_snapshot(1), "pavo", slow).flags.writeable
+
+
+def test_query_cache_carries_filter_only_results_across_stock_updates():
+    cache = search.QueryCache()
+    calls = []
+    cache.get(_snapshot(1), "familia:nobby", _computed(calls, 1))
+    cache.get(_snapshot(1), "pavo", _computed(calls, 1))
+
+    cache.invalidate(_snapshot(2, SimpleNamespace(stock_only=True, base_version=1)))
+
+    cache.get(_snapshot(2), "familia:nobby", _computed(calls, 2))
+    cache.get(_snapshot(2), "pavo", _computed(calls, 2))
+    assert calls == [1, 1, 2]
+
+
+def test_query_cache_recomputes_text_and_stock_filters_after_publish(catalog_path):
+    assert _search(catalog_path, 'pavo') == [0]
+    assert _search(catalog_path, 'stock>=10') == [1, 2]
+    assert _search(catalog_path, 'familia:nobby') == [0, 2]
+
+    catalog.update_stock(pd.DataFrame({'Codigo': ['A1', 'C3'], 'Stock': [30, 1]}), catalog_path)
+    assert _search(catalog_path, 'stock>=10') == [0, 1]
+    assert _search(catalog_path, 'familia:nobby') == [0, 2]
+
+    df = catalog.get_catalog(catalog_path).df.copy()
+    df.loc[1, 'Descripcion'] = 'Pienso pavo junior'
+    catalog.publish_catalog(df, catalog_path)
+    assert _search(catalog_path, 'pavo') == [0, 1]
+
+
+@pytest.mark.parametrize("new, old, expected", [
+    ('pavo', 'pav', True),
+    ('pavo basic', 'pavo', True),
+    ('pav', 'pavo', False),
+    ('familia:nobby pavo', 'familia:nob', True),
+    ('stock:5..10', 'stock<20', True),
+    ('stock<30', 'stock<20', False),
+    ('pavo', 'pavo stock>5', False),
+])
+def test_refines_only_when_every_new_row_matched_before(new, old, expected):
+    assert search.refines(search.parse_query(new), search.parse_query(old)) is expected
+
+
+def test_narrowing_search_matches_fresh_search_while_typing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = "data/productos.csv"
+    catalog.publish_catalog(_query_catalog(), path)
+    try:
+        typed = ['p', 'pa', 'pav', 'pavo', 'pavo ', 'pavo b', 'pavo basic', 'pavo bas', 'pavo basic stock<',
+                 'pavo basic stock<30', 'pavo basic stock<3', 'codigo:a0', 'codigo:a0001', 'codigo:a00012']
+        previous = None
+        for term in typed:
+            df = catalog.get_catalog(path).df
+            search.query_cache.clear()
+            rows = search.search_rows(df, term, previous)
+            assert rows.tolist() == search.execute_query(df, search.parse_query(term)).tolist(), term
+            previous = search.search_state(df, term, rows)
+
+        # Tras publicar una versión nueva el resultado anterior no sirve de candidatos
+        previous = search.search_state(df, '7', search.search_rows(df, '7'))
+        outside = int(np.setdiff1d(np.arange(len(df)), previous[2])[0])
+        catalog.update_stock(pd.DataFrame({'Codigo': [df['Codigo'].iloc[outside]], 'Stock': [77]}), path)
+        rows = search.search_rows(catalog.get_catalog(path).df, '77', previous)
+        assert outside in rows.tolist()
+    finally:
+        catalog.invalidate_catalog(path)
+
+
+@pytest.mark.parametrize("column", ['Codigo', 'Descripcion', 'Familia', 'Stock'])
+@pytest.mark.parametrize("descending", [False, True])
+def test_sort_rows_matches_pandas_sort_with_nulls_last(tmp_path, monkeypatch, column, descending):
+    monkeypatch.chdir(tmp_path)
+    path = "data/productos.csv"
+    source = _query_catalog()
+    source.loc[::23, 'Familia'] = None
+    source.loc[::29, 'Descripcion'] = None
+    df = catalog.publish_catalog(source, path).df
+    try:
+        rows = np.flatnonzero(np.arange(len(df)) % 3 != 0)
+        for subset in (np.arange(len(df)), rows):
+            ordered = search.sort_rows(df, subset, column, descending)
+            values = df[column].iloc[subset]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(object)
+            expected = values.sort_values(ascending=not descending, kind='stable', na_position='last')
+            assert sorted(ordered.tolist()) == subset.tolist()
+            assert df[column].iloc[ordered].astype(object).tolist() == expected.astype(object).tolist()
+            if not descending:
+                # Entre valores iguales se conserva el orden del catálogo
+                assert ordered.tolist() == expected.index.tolist()
+        assert search.sort_rows(df, rows, None).tolist() == rows.tolist()
+        assert search.sort_rows(df, rows, None, True).tolist() == rows[::-1].tolist()
+    finally:
+        catalog.invalidate_catalog(path)
+
+
+def _stock_badge(stock, low_threshold, high_threshold):
+    """Indicador de stock fila a fila, como lo calculaba la tabla antes de vectorizarlo"""
+    try:
+        stock = float(stock)
+    except (TypeError, ValueError):
+        return "⚪"
+    if np.isnan(stock):
+        return "⚪"
+    if stock <= low_threshold:
+        return "🔴"
+    return "🟡" if stock <= high_threshold else "🟢"
+
+
+@pytest.mark.parametrize("low, high", [(5, 20), (0, 10), (-1, 0), (7, 7)])
+def test_stock_levels_match_row_by_row_classification(low, high):
+    stock = pd.Series([-3, -1, 0, 1, 4.5, 5, 6, 7, 10, 19.9, 20, 21, 500, None, 'abc', '12'], dtype=object)
+
+    levels = search.compute_stock_levels(search._stock_values(stock), low, high)
+
+    assert search.STOCK_LEVEL_BADGES[levels].tolist() == [_stock_badge(value, low, high) for value in stock]
+    assert search.count_stock_levels(levels).sum() == len(stock)
+
+
+def test_stock_levels_follow_stock_updates(catalog_path):
+    df = catalog.get_catalog(catalog_path).df
+    assert search.STOCK_LEVEL_BADGES[search.get_stock_levels(df, 5, 20)].tolist() == ["🔴", "🟡", "🟢"]
+
+    snapshot, _, _ = catalog.update_stock(pd.DataFrame({'Codigo': ['A1', 'C3'], 'Stock': [25, 2]}), catalog_path)
+
+    levels = search.get_stock_levels(snapshot.df, 5, 20)
+    assert search.STOCK_LEVEL_BADGES[levels].tolist() == ["🟢", "🟡", "🔴"]
+    assert search.count_stock_levels(levels).tolist() == [1, 1, 1, 0]
+    assert search.get_stock_levels(snapshot.df, 5, 20) is levels
@@ -0,0 +1,152 @@
+"""
+Pruebas del pool de sesiones SFTP contra un servidor local
+Ejecutar con: python -m pytest -q
+"""
+import os
+import time
+
+import pytest
+
+import sftp_pool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = sftp_pool.SFTPPool(idle_timeout=0.2)
+    monkeypatch.setattr(sftp_pool, "pool", pool)
+    yield pool
+    pool.close_all()
+
+
+def _download(server, name):
+    return sftp_pool.download_file(server.host, server.port, server.user, server.password, f"/{name}", timeout=5)
+
+
+def test_sessions_are_reused_between_operations(sftp_server, pool):
+    (sftp_server.root / "stock.csv").write_bytes(b"Codigo,Stock\nA1,5\n")
+
+    assert _download(sftp_server, "stock.csv") == b"Codigo,Stock\nA1,5\n"
+    assert pool.last_timings['reused'] is False
+    assert _download(sftp_server, "stock.csv") == b"Codigo,Stock\nA1,5\n"
+    assert pool.last_timings['reused'] is True and pool.last_timings['connect'] == 0
+    assert len(sftp_server.transports) == 1
+    assert pool.stats() == {'idle': 1}
+
+
+def test_missing_file_keeps_the_session(sftp_server, pool):
+    with pytest.raises(FileNotFoundError):
+        _download(sftp_server, "no_existe.csv")
+    assert pool.stats() == {'idle': 1}
+    (sftp_server.root / "stock.csv").write_bytes(b"x")
+    assert _download(sftp_server, "stock.csv") == b"x"
+    assert len(sftp_server.transports) == 1
+
+
+def _wait_closed(transport):
+    deadline = time.monotonic() + 5
+    while transport.is_active() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_closed_idle_session_is_replaced(sftp_server, pool):
+    (sftp_server.root / "stock.csv").write_bytes(b"x")
+    _download(sftp_server, "stock.csv")
+    session = pool._idle[next(iter(pool._idle))][0]
+
+    sftp_server.transports[0].close()  # el proveedor corta la conexión inactiva
+    _wait_closed(session.transport)
+
+    assert _download(sftp_server, "stock.csv") == b"x"
+    assert pool.last_timings['reused'] is False
+    assert len(sftp_server.transports) == 2
+
+
+def test_session_dropped_during_operation_reconnects_once(sftp_server, pool):
+    assert sftp_pool.check_connection(sftp_server.host, sftp_server.port, sftp_server.user, sftp_server.password)
+    attempts = []
+
+    def operation(sftp, timings):
+        attempts.append(timings['reused'])
+        if len(attempts) == 1:
+            sftp_server.transports[-1].close()
+            _wait_closed(sftp.get_channel().get_transport())
+        return sftp.normalize('.')
+
+    assert pool.run(sftp_server.host, sftp_server.port, sftp_server.user, sftp_server.password, operation) == '/'
+    assert attempts == [True, False]
+
+    # Una sesión nueva que falla no se reintenta
+    attempts.clear()
+    pool.close_all()
+    with pytest.raises(Exception):
+        pool.run(sftp_server.host, sftp_server.port, sftp_server.user, sftp_server.password, operation)
+    assert attempts == [False]
+
+
+def test_wrong_password_fails_without_keeping_a_session(sftp_server, pool):
+    with pytest.raises(Exception):
+        sftp_pool.download_file(sftp_server.host, sftp_server.port, sftp_server.user, "otra", "/stock.csv", timeout=5)
+    assert pool.stats() == {'idle': 0}
+
+
+def test_reaper_closes_idle_sessions(sftp_server, pool):
+    (sftp_server.root / "stock.csv").write_bytes(b"x")
+    _download(sftp_server, "stock.csv")
+    session = pool._idle[next(iter(pool._idle))][0]
+
+    deadline = time.monotonic() + 5
+    while pool.stats()['idle'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert pool.stats() == {'idle': 0}
+    assert not session.alive
+    _download(sftp_server, "stock.csv")
+    assert pool.last_timings['reused'] is False
+
+
+def _fetch(server, tmp_path, last_fetch):
+    return sftp_pool.download_if_changed(server.host, server.port, server.user, server.password,
+                                         "/stock.csv", last_fetch, local_path=str(tmp_path / "productos.csv"))
+
+
+def _opened(server):
+    return sum(1 for request in server.requests if request[0] == 'open')
+
+
+def test_unchanged_remote_file_is_not_downloaded_again(sftp_server, pool, tmp_path):
+    remote = sftp_server.root / "stock.csv"
+    remote.write_bytes(b"Codigo,Stock\nA1,5\n")
+
+    tmp, fetch = _fetch(sftp_server, tmp_path, None)
+    with open(tmp, 'rb') as f:
+        assert f.read() == b"Codigo,Stock\nA1,5\n"
+    os.remove(tmp)  # el llamador publica el temporal
+    assert fetch['size'] == 18 and fetch['sha256']
+
+    # Mismo tamaño y fecha: solo un stat, sin abrir el archivo
+    assert _fetch(sftp_server, tmp_path, fetch) == (None, fetch)
+    assert _opened(sftp_server) == 1
+
+    # Fecha nueva pero mismo contenido: se descarga, se compara el hash y se descarta
+    os.utime(remote, (fetch['mtime'] + 60, fetch['mtime'] + 60))
+    tmp_same, touched = _fetch(sftp_server, tmp_path, fetch)
+    assert tmp_same is None and touched['sha256'] == fetch['sha256'] and touched['mtime'] == fetch['mtime'] + 60
+    assert _opened(sftp_server) == 2
+    assert os.listdir(tmp_path) == ["sftp"]
+
+    # Contenido distinto: nuevo temporal
+    remote.write_bytes(b"Codigo,Stock\nA1,7\n")
+    os.utime(remote, (fetch['mtime'] + 120, fetch['mtime'] + 120))
+    tmp_new, changed = _fetch(sftp_server, tmp_path, touched)
+    with open(tmp_new, 'rb') as f:
+        assert f.read() == b"Codigo,Stock\nA1,7\n"
+    assert changed['sha256'] != fetch['sha256']
+
+
+def test_last_fetch_of_another_source_is_ignored(sftp_server, pool, tmp_path):
+    (sftp_server.root / "stock.csv").write_bytes(b"x")
+    _, fetch = _fetch(sftp_server, tmp_path, None)
+
+    tmp, _ = _fetch(sftp_server, tmp_path, dict(fetch, source="otro@servidor:22/stock.csv"))
+
+    assert tmp is not None
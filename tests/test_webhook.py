@@ -0,0 +1,71 @@
+"""
+Pruebas del webhook de archivo listo: firmas de un solo uso y cabeceras no válidas
+Ejecutar con: python -m pytest -q
+"""
+import http.client
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import webhook
+from job_scheduler import scheduler as job_scheduler
+
+SECRET = "s3cret"
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """Servidor del webhook en un puerto libre, sin arrancar el hilo del scheduler"""
+    monkeypatch.chdir(tmp_path)
+    server = webhook.WebhookServer()
+    assert server.start(lambda: None, port=0, secret=SECRET, host="127.0.0.1", log=lambda message: None)
+    yield server
+    server.stop()
+    job_scheduler.remove_job(webhook.WEBHOOK_JOB)
+
+
+def _post_signed(server, body, timestamp):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.port}{webhook.WEBHOOK_PATH}", data=body, method='POST', headers={
+            'X-Webhook-Timestamp': timestamp,
+            'X-Webhook-Signature': webhook.sign(SECRET, timestamp, body),
+        })
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_signed_notice_is_accepted_only_once(server):
+    timestamp = str(int(time.time()))
+
+    assert _post_signed(server, b'{"file": "stock.csv"}', timestamp) == 202
+    assert _post_signed(server, b'{"file": "stock.csv"}', timestamp) == 401
+    assert _post_signed(server, b'{"file": "stock2.csv"}', timestamp) == 202
+    assert webhook.notify(f"http://127.0.0.1:{server.port}{webhook.WEBHOOK_PATH}", SECRET)[0] == 202
+    assert webhook.notify(f"http://127.0.0.1:{server.port}{webhook.WEBHOOK_PATH}", SECRET)[0] == 202
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3"])
+def test_invalid_content_length_is_rejected(server, length):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    connection.putrequest('POST', webhook.WEBHOOK_PATH)
+    connection.putheader('Content-Length', length)
+    connection.putheader('Authorization', f"Bearer {SECRET}")
+    connection.endheaders()
+
+    assert connection.getresponse().status == 400
+    connection.close()
+
+
+def test_replay_guard_forgets_signatures_once_expired():
+    guard = webhook.ReplayGuard(window=300)
+
+    assert guard.first_use("1000", "sha256=ab", now=1000)
+    assert not guard.first_use("1000", "sha256=ab", now=1299)
+    assert guard.first_use("1000", "sha256=cd", now=1299)
+    guard.first_use("2000", "sha256=ef", now=2000)
+    assert list(guard._seen) == [("2000", "sha256=ef")]
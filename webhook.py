@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Webhook de "archivo listo" para lanzar la ingesta en cuanto el ERP exporta stock.csv
+Un servidor HTTP mínimo (biblioteca estándar) en un hilo del mismo proceso que
+Streamlit o del scheduler. Cada aviso autenticado programa la tarea
+`webhook_ingest` del scheduler con espera (debounce): los avisos que llegan
+seguidos se funden en una sola ingesta que se ejecuta cuando dejan de llegar
+durante WEBHOOK_DEBOUNCE_SECONDS, y como mucho WEBHOOK_MAX_DELAY_SECONDS
+después del primero.
+
+Autenticación (WEBHOOK_SECRET):
+    Authorization: Bearer <secreto>
+o bien firma HMAC-SHA256 con marca de tiempo, que evita reenvíos:
+    X-Webhook-Timestamp: <segundos unix>
+    X-Webhook-Signature: sha256=<hex de HMAC(secreto, "<timestamp>.<cuerpo>")>
+Una firma solo vale durante MAX_SKEW_SECONDS alrededor de su marca de tiempo y
+una sola vez: el servidor recuerda las aceptadas hasta que caducan.
+
+Uso local:
+    WEBHOOK_SECRET=... python webhook.py notify http://127.0.0.1:8502/hooks/stock-ready
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import hashlib
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from job_scheduler import scheduler as job_scheduler, OnDemandTrigger
+
+WEBHOOK_PATH = "/hooks/stock-ready"
+WEBHOOK_JOB = "webhook_ingest"
+DEFAULT_PORT = int(os.environ.get("WEBHOOK_PORT", 8502))
+DEBOUNCE_SECONDS = float(os.environ.get("WEBHOOK_DEBOUNCE_SECONDS", 10))
+MAX_DELAY_SECONDS = float(os.environ.get("WEBHOOK_MAX_DELAY_SECONDS", 60))
+MAX_SKEW_SECONDS = 300
+MAX_BODY_BYTES = 64 * 1024
+
+
+def sign(secret, timestamp, body):
+    """Firma HMAC-SHA256 de un aviso"""
+    message = f"{timestamp}.".encode('utf-8') + body
+    return "sha256=" + hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def is_authorized(secret, headers, body, now=None):
+    """Comprobar el token Bearer o la firma HMAC con marca de tiempo reciente"""
+    authorization = headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        return hmac.compare_digest(authorization[len('Bearer '):].encode('utf-8'), secret.encode('utf-8'))
+
+    timestamp = headers.get('X-Webhook-Timestamp', '')
+    signature = headers.get('X-Webhook-Signature', '')
+    try:
+        skew = abs((now or time.time()) - int(timestamp))
+    except ValueError:
+        return False
+    if skew > MAX_SKEW_SECONDS:
+        return False
+    return hmac.compare_digest(signature.encode('utf-8'), sign(secret, timestamp, body).encode('utf-8'))
+
+
+class ReplayGuard:
+    """Firmas HMAC ya aceptadas, recordadas mientras su marca de tiempo siga vigente"""
+
+    def __init__(self, window=MAX_SKEW_SECONDS):
+        self.window = window
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def first_use(self, timestamp, signature, now=None):
+        """Registrar la firma; False si ya se había usado dentro de la ventana"""
+        now = now or time.time()
+        with self._lock:
+            # Pasada la ventana la marca de tiempo ya no se acepta: no hace falta recordarla
+            self._seen = {key: expires for key, expires in self._seen.items() if expires >= now}
+            key = (timestamp, signature)
+            if key in self._seen:
+                return False
+            self._seen[key] = int(timestamp) + self.window
+            return True
+
+
+class Debouncer:
+    """Funde los avisos seguidos en una sola ejecución de la tarea del scheduler"""
+
+    def __init__(self, scheduler, job_name, debounce=DEBOUNCE_SECONDS, max_delay=MAX_DELAY_SECONDS):
+        self.scheduler = scheduler
+        self.job_name = job_name
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.received = 0
+        self.coalesced = 0
+        self._first = None
+        self._lock = threading.Lock()
+
+    def notify(self):
+        """Registrar un aviso; devuelve (hora prevista de la ingesta, True si se unió a una pendiente)"""
+        with self._lock:
+            now = datetime.now()
+            job = self.scheduler.get_job(self.job_name)
+            if job is None:
+                raise RuntimeError(f"La tarea {self.job_name} no está programada")
+            # Pendiente: ya hay una ingesta prevista (o pedida para cuando termine la que está en curso)
+            pending = job.rerun_at is not None if job.running else job.next_run is not None
+            if not pending:
+                self._first = now
+            due = min(now + timedelta(seconds=self.debounce), self._first + timedelta(seconds=self.max_delay))
+            self.scheduler.run_at(self.job_name, due)
+            self.received += 1
+            self.coalesced += int(pending)
+            return due, pending
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """POST WEBHOOK_PATH con aviso de archivo listo"""
+
+    server_version = "InventarioWebhook/1.0"
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.split('?', 1)[0] != WEBHOOK_PATH:
+            return self._reply(404, {'error': "Ruta no encontrada"})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._reply(400, {'error': "Content-Length no válido"})
+        if length > MAX_BODY_BYTES:
+            return self._reply(413, {'error': "Aviso demasiado grande"})
+        body = self.rfile.read(length)
+
+        webhook = self.server.webhook
+        if not is_authorized(webhook.secret, self.headers, body):
+            webhook.log("🚫 Aviso de webhook rechazado: autenticación no válida")
+            return self._reply(401, {'error': "No autorizado"})
+
+        lease = job_scheduler.lease
+        if lease is not None and not lease.is_leader:
+            # Solo el líder ingiere; el emisor debe reintentar (o apuntar al líder)
+            return self._reply(503, {'error': "Este nodo no es el líder", 'leader': lease.current_holder})
+
+        signature = self.headers.get('X-Webhook-Signature')
+        if signature and not self.headers.get('Authorization', '').startswith('Bearer '):
+            if not webhook.replays.first_use(self.headers.get('X-Webhook-Timestamp'), signature):
+                webhook.log("🚫 Aviso de webhook rechazado: firma ya utilizada")
+                return self._reply(401, {'error': "Aviso repetido"})
+
+        try:
+            due, coalesced = webhook.debouncer.notify()
+        except Exception as e:
+            return self._reply(503, {'error': str(e)})
+        webhook.log(f"🔔 Aviso de archivo listo{' (unido al pendiente)' if coalesced else ''}: "
+                    f"ingesta a las {due.strftime('%H:%M:%S')}")
+        return self._reply(202, {
+            'status': "coalesced" if coalesced else "queued",
+            'run_at': due.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+
+    def do_GET(self):
+        return self._reply(405, {'error': f"Use POST {WEBHOOK_PATH}"})
+
+    def log_message(self, format, *args):
+        pass  # Los avisos ya se registran en el log de la app
+
+
+class WebhookServer:
+    """Servidor del webhook en un hilo aparte; único por proceso"""
+
+    def __init__(self):
+        self.secret = None
+        self.debouncer = None
+        self.replays = ReplayGuard()
+        self.log = print
+        self.port = None
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, func, port=DEFAULT_PORT, secret=None, host="0.0.0.0", log=print, leader_only=True):
+        """Programar `func` bajo demanda y escuchar avisos; False si ya estaba en marcha o falta el secreto"""
+        if self.running:
+            return False
+        self.secret = secret or os.environ.get("WEBHOOK_SECRET")
+        self.log = log
+        if not self.secret:
+            log("ℹ️ Webhook deshabilitado. Para habilitarlo, configurar WEBHOOK_SECRET")
+            return False
+        job_scheduler.add_job(WEBHOOK_JOB, func, OnDemandTrigger(), leader_only=leader_only)
+        self.debouncer = Debouncer(job_scheduler, WEBHOOK_JOB)
+        self._httpd = ThreadingHTTPServer((host, port), WebhookHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.webhook = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="webhook_server", daemon=True)
+        self._thread.start()
+        log(f"✅ Webhook escuchando en el puerto {self.port} ({WEBHOOK_PATH})")
+        return True
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        self._thread = None
+
+
+def notify(url, secret, payload=None, timeout=10):
+    """Enviar un aviso firmado (cliente de prueba); devuelve (código HTTP, respuesta)"""
+    # Un nonce distinto en cada aviso: dos avisos en el mismo segundo no comparten firma
+    payload = dict(payload or {'file': "stock.csv"}, nonce=os.urandom(8).hex())
+    body = json.dumps(payload).encode('utf-8')
+    timestamp = str(int(time.time()))
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-Webhook-Timestamp': timestamp,
+        'X-Webhook-Signature': sign(secret, timestamp, body),
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+server = WebhookServer()
+
+
+def main():
+    """Función principal: enviar un aviso de prueba"""
+    if len(sys.argv) < 3 or sys.argv[1] != "notify":
+        print(f"Uso: WEBHOOK_SECRET=... python webhook.py notify http://127.0.0.1:{DEFAULT_PORT}{WEBHOOK_PATH}")
+        sys.exit(1)
+    secret = os.environ.get("WEBHOOK_SECRET")
+    if not secret:
+        print("❌ Falta WEBHOOK_SECRET")
+        sys.exit(1)
+    status, response = notify(sys.argv[2], secret)
+    print(f"{'✅' if status == 202 else '❌'} {status}: {response}")
+
+
+if __name__ == "__main__":
+    main()